@@ -0,0 +1,159 @@
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from transforms import MACRO_COLUMNS, TOTALS_COLUMNS, period_starts
+
+# Long-range views over the whole daily_totals history: per-day values with rolling means,
+# weekly and monthly averages, macro energy splits and adherence streaks. Everything is
+# computed with vectorized numpy over one row per day, and a new version of the totals
+# only recomputes from the first day that changed.
+
+ROLLING_WINDOWS = (7, 28)
+KCAL_PER_GRAM = {'protein': 4, 'fat': 9, 'carbs': 4}
+SPLIT_COLUMNS = [f'{macro}_pct' for macro in KCAL_PER_GRAM]
+PERIODS = ('weekly', 'monthly')
+
+# Where each KCAL_PER_GRAM macro sits in MACRO_COLUMNS
+_SPLIT_POSITIONS = [MACRO_COLUMNS.index(macro) for macro in KCAL_PER_GRAM]
+
+def _split_columns(values: np.ndarray) -> dict:
+    # SPLIT_COLUMNS for an (n, len(MACRO_COLUMNS)) array: each macro's share (%) of the
+    # 4/9/4 kcal estimate, with rows that have no macros all 0
+    kcal = values[:, _SPLIT_POSITIONS] * np.array(list(KCAL_PER_GRAM.values()), dtype='float64')
+    total = kcal.sum(axis=1, keepdims=True)
+    pct = np.divide(kcal * 100, total, out=np.zeros_like(kcal), where=total > 0)
+    return dict(zip(SPLIT_COLUMNS, pct.T))
+
+def daily_view(daily_totals: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per logged day (ordered by date): the macro totals, their rolling means over
+    the last 7 and 28 calendar days (averaging the days logged in each window) and the
+    macro split. Same values as rolling('7D').mean(), from cumulative sums.
+    """
+    days = daily_totals['date'].to_numpy().astype('datetime64[D]')
+    values = daily_totals[MACRO_COLUMNS].to_numpy('float64')
+    sums = np.vstack([np.zeros((1, len(MACRO_COLUMNS))), values.cumsum(axis=0)])
+    ends = np.arange(1, len(days) + 1)
+
+    view = {'date': daily_totals['date'].to_numpy(), **dict(zip(MACRO_COLUMNS, values.T))}
+    for window in ROLLING_WINDOWS:
+        # Each day's window starts at the first logged day within window - 1 days before it
+        starts = np.searchsorted(days, days - (window - 1), side='left')
+        means = (sums[ends] - sums[starts]) / (ends - starts)[:, None]
+        view.update({f'{col}_{window}d': means[:, i] for i, col in enumerate(MACRO_COLUMNS)})
+    view.update(_split_columns(values))
+    return pd.DataFrame(view)
+
+def period_summary(daily_totals: pd.DataFrame, period: str) -> pd.DataFrame:
+    # Average per logged day for each week or month, with how many days were logged.
+    # Rows are ordered by date, so each period is one contiguous block.
+    starts = period_starts(daily_totals['date'], period)
+    if len(starts) == 0:
+        return pd.DataFrame(columns=['start'] + MACRO_COLUMNS + ['days_logged'] + SPLIT_COLUMNS)
+    firsts = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    counts = np.diff(np.r_[firsts, len(starts)])
+    means = np.add.reduceat(daily_totals[MACRO_COLUMNS].to_numpy('float64'), firsts, axis=0) / counts[:, None]
+    return pd.DataFrame({'start': starts[firsts], **dict(zip(MACRO_COLUMNS, means.T)), 'days_logged': counts,
+                         **_split_columns(means)})
+
+def streaks(daily_totals: pd.DataFrame, calorie_goal: float = None, tolerance: float = 0.1,
+            today: date = None) -> dict:
+    """
+    Runs of consecutive days that adhere: something was logged and, given a calorie_goal,
+    calories were within tolerance of it. The current streak still counts if today isn't
+    logged yet. Returns current and longest lengths and the longest run's first/last day.
+    """
+    adheres = daily_totals['items'] > 0
+    if calorie_goal:
+        adheres &= (daily_totals['calories'] - calorie_goal).abs() <= tolerance * calorie_goal
+    days = daily_totals.loc[adheres, 'date'].sort_values().reset_index(drop=True)
+    if days.empty:
+        return {'current': 0, 'longest': 0, 'longest_start': None, 'longest_end': None}
+
+    # A new run starts wherever the gap to the previous adhering day isn't exactly one day
+    runs = days.groupby((days.diff() != pd.Timedelta(days=1)).cumsum()).agg(['first', 'last', 'size'])
+    longest = runs.loc[runs['size'].idxmax()]
+    latest = runs.iloc[-1]
+    today = today or date.today()
+    current = int(latest['size']) if latest['last'].date() >= today - timedelta(days=1) else 0
+    return {'current': current, 'longest': int(longest['size']),
+            'longest_start': longest['first'].date(), 'longest_end': longest['last'].date()}
+
+def _by_date(daily_totals: pd.DataFrame) -> pd.DataFrame:
+    # Totals from the database already come ordered by date
+    if daily_totals['date'].is_monotonic_increasing:
+        return daily_totals.reset_index(drop=True)
+    return daily_totals.sort_values('date', ignore_index=True)
+
+def _first_difference(old: pd.DataFrame, new: pd.DataFrame) -> int:
+    # Position of the first row that differs between two date-ordered totals frames
+    common = min(len(old), len(new))
+    differs = np.zeros(common, dtype=bool)
+    for col in TOTALS_COLUMNS:
+        differs |= old[col].to_numpy()[:common] != new[col].to_numpy()[:common]
+    positions = np.flatnonzero(differs)
+    return int(positions[0]) if len(positions) else common
+
+class HistoryAnalytics:
+    """
+    daily, weekly and monthly views of a daily totals frame (compact schema, any order).
+    update() returns the analytics for a newer version of the totals, reusing every row
+    that can't have changed: rolling means before the first changed day's windows, and
+    weeks and months before the first changed day's.
+    """
+
+    def __init__(self, daily_totals: pd.DataFrame, daily=None, weekly=None, monthly=None):
+        self.daily_totals = _by_date(daily_totals)
+        self.daily = daily if daily is not None else daily_view(self.daily_totals)
+        self.weekly = weekly if weekly is not None else period_summary(self.daily_totals, 'weekly')
+        self.monthly = monthly if monthly is not None else period_summary(self.daily_totals, 'monthly')
+
+    def update(self, daily_totals: pd.DataFrame) -> "HistoryAnalytics":
+        daily_totals = _by_date(daily_totals)
+        first = _first_difference(self.daily_totals, daily_totals)
+        if first == len(daily_totals) == len(self.daily_totals):
+            return self
+        if first == 0:
+            return HistoryAnalytics(daily_totals)
+
+        # The earliest day that was added, changed or removed
+        candidates = [frame['date'].iloc[first] for frame in (daily_totals, self.daily_totals) if first < len(frame)]
+        changed = min(candidates)
+
+        # Rolling windows reaching back from changed need the days before it as input
+        window_start = changed - pd.Timedelta(days=max(ROLLING_WINDOWS) - 1)
+        recent = daily_view(daily_totals[daily_totals['date'] >= window_start])
+        daily = pd.concat([self.daily[self.daily['date'] < changed], recent[recent['date'] >= changed]],
+                          ignore_index=True)
+
+        periods = {}
+        for period, previous in (('weekly', self.weekly), ('monthly', self.monthly)):
+            period_start = pd.Timestamp(period_starts([changed], period)[0])
+            redone = period_summary(daily_totals[daily_totals['date'] >= period_start], period)
+            periods[period] = pd.concat([previous[previous['start'] < period_start], redone], ignore_index=True)
+        return HistoryAnalytics(daily_totals, daily, periods['weekly'], periods['monthly'])
+
+    def streaks(self, calorie_goal: float = None, tolerance: float = 0.1) -> dict:
+        return streaks(self.daily_totals, calorie_goal, tolerance)
+
+# Each user's most recently computed analytics, which their next data version is built from
+_latest = {}
+_latest_lock = threading.Lock()
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def history_analytics(user_id: str, version: str, _daily_totals: pd.DataFrame) -> HistoryAnalytics:
+    """
+    Analytics for a user's daily totals whose data_version() is `version`. A version not
+    seen before is derived incrementally from the last one computed for that user. Shared
+    between reruns and sessions, so callers must not modify the frames.
+    """
+    with _latest_lock:
+        previous = _latest.get(user_id)
+    result = previous.update(_daily_totals) if previous is not None else HistoryAnalytics(_daily_totals)
+    with _latest_lock:
+        _latest[user_id] = result
+    return result
@@ -1,42 +1,111 @@
+import time
+import uuid
+from functools import partial
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import pandas as pd
 from datetime import date
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 
 import database as db
+import perf
 from parser import parse_gemini_table
+from snapshot import SNAPSHOT_DAYS, LogSnapshot
+from writes import get_write_queue
+from food_index import get_food_index
+from export import EXPORT_FORMATS, export_logs
+from analytics import history_analytics
+from charts import TREND_GRANULARITIES, dashboard_figure, data_version, trend_figure
+from transforms import (HISTORY_SELECT_COLUMN, MACRO_COLUMNS, RECIPE_INDEX_COLUMNS, calculate_totals, history_days, ingredients_frame,
+                        week_ranges)
 
 # --- Initialization ---
 st.set_page_config(page_title="Macro Tracker", page_icon="🍏", layout="wide")
+script_start = time.perf_counter()
 db.init_db()
 
-# --- Utility ---
-def calculate_totals(df):
-    if df.empty:
-        return {'calories': 0, 'protein': 0, 'fat': 0, 'carbs': 0, 'fiber': 0}
-    return df[['calories', 'protein', 'fat', 'carbs', 'fiber']].sum().to_dict()
+# With [auth] configured in secrets.toml everyone signs in and sees only their own data;
+# without it the whole deployment is one [storage] user_id
+if db.get_setting("auth", "redirect_uri") and not st.user.is_logged_in:
+    st.title("🍏 Macro Tracker")
+    st.button("Log in", on_click=st.login)
+    st.stop()
+user_id = db.current_user()
+
+# Saves and deletes are committed in the background; reads show them as soon as they're queued
+write_queue = get_write_queue()
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
+session_id = st.session_state["session_id"]
+
+# The reads a full rerun renders don't depend on each other, so fetch them side by side up
+# front; the snapshot and the tabs below then find them in the cache
+prefetch = [
+    partial(db.get_recent_logs, SNAPSHOT_DAYS),
+    partial(db.get_daily_totals, SNAPSHOT_DAYS),
+    db.get_all_daily_totals,
+    partial(db.get_all_recipes, RECIPE_INDEX_COLUMNS),
+    *[partial(db.get_logs_between, start, end)
+      for start, end in week_ranges(date.today(), st.session_state.get("history_weeks", 1))],
+]
+log_date = st.session_state.get("log_date")
+if log_date is not None and log_date.strftime('%Y-%m-%d') < db.recent_cutoff(SNAPSHOT_DAYS):
+    prefetch.append(partial(db.get_logs_by_date, log_date))
+with perf.timed("app.prefetch"):
+    try:
+        db.fetch_concurrently(*prefetch)
+    except db.BackendUnavailable:
+        st.error("The database isn't responding and there's nothing cached to show yet. Try again in a minute.")
+        st.stop()
+if not db.backend_available():
+    st.warning("The database isn't responding, so you're seeing recently cached data. Saving may fail until it's back.")
+
+# One query for the recent window, shared by the Daily Log and Dashboard tabs
+with perf.timed("app.snapshot_load"):
+    snapshot = LogSnapshot.load(SNAPSHOT_DAYS, pending=write_queue)
 
 # --- UI Setup ---
 st.title("🍏 Macro Tracker")
 
+# Background writes that gave up after retrying
+for message in write_queue.failures(session_id):
+    st.error(message)
+
+def watch_writes():
+    # Once this session's writes have landed (or failed), rerun to show the committed state
+    if not write_queue.pending(session_id):
+        st.rerun()
+
+if write_queue.pending(session_id):
+    st.fragment(watch_writes, run_every=1)()
+
 tab_log, tab_dash, tab_history, tab_recipes = st.tabs(["📝 Daily Log", "📊 Dashboard", "📜 History", "🍳 Recipes"])
 
+# Each tab runs as a fragment, so interacting with one reruns only that tab (and its queries).
+# Writes that change what another tab shows call st.rerun() to rerun the whole app; changes
+# local to a tab use rerun_tab().
+def rerun_tab():
+    # Rerun just the calling tab, or everything if this run wasn't a fragment rerun
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
 # ==========================================
 # TAB 1: DAILY LOG
 # ==========================================
-with tab_log:
+@st.fragment
+@perf.instrumented("tab.daily_log")
+def daily_log_tab(snapshot: LogSnapshot):
     st.header("Log Food")
     
     col_date, col_totals = st.columns([1, 2])
     with col_date:
-        selected_date = st.date_input("🗓️ Viewing & Adding to Date:", date.today())
+        selected_date = st.date_input("🗓️ Viewing & Adding to Date:", date.today(), key="log_date")
         st.caption(f"**{selected_date.strftime('%A')}**")
         
     # Load today's data early to show totals
-    todays_logs = db.get_logs_by_date(selected_date)
-    totals = calculate_totals(todays_logs)
+    todays_logs = snapshot.logs_by_date(selected_date)
+    totals = snapshot.totals_for(selected_date)
     
     with col_totals:
         st.subheader(f"Totals for {selected_date.strftime('%b %d')}")
@@ -48,7 +117,23 @@ with tab_log:
         mcol5.metric("Fiber (g)", f"{totals['fiber']:.1f}")
 
     st.divider()
-    
+
+    # Quick add: search everything logged before and re-log it with its latest macros
+    st.subheader("Quick Add")
+    query = st.text_input("Search past foods:", key="quick_add_query", placeholder="e.g. greek yog")
+    if query:
+        matches = get_food_index(user_id).search(query)
+        if not matches:
+            st.caption("No past foods match that.")
+        for i, match in enumerate(matches):
+            if st.button(f"➕ {match['food_name']} ({match['calories']:.0f} kcal)", key=f"quick_add_{i}"):
+                row = pd.DataFrame([match])[['food_name'] + MACRO_COLUMNS]
+                write_queue.save_logs(row, selected_date, session_id)
+                st.toast(f"Added {match['food_name']} to {selected_date.strftime('%b %d')}")
+                st.rerun()
+
+    st.divider()
+
     # Input Area
     st.subheader("Paste Gemini Output")
     
@@ -76,7 +161,7 @@ Greek Yogurt (40g) 38 1.6 3.6 1.5 0.0""")
         st.info(f"Will save to: **{selected_date.strftime('%A, %Y-%m-%d')}**. Change the date above if you meant a different day.")
         st.dataframe(st.session_state['parsed_df'], use_container_width=True)
         if st.button("💾 Save to Log"):
-            db.save_logs(st.session_state['parsed_df'], selected_date)
+            write_queue.save_logs(st.session_state['parsed_df'], selected_date, session_id)
             del st.session_state['parsed_df']
             
             # Increment key to clear text box
@@ -84,6 +169,16 @@ Greek Yogurt (40g) 38 1.6 3.6 1.5 0.0""")
             
             st.success("Saved! Refreshing...")
             st.rerun()
+
+    # Tables too long to paste (e.g. another tracker's export) stream into the log a batch at a time
+    table_file = st.file_uploader("Or upload the table as a text file:", type=['txt', 'tsv'])
+    if table_file is not None and st.button("📥 Import Table"):
+        with st.status("Importing...") as status:
+            result = db.import_gemini_table(table_file, selected_date, on_batch=lambda imported: status.update(
+                label=f"Imported {imported:,} items..."))
+            status.update(label="Import complete", state="complete")
+        st.toast(f"Imported {result['imported']:,} items into {selected_date.strftime('%A, %Y-%m-%d')}.")
+        st.rerun()
             
     st.divider()
     st.subheader(f"Logged Items for {selected_date.strftime('%A, %Y-%m-%d')}")
@@ -114,220 +209,163 @@ Greek Yogurt (40g) 38 1.6 3.6 1.5 0.0""")
             if not selected_items.empty:
                 if st.button("➕ Create Recipe from Selected", type="primary"):
                     st.session_state["recipe_builder_items"] = selected_items.to_dict('records')
-                    st.success("Items ready! Go to the 'Recipes' tab to name and save your dish.")
+                    # The builder lives in the Recipes tab, so rerun the whole app
+                    st.toast("Items ready! Go to the 'Recipes' tab to name and save your dish.")
+                    st.rerun()
                     
         # Action: Delete
         items_to_delete = edited_df[edited_df["🗑️ Delete"] == True]["id"].tolist()
         with col_act2:
             if items_to_delete:
                 if st.button("🗑️ Delete Selected Items"):
-                    db.delete_logs(items_to_delete)
+                    write_queue.delete_logs(todays_logs[todays_logs['id'].isin(items_to_delete)], session_id)
                     st.success("Logs deleted! Refreshing...")
                     st.rerun()
     else:
         st.info("No items logged for this date yet.")
 
+with tab_log:
+    daily_log_tab(snapshot)
 
 # ==========================================
 # TAB 2: DASHBOARD
 # ==========================================
-with tab_dash:
+@st.fragment
+@perf.instrumented("tab.dashboard")
+def dashboard_tab(snapshot: LogSnapshot):
     st.header("Trends")
     
     col_dash1, col_dash2 = st.columns([1, 2])
     with col_dash1:
         view_days = st.radio("Default Zoom Range:", [7, 28], index=0, horizontal=True)
         
-    # Load 90 days to allow scrolling inside the zoom window
-    recent_logs = db.get_recent_logs(90)
+    # Load 90 days to allow scrolling inside the zoom window, already summed per day by the database
+    daily_summary = snapshot.daily_totals()
     
-    if recent_logs.empty:
+    if daily_summary.empty:
         st.info("No data available to display yet.")
     else:
-        # Group by date
-        daily_summary = recent_logs.groupby('date')[['calories', 'protein', 'fat', 'carbs', 'fiber']].sum().reset_index()
         
         st.subheader("Daily Intake Trends")
         
-        # Calculate proportional heights of macros to match total calories
-        est_k = daily_summary['protein']*4 + daily_summary['fat']*9 + daily_summary['carbs']*4
-        # Avoid division by zero
-        est_k = est_k.replace(0, 1)
-
-        p_cal = daily_summary['calories'] * (daily_summary['protein']*4 / est_k)
-        f_cal = daily_summary['calories'] * (daily_summary['fat']*9 / est_k)
-        c_cal = daily_summary['calories'] * (daily_summary['carbs']*4 / est_k)
-        
-        # Ensure zero handling
-        p_cal = p_cal.fillna(0)
-        f_cal = f_cal.fillna(0)
-        c_cal = c_cal.fillna(0)
-        
-        # Create figure with 2 subplots separated by the X axis
-        fig = make_subplots(
-            rows=2, cols=1, 
-            shared_xaxes=True, 
-            vertical_spacing=0.0,
-            row_heights=[0.8, 0.2]
-        )
+        with perf.timed("chart.dashboard_figure"):
+            fig = dashboard_figure(data_version(daily_summary), view_days, daily_summary)
 
-        # 1. Protein (Stacked Area - Gold) #F1A512
-        fig.add_trace(
-            go.Scatter(x=daily_summary['date'], y=p_cal, 
-                       name="Protein", mode='lines', stackgroup='one', line_shape='spline',
-                       fillcolor='rgba(241, 165, 18, 0.8)', line=dict(color='#F1A512', width=2),
-                       customdata=daily_summary['protein'],
-                       hovertemplate='Protein: %{customdata:.1f}g (~%{y:.0f} kcal)<extra></extra>'),
-            row=1, col=1
-        )
-        
-        # 2. Carbs (Stacked Area - Red/Orange) #DD4111
-        fig.add_trace(
-            go.Scatter(x=daily_summary['date'], y=c_cal, 
-                       name="Carbs", mode='lines', stackgroup='one', line_shape='spline',
-                       fillcolor='rgba(221, 65, 17, 0.8)', line=dict(color='#DD4111', width=2),
-                       customdata=daily_summary['carbs'],
-                       hovertemplate='Carbs: %{customdata:.1f}g (~%{y:.0f} kcal)<extra></extra>'),
-            row=1, col=1
-        )
-        
-        # 3. Fat (Stacked Area - Maroon) #8C0027
-        fig.add_trace(
-            go.Scatter(x=daily_summary['date'], y=f_cal, 
-                       name="Fat", mode='lines', stackgroup='one', line_shape='spline',
-                       fillcolor='rgba(140, 0, 39, 0.8)', line=dict(color='#8C0027', width=2),
-                       customdata=daily_summary['fat'],
-                       hovertemplate='Fat: %{customdata:.1f}g (~%{y:.0f} kcal)<extra></extra>'),
-            row=1, col=1
-        )
+        with perf.timed("chart.plotly_chart"):
+            st.plotly_chart(fig, use_container_width=True)
 
-        # 4. Fiber - smoothed filled area chart descending (Teal) #2BAF90
-        fig.add_trace(
-            go.Scatter(x=daily_summary['date'], y=daily_summary['fiber'], 
-                       name="Fiber", mode='lines', fill='tozeroy', line_shape='spline',
-                       fillcolor='rgba(43, 175, 144, 0.4)', line=dict(color='#2BAF90', width=2),
-                       customdata=daily_summary['fiber'],
-                       hovertemplate='Fiber: %{customdata:.1f}g<extra></extra>'),
-            row=2, col=1
-        )
+        # The whole history, one row per day; analytics only recompute from the first changed day
+        st.subheader("Long-Range Trends")
+        granularity = st.radio("Granularity:", TREND_GRANULARITIES, index=1, horizontal=True)
+        all_totals = write_queue.overlay_daily_totals(db.get_all_daily_totals())
+        version = data_version(all_totals)
+        with perf.timed("analytics.history"):
+            history = history_analytics(user_id, version, all_totals)
 
-        # Configure layout (Shrunk height, Legend at bottom)
-        fig.update_layout(
-            height=400,
-            hovermode='x unified',
-            legend=dict(orientation="h", yanchor="top", y=-0.15, xanchor="center", x=0.5),
-            margin=dict(t=20, b=50) # Tighter top margin, room for legend at bottom
-        )
-        
-        # Add vertical dashed lines for Mondays
-        daily_dt = pd.to_datetime(daily_summary['date'])
-        mondays = daily_dt[daily_dt.dt.dayofweek == 0]
-        for m in mondays:
-            fig.add_vline(x=m.strftime('%Y-%m-%d'), line_dash="dash", line_color="#A1D4B1", opacity=0.8, layer="below")
-        
-        # Calculate viewport for zoom
-        latest_date = pd.to_datetime(daily_summary['date'].max())
-        start_date = latest_date - pd.Timedelta(days=view_days - 1)
-        
-        # Apply zoom to the shared x-axes
-        fig.update_xaxes(range=[start_date.strftime('%Y-%m-%d'), latest_date.strftime('%Y-%m-%d')])
-        
-        # X-axes line styling
-        fig.update_xaxes(showline=True, linewidth=1, linecolor='gray', showticklabels=False, row=1, col=1)
-        fig.update_xaxes(showline=False, showticklabels=True, row=2, col=1)
-        
-        # Y-axes setup
-        fig.update_yaxes(title_text="KCal", rangemode="tozero", row=1, col=1)
-        # Reverse the fiber axis so it hangs down from the shared X line
-        fig.update_yaxes(title_text="Fiber (g)", autorange="reversed", row=2, col=1)
+        streak = history.streaks(db.get_setting("goals", "calories"))
+        col_s1, col_s2, col_s3 = st.columns(3)
+        col_s1.metric("Current Streak", f"{streak['current']} days")
+        col_s2.metric("Longest Streak", f"{streak['longest']} days")
+        if streak['longest_start'] is not None:
+            col_s3.metric("Longest Run", f"{streak['longest_start']:%b %d, %Y} – {streak['longest_end']:%b %d, %Y}")
 
-        st.plotly_chart(fig, use_container_width=True)
+        with perf.timed("chart.trend_figure"):
+            trend = trend_figure(version, granularity, view_days, history)
+        st.plotly_chart(trend, use_container_width=True)
         
         # Data Export
         st.divider()
         st.subheader("Export Everything")
-        all_data = db.load_all_logs()
-        csv = all_data.to_csv(index=False).encode('utf-8')
+        export_fmt = st.radio("Export Format:", list(EXPORT_FORMATS), index=0, horizontal=True)
+        file_name, mime = EXPORT_FORMATS[export_fmt]
+        # Passing a callable defers the paginated export until the button is clicked
         st.download_button(
-            label="Download Complete Log as CSV",
-            data=csv,
-            file_name='macro_logs.csv',
-            mime='text/csv',
+            label=f"Download Complete Log as {export_fmt}",
+            data=lambda: export_logs(export_fmt, user_id=user_id),
+            file_name=file_name,
+            mime=mime,
         )
 
+    # Data Import: exports from here, or any CSV/JSON Lines/Parquet with the same columns
+    st.divider()
+    st.subheader("Import History")
+    upload = st.file_uploader("Log file (date, food_name, calories, protein, fat, carbs, fiber):",
+                              type=['csv', 'jsonl', 'ndjson', 'json', 'parquet'])
+    if upload is not None and st.button("📥 Import Rows"):
+        try:
+            with st.status("Importing...") as status:
+                result = db.import_logs(upload, on_batch=lambda imported, rejected: status.update(
+                    label=f"Imported {imported:,} rows ({rejected:,} skipped)..."))
+                status.update(label="Import complete", state="complete")
+        except ValueError as e:
+            st.error(f"Couldn't import {upload.name}: {e}")
+        else:
+            st.toast(f"Imported {result['imported']:,} rows, skipped {result['rejected']:,} invalid ones.")
+            st.rerun()
+
+with tab_dash:
+    dashboard_tab(snapshot)
+
 # ==========================================
 # TAB 3: HISTORY
 # ==========================================
-with tab_history:
+@st.fragment
+@perf.instrumented("tab.history")
+def history_tab():
     st.header("📜 Log History")
     
-    # Load recent logs
-    history_logs = db.get_recent_logs(90) # Load up to 90 days for history
+    # One week at a time, most recent first. Older weeks are only queried and rendered on request.
+    if "history_weeks" not in st.session_state:
+        st.session_state["history_weeks"] = 1
 
-    if history_logs.empty:
-        st.info("No history available to display yet.")
-    else:
-        # Sort history to be most recent first
-        history_logs = history_logs.sort_values(by='date', ascending=False)
-        
-        # Colors for daily backgrounds: #A1D4B1, #F1A512, #DD4111, #8C0027
-        # Converted to rgba for Streamlit background styling (transparency 0.2)
-        row_colors = [
-            'rgba(161, 212, 177, 0.2)',
-            'rgba(241, 165, 18, 0.2)',
-            'rgba(221, 65, 17, 0.2)',
-            'rgba(140, 0, 39, 0.2)'
-        ]
-        
-        # Group by date to keep days together
-        grouped = history_logs.groupby('date', sort=False)
-        
-        # Counter to cycle colors
-        color_idx = 0
-        
-        for log_date, group_df in grouped:
+    # Styling function for the backgrounds: one call per day, returning the CSS for every cell
+    def style_bg(df, color):
+        return pd.DataFrame(f'background-color: {color}', index=df.index, columns=df.columns)
+
+    # Day totals come from the daily_totals rollup, as on the Dashboard: the snapshot's cached
+    # window until History reaches further back, with writes still in the queue applied
+    totals_days = max(SNAPSHOT_DAYS, 7 * st.session_state["history_weeks"])
+    history_totals = write_queue.overlay_daily_totals(db.get_daily_totals(totals_days),
+                                                      date.fromisoformat(db.recent_cutoff(totals_days)))
+    history_totals = history_totals.set_index('date')[MACRO_COLUMNS]
+
+    # Keep the color cycle going across week boundaries
+    days_shown = 0
+
+    for week_start, week_end in week_ranges(date.today(), st.session_state["history_weeks"]):
+        st.markdown(f"#### {week_start.strftime('%b %d')} – {week_end.strftime('%b %d, %Y')}")
+        week_logs = write_queue.overlay_logs(db.get_logs_between(week_start, week_end), week_start, week_end)
+
+        if week_logs.empty:
+            st.caption("Nothing logged this week.")
+            continue
+
+        # Days come most recent first, each formatted for display with its own background color
+        for log_timestamp, display_df, row_color in history_days(week_logs, first_color=days_shown):
+            days_shown += 1
+            log_date = log_timestamp.date()
             st.subheader(f"{log_date}")
             
-            # Calculate and display daily totals
-            day_totals = calculate_totals(group_df)
+            # Display the day's totals
+            if log_timestamp in history_totals.index:
+                day_totals = history_totals.loc[log_timestamp]
+            else:
+                day_totals = dict.fromkeys(MACRO_COLUMNS, 0)
             st.caption(f"**Total:** {day_totals['calories']:.0f} kcal 🫘 {day_totals['protein']:.1f}g P 🧈 {day_totals['fat']:.1f}g F 🍞 {day_totals['carbs']:.1f}g C 🥦 {day_totals['fiber']:.1f}g Fiber")
-            
-            # Prepare dataframe for display
-            display_df = group_df.copy()
-            
-            # Format numbers before displaying
-            display_df['calories'] = display_df['calories'].round().astype(int)
-            display_df['protein'] = display_df['protein'].round(1)
-            display_df['fat'] = display_df['fat'].round(1)
-            display_df['carbs'] = display_df['carbs'].round(1)
-            display_df['fiber'] = display_df['fiber'].round(1)
-            
-            # Move the Select to far right, don't include Delete
-            display_df.insert(len(display_df.columns), "✅ Select for Recipe", False)
-            
-            # Styling function for the backgrounds
-            def style_bg(row, c_idx):
-                return [f'background-color: {row_colors[c_idx]}'] * len(row)
 
-            # Style background and numbers
-            styled_df = display_df.style.apply(style_bg, c_idx=color_idx, axis=1)
-            
-            # Provide format strings to explicitly show 1 decimal place even for .0
-            styled_df = styled_df.format({
-                'protein': "{:.1f}",
-                'fat': "{:.1f}",
-                'carbs': "{:.1f}",
-                'fiber': "{:.1f}"
-            })
+            # Style background
+            styled_df = display_df.style.apply(style_bg, color=row_color, axis=None)
             
             # Show editable dataframe so we can catch selections
             edited_history = st.data_editor(
                 styled_df,
                 hide_index=True,
                 column_config={
-                    "✅ Select for Recipe": st.column_config.CheckboxColumn(required=True),
+                    HISTORY_SELECT_COLUMN: st.column_config.CheckboxColumn(required=True),
                     "id": None, # Hide ID
                     "date": None, # Date is in subheader
+                    # Explicitly show 1 decimal place even for .0
+                    **{col: st.column_config.NumberColumn(format="%.1f") for col in ['protein', 'fat', 'carbs', 'fiber']},
                 },
                 disabled=["food_name", "calories", "protein", "fat", "carbs", "fiber"],
                 use_container_width=True,
@@ -335,25 +373,88 @@ with tab_history:
             )
             
             # Check for selections to send to recipe builder
-            selected_items = edited_history[edited_history["✅ Select for Recipe"] == True]
+            selected_items = edited_history[edited_history[HISTORY_SELECT_COLUMN] == True]
             if not selected_items.empty:
                 if st.button(f"➕ Create Recipe from {log_date} Selections", type="primary", key=f"hist_btn_{log_date}"):
                     current = st.session_state.get("recipe_builder_items", [])
-                    st.session_state["recipe_builder_items"] = current + selected_items.drop(columns=["✅ Select for Recipe"]).to_dict('records')
-                    st.success("Items ready! Go to the 'Recipes' tab to name and save your dish.")
+                    st.session_state["recipe_builder_items"] = current + selected_items.drop(columns=[HISTORY_SELECT_COLUMN]).to_dict('records')
+                    st.toast("Items ready! Go to the 'Recipes' tab to name and save your dish.")
+                    st.rerun()
             
-            # Increment color index
-            color_idx = (color_idx + 1) % len(row_colors)
             st.write("") # Spacer
 
+    if st.button("⬇️ Load older"):
+        st.session_state["history_weeks"] += 1
+        rerun_tab()
+
+with tab_history:
+    history_tab()
+
 # ==========================================
 # TAB 4: RECIPES
 # ==========================================
-with tab_recipes:
+# Each saved recipe's editor is its own fragment: tuning one recipe reruns only that card
+@st.fragment
+@perf.instrumented("tab.recipes.card")
+def recipe_card(row: dict):
+    st.write(f"**Base Macros:** {row['protein']:.1f}g P | {row['fat']:.1f}g F | {row['carbs']:.1f}g C")
+
+    # Fetch the ingredients now the card is open, and convert the JSON string back to a DataFrame for display
+    recipe = write_queue.overlay_recipes(db.get_recipe(row['name'], ['name', 'ingredients_json']), row['name'])
+    if not recipe.empty:
+        ing_df = ingredients_frame(row['name'], recipe['ingredients_json'].iloc[0])
+
+        # Make the dataframe editable so users can tweak individual amounts
+        st.write("Tune ingredients for this specific meal:")
+        edited_ing_df = st.data_editor(ing_df, key=f"editor_{row['name']}", use_container_width=True)
+
+        # Calculate the new base totals from the edited dataframe
+        new_base_totals = calculate_totals(edited_ing_df)
+
+        # Add a global portion multiplier
+        portion = st.number_input(
+            f"Portion Multiplier for '{row['name']}'", 
+            min_value=0.1, 
+            value=1.0, 
+            step=0.1, 
+            key=f"portion_{row['name']}"
+        )
+
+        # Display what the final logged amounts will be
+        final_cal = new_base_totals['calories'] * portion
+        st.caption(f"**Logging:** {final_cal:.0f} cal | " 
+                   f"{new_base_totals['protein'] * portion:.1f}g P | "
+                   f"{new_base_totals['fat'] * portion:.1f}g F | "
+                   f"{new_base_totals['carbs'] * portion:.1f}g C")
+
+        # Button to log this recipe TODAY
+        if st.button(f"Log '{row['name']}' Today", key=f"log_{row['name']}"):
+            # Construct a single row df for the recipe, applying the multiplier
+            recipe_name = f"Recipe: {row['name']}"
+            if portion != 1.0:
+                recipe_name += f" ({portion}x portion)"
+
+            recipe_log = pd.DataFrame([{
+                'food_name': recipe_name,
+                'calories': final_cal,
+                'protein': new_base_totals['protein'] * portion,
+                'fat': new_base_totals['fat'] * portion,
+                'carbs': new_base_totals['carbs'] * portion,
+                'fiber': new_base_totals['fiber'] * portion
+            }])
+            write_queue.save_logs(recipe_log, date.today(), session_id)
+            # Today's log, totals and trends are in the other tabs, so rerun the whole app
+            st.toast(f"Logged '{recipe_name}' to today's log!")
+            st.rerun()
+
+@st.fragment
+@perf.instrumented("tab.recipes")
+def recipes_tab():
     st.header("Batch Cooking & Recipes")
     st.write("Save combinations of ingredients as a single item for easy logging later.")
     
-    all_recipes = db.get_all_recipes()
+    # Just names and totals; ingredients are loaded per recipe when its card is opened
+    all_recipes = write_queue.overlay_recipes(db.get_all_recipes(RECIPE_INDEX_COLUMNS))
     
     col_add, col_view = st.columns([1, 1])
     
@@ -376,7 +477,7 @@ with tab_recipes:
                         
                         # Increment key to clear text area
                         st.session_state["recipe_import_key"] += 1
-                        st.rerun()
+                        rerun_tab()
 
         # 2. Manage current builder items
         st.write("### Current Ingredients")
@@ -406,68 +507,47 @@ with tab_recipes:
             with col_s1:
                 if st.button("💾 Save Dish", type="primary"):
                     if recipe_name and not edited_recipe_df.empty:
-                        db.save_recipe(recipe_name, edited_recipe_df)
+                        write_queue.save_recipe(recipe_name, edited_recipe_df, session_id)
                         st.session_state["recipe_builder_items"] = [] # Clear builder
                         st.session_state["recipe_name_key"] += 1 # Clear name input
-                        st.success(f"Saved dish '{recipe_name}'!")
-                        st.rerun()
+                        st.toast(f"Saved dish '{recipe_name}'!")
+                        rerun_tab()
                     else:
                         st.warning("Please provide a name and ensure there are ingredients.")
             with col_s2:
                 if st.button("Clear Ingredients"):
                     st.session_state["recipe_builder_items"] = []
-                    st.rerun()
+                    rerun_tab()
 
     with col_view:
         st.subheader("Saved Recipes")
         if all_recipes.empty:
             st.info("No recipes saved yet.")
         else:
-            for _, row in all_recipes.iterrows():
-                with st.expander(f"📦 {row['name']} ({row['calories']:.0f} cal)"):
-                    st.write(f"**Base Macros:** {row['protein']:.1f}g P | {row['fat']:.1f}g F | {row['carbs']:.1f}g C")
-                    
-                    # Convert the JSON string back to DataFrame for display
-                    if 'ingredients_json' in row:
-                        ing_df = pd.read_json(row['ingredients_json'], orient='records')
-                        
-                        # Make the dataframe editable so users can tweak individual amounts
-                        st.write("Tune ingredients for this specific meal:")
-                        edited_ing_df = st.data_editor(ing_df, key=f"editor_{row['name']}", use_container_width=True)
-                        
-                        # Calculate the new base totals from the edited dataframe
-                        new_base_totals = calculate_totals(edited_ing_df)
-                        
-                        # Add a global portion multiplier
-                        portion = st.number_input(
-                            f"Portion Multiplier for '{row['name']}'", 
-                            min_value=0.1, 
-                            value=1.0, 
-                            step=0.1, 
-                            key=f"portion_{row['name']}"
-                        )
-                        
-                        # Display what the final logged amounts will be
-                        final_cal = new_base_totals['calories'] * portion
-                        st.caption(f"**Logging:** {final_cal:.0f} cal | " 
-                                   f"{new_base_totals['protein'] * portion:.1f}g P | "
-                                   f"{new_base_totals['fat'] * portion:.1f}g F | "
-                                   f"{new_base_totals['carbs'] * portion:.1f}g C")
-                        
-                        # Button to log this recipe TODAY
-                        if st.button(f"Log '{row['name']}' Today", key=f"log_{row['name']}"):
-                            # Construct a single row df for the recipe, applying the multiplier
-                            recipe_name = f"Recipe: {row['name']}"
-                            if portion != 1.0:
-                                recipe_name += f" ({portion}x portion)"
-                                
-                            recipe_log = pd.DataFrame([{
-                                'food_name': recipe_name,
-                                'calories': final_cal,
-                                'protein': new_base_totals['protein'] * portion,
-                                'fat': new_base_totals['fat'] * portion,
-                                'carbs': new_base_totals['carbs'] * portion,
-                                'fiber': new_base_totals['fiber'] * portion
-                            }])
-                            db.save_logs(recipe_log, date.today())
-                            st.success(f"Logged '{recipe_name}' to today's log!")
+            for row in all_recipes.to_dict('records'):
+                # on_change="rerun" tracks whether the expander is open, so closed cards run nothing
+                card = st.expander(f"📦 {row['name']} ({row['calories']:.0f} cal)", key=f"recipe_{row['name']}", on_change="rerun")
+                if card.open:
+                    with card:
+                        recipe_card(row)
+
+with tab_recipes:
+    recipes_tab()
+
+# --- Performance debug panel ---
+# Off unless [debug] perf_panel = true in secrets.toml or the URL has ?perf=1
+perf.record("app.script_run", time.perf_counter() - script_start)
+if db.get_setting("debug", "perf_panel", False) or st.query_params.get("perf") == "1":
+    with st.sidebar:
+        st.header("⏱️ Performance")
+        st.caption(f"p50/p95 over the last {perf.WINDOW} calls of each operation, across all sessions.")
+        st.dataframe(perf.summary(), hide_index=True, column_config={
+            col: st.column_config.NumberColumn(format="%.1f") for col in ['p50_ms', 'p95_ms', 'max_ms', 'avg_rows', 'avg_bytes']
+        })
+        st.download_button("Download as JSON", data=perf.dump_json(), file_name="perf.json", mime="application/json")
+        col_log, col_reset = st.columns(2)
+        if col_log.button("Write to log"):
+            perf.log_summary()
+        if col_reset.button("Reset"):
+            perf.reset()
+            st.rerun()
@@ -0,0 +1,200 @@
+"""
+Performance benchmarks for the parser, the Dashboard/History data prep and the SQLite backend.
+
+    python benchmark.py              # time every case and compare against the stored baselines
+    python benchmark.py --save       # record the current timings as the new baselines
+    python benchmark.py --sizes 1000 10000 --repeat 5
+
+Exits non-zero if any case is slower than its baseline by more than --tolerance, or slower
+than its absolute target in TARGETS.
+Baselines are machine specific, so re-record them with --save when moving to new hardware.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from analytics import HistoryAnalytics
+from charts import build_dashboard_figure
+from food_index import FoodIndex
+from parser import iter_gemini_batches, parse_gemini_table
+from storage import DEFAULT_USER, SQLiteBackend
+from transforms import MACRO_COLUMNS, TOTALS_COLUMNS, TOTALS_DTYPES, apply_schema, calculate_totals, food_stats, history_days, kcal_split, sum_by_date
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines.json")
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+FOOD_NAMES = [
+    "Fruit & Spinach Smoothie", "Greek Yogurt (40g)", "Pork & Shrimp Dumplings (4)",
+    "Tesco Finest Pork Sausage", "2x Coffees w/ Milk", 'Half of "Big Salad"',
+    "2x Eggs (Spray Oil)", "Kimchi (50g)", "Peanut Butter (1 tbsp)", "Guinness 0.0 (440ml)",
+]
+
+# --- Synthetic data ---
+def make_logs(n_rows: int, rows_per_day: int = 8, seed: int = 0) -> pd.DataFrame:
+    """A logs table shaped like the Supabase one: n_rows items spread over consecutive days up to today."""
+    rng = np.random.default_rng(seed)
+    n_days = max(1, n_rows // rows_per_day)
+    day_offsets = np.sort(rng.integers(0, n_days, n_rows))[::-1]
+    dates = pd.to_datetime(date.today()) - pd.to_timedelta(day_offsets, unit='D')
+    return pd.DataFrame({
+        'id': np.arange(1, n_rows + 1),
+        'date': dates.strftime('%Y-%m-%d'),
+        'food_name': rng.choice(FOOD_NAMES, n_rows),
+        'calories': rng.uniform(0, 900, n_rows).round(),
+        'protein': rng.uniform(0, 60, n_rows).round(1),
+        'fat': rng.uniform(0, 40, n_rows).round(1),
+        'carbs': rng.uniform(0, 120, n_rows).round(1),
+        'fiber': rng.uniform(0, 15, n_rows).round(1),
+    })
+
+def make_paste(n_rows: int, seed: int = 0) -> str:
+    """A Gemini-style pasted table with a header, n_rows food lines and a total line."""
+    logs = make_logs(n_rows, seed=seed)
+    body = (logs['food_name'] + ' ' + logs['calories'].map('{:,.0f}'.format) + ' '
+            + logs['protein'].astype(str) + ' ' + logs['fat'].astype(str) + ' '
+            + logs['carbs'].astype(str) + ' ' + logs['fiber'].astype(str))
+    header = "Food Item Calories Protein (g) Fat (g) Carbs (g) Fiber (g)"
+    return '\n'.join([header, *body, "DAILY TOTAL 0 0 0 0 0"])
+
+def make_sqlite(n_rows: int) -> SQLiteBackend:
+    """An in-memory SQLite backend holding make_logs(n_rows), with its rollup built."""
+    backend = SQLiteBackend(":memory:")
+    backend.init()
+    backend.insert_logs(DEFAULT_USER, make_logs(n_rows).drop(columns='id').to_dict(orient='records'))
+    backend.rebuild_daily_totals()
+    return backend
+
+def make_food_index(n_rows: int) -> FoodIndex:
+    """A FoodIndex over make_logs(n_rows) with up to ~1,000 variants of each food name."""
+    logs = make_logs(n_rows)
+    logs['food_name'] = logs['food_name'] + ' ' + (logs['id'] % 1000).astype(str)
+    return FoodIndex.from_stats(food_stats(logs))
+
+def make_distinct_food_index(n_names: int, seed: int = 0) -> FoodIndex:
+    """A FoodIndex over n_names distinct foods made from common words, so trigrams like 'chi' have huge postings."""
+    rng = np.random.default_rng(seed)
+    words = ' '.join(FOOD_NAMES).replace('(', ' ').replace(')', ' ').split() + [
+        "Chicken", "Chickpea", "Chips", "Cheese", "Chocolate", "The", "Bread", "Rice", "Beans", "Soup"]
+    names = (pd.Series(rng.choice(words, n_names)) + ' ' + pd.Series(rng.choice(words, n_names))
+             + ' ' + pd.Series(np.arange(n_names)).astype(str))
+    return FoodIndex.from_stats(pd.DataFrame({
+        'food_name': names, **{col: 1.0 for col in MACRO_COLUMNS},
+        'last_date': date.today().isoformat(), 'uses': rng.integers(1, 50, n_names),
+    }))
+
+def make_daily_totals(n_rows: int) -> pd.DataFrame:
+    """The daily totals rollup of make_logs(n_rows), as get_all_daily_totals returns it."""
+    totals = sum_by_date(make_logs(n_rows))
+    totals['items'] = 8
+    return apply_schema(totals, TOTALS_COLUMNS, TOTALS_DTYPES)
+
+def make_analytics_update(n_rows: int) -> tuple:
+    """HistoryAnalytics over make_daily_totals(n_rows), and the totals after today's next log."""
+    totals = make_daily_totals(n_rows)
+    updated = totals.copy()
+    updated.loc[len(updated) - 1, 'calories'] += 100
+    return HistoryAnalytics(totals), updated
+
+# --- Cases ---
+# name -> (setup(n_rows) -> argument, function under test, largest size worth running)
+CASES = {
+    'parse_gemini_table': (make_paste, parse_gemini_table, None),
+    # The same table read line by line from a file, in 1,000-row batches
+    'parse_gemini_stream': (make_paste, lambda text: sum(len(batch) for batch in iter_gemini_batches(text)), None),
+    'calculate_totals': (make_logs, calculate_totals, None),
+    'dashboard_groupby': (make_logs, sum_by_date, None),
+    'dashboard_kcal_split': (lambda n: sum_by_date(make_logs(n)), kcal_split, None),
+    # Downsampled past the zoom window, so even ~125k days stay a few hundred points per trace
+    'dashboard_figure': (lambda n: sum_by_date(make_logs(n)), lambda daily: build_dashboard_figure(daily, 28), None),
+    # One formatted frame per day; at 1M rows that is ~125k days, far past any real history
+    'history_formatting': (make_logs, lambda logs: list(history_days(logs)), 100_000),
+    # Indexed point lookup and the Dashboard's rollup read, with no network involved
+    'sqlite_logs_by_date': (make_sqlite, lambda backend: backend.logs_by_date(DEFAULT_USER, date.today().isoformat()), None),
+    'sqlite_daily_totals': (make_sqlite, lambda backend: backend.daily_totals_since(DEFAULT_USER, (date.today() - timedelta(days=30)).isoformat()), None),
+    # A typo'd quick-add query; the index stops growing once every name variant is in it
+    'food_index_search': (make_food_index, lambda index: index.search("grek yog"), None),
+    # Short, common-trigram queries over n distinct names: the per-keystroke worst case
+    'food_index_distinct': (make_distinct_food_index, lambda index: [index.search(q) for q in ("c", "chi", "the ch")], 1_000_000),
+    # The Dashboard's long-range trends from scratch, and after one more day's data
+    'analytics_full': (make_daily_totals, HistoryAnalytics, None),
+    'analytics_update': (make_analytics_update, lambda pair: pair[0].update(pair[1]), None),
+}
+
+# Absolute limits, per call of the case's function, whatever the baseline says.
+# Quick-add searches run on every keystroke, so three of them must stay within a millisecond each.
+TARGETS = {
+    'food_index_distinct': 3 * 0.001,
+}
+
+def run(sizes, repeat: int, only=None) -> dict:
+    results = {}
+    for name, (setup, fn, max_rows) in CASES.items():
+        if only and name not in only:
+            continue
+        for n_rows in sizes:
+            if max_rows is not None and n_rows > max_rows:
+                continue
+            arg = setup(n_rows)
+            seconds = min(timeit.repeat(lambda: fn(arg), number=1, repeat=repeat))
+            results[f"{name}@{n_rows}"] = seconds
+            print(f"{name:<24} {n_rows:>10,} rows  {seconds * 1000:10.2f} ms", flush=True)
+    return results
+
+def load_baselines(path: str = BASELINE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get('timings', {})
+
+def save_baselines(results: dict, path: str = BASELINE_PATH):
+    baselines = load_baselines(path)
+    baselines.update(results)
+    with open(path, 'w') as f:
+        json.dump({
+            'machine': f"{platform.machine()} / {platform.python_implementation()} {platform.python_version()}",
+            'timings': dict(sorted(baselines.items())),
+        }, f, indent=2)
+        f.write('\n')
+
+def missed_targets(results: dict) -> list:
+    """Cases slower than their TARGETS entry, as (case, target, current) tuples."""
+    return [(case, TARGETS[case.split('@')[0]], seconds) for case, seconds in results.items()
+            if case.split('@')[0] in TARGETS and seconds > TARGETS[case.split('@')[0]]]
+
+def find_regressions(results: dict, baselines: dict, tolerance: float) -> list:
+    """Cases slower than (1 + tolerance) x their baseline, as (case, baseline, current) tuples."""
+    return [(case, baselines[case], seconds) for case, seconds in results.items()
+            if case in baselines and seconds > baselines[case] * (1 + tolerance)]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parsing, dashboard/history data prep and SQLite reads.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--case', action='append', choices=list(CASES), help="Only run this case (repeatable)")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="Allowed slowdown vs baseline, 0.5 = 50%%")
+    parser.add_argument('--save', action='store_true', help="Store these timings as the new baselines")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat, args.case)
+    if args.save:
+        save_baselines(results)
+        print(f"Saved {len(results)} baselines to {BASELINE_PATH}")
+        return 0
+
+    regressions = find_regressions(results, load_baselines(), args.tolerance)
+    for case, baseline, seconds in regressions:
+        print(f"REGRESSION {case}: {seconds * 1000:.2f} ms vs baseline {baseline * 1000:.2f} ms")
+    missed = missed_targets(results)
+    for case, target, seconds in missed:
+        print(f"MISSED TARGET {case}: {seconds * 1000:.2f} ms vs target {target * 1000:.2f} ms")
+    return 1 if regressions or missed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
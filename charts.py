@@ -0,0 +1,177 @@
+import hashlib
+
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+from plotly.subplots import make_subplots
+
+from transforms import downsample_series, kcal_split, monday_dates, zoom_range
+
+# Building the Dashboard figure (make_subplots, four spline traces, the weekly markers) costs
+# far more than rendering it, so each figure's spec is memoized per data version and zoom.
+# st.cache_data hands every rerun its own copy of the spec, which is wrapped back into a
+# Figure without re-validation: st.plotly_chart re-validates a dict spec, which costs ~4x as
+# much as serializing a Figure (~18 ms vs ~4 ms for ten years of days), and the spec came
+# from a validated Figure. Traces are downsampled outside the zoom window (see
+# downsample_series), so however far back the data goes each one stays a few hundred points.
+
+def data_version(daily_summary: pd.DataFrame) -> str:
+    # Content hash of the summary, so any change to the data (ours or another session's) is a new version
+    return hashlib.sha1(pd.util.hash_pandas_object(daily_summary, index=False).to_numpy().tobytes()).hexdigest()
+
+def monday_shapes(mondays: list) -> list:
+    # The dashed line add_vline would draw, once in each subplot (x/y above the shared axis, x2/y2 below)
+    return [
+        dict(type='line', x0=m, x1=m, xref=xref, y0=0, y1=1, yref=f'{yref} domain',
+             line=dict(color="#A1D4B1", dash="dash"), opacity=0.8, layer="below")
+        for m in mondays
+        for xref, yref in (('x', 'y'), ('x2', 'y2'))
+    ]
+
+def build_dashboard_figure(daily_summary: pd.DataFrame, view_days: int) -> go.Figure:
+    mondays = monday_dates(daily_summary)
+    plotted = downsample_series(daily_summary, view_days)
+    if plotted is not daily_summary:
+        # Only mark the weeks still plotted day by day
+        start = zoom_range(daily_summary, view_days)[0]
+        mondays = [m for m in mondays if m >= start]
+    daily_summary = plotted
+
+    # Calculate proportional heights of macros to match total calories
+    split = kcal_split(daily_summary)
+    p_cal, f_cal, c_cal = split['protein_kcal'], split['fat_kcal'], split['carbs_kcal']
+
+    # Create figure with 2 subplots separated by the X axis
+    fig = make_subplots(
+        rows=2, cols=1,
+        shared_xaxes=True,
+        vertical_spacing=0.0,
+        row_heights=[0.8, 0.2]
+    )
+
+    # 1. Protein (Stacked Area - Gold) #F1A512
+    fig.add_trace(
+        go.Scatter(x=daily_summary['date'], y=p_cal,
+                   name="Protein", mode='lines', stackgroup='one', line_shape='spline',
+                   fillcolor='rgba(241, 165, 18, 0.8)', line=dict(color='#F1A512', width=2),
+                   customdata=daily_summary['protein'],
+                   hovertemplate='Protein: %{customdata:.1f}g (~%{y:.0f} kcal)<extra></extra>'),
+        row=1, col=1
+    )
+
+    # 2. Carbs (Stacked Area - Red/Orange) #DD4111
+    fig.add_trace(
+        go.Scatter(x=daily_summary['date'], y=c_cal,
+                   name="Carbs", mode='lines', stackgroup='one', line_shape='spline',
+                   fillcolor='rgba(221, 65, 17, 0.8)', line=dict(color='#DD4111', width=2),
+                   customdata=daily_summary['carbs'],
+                   hovertemplate='Carbs: %{customdata:.1f}g (~%{y:.0f} kcal)<extra></extra>'),
+        row=1, col=1
+    )
+
+    # 3. Fat (Stacked Area - Maroon) #8C0027
+    fig.add_trace(
+        go.Scatter(x=daily_summary['date'], y=f_cal,
+                   name="Fat", mode='lines', stackgroup='one', line_shape='spline',
+                   fillcolor='rgba(140, 0, 39, 0.8)', line=dict(color='#8C0027', width=2),
+                   customdata=daily_summary['fat'],
+                   hovertemplate='Fat: %{customdata:.1f}g (~%{y:.0f} kcal)<extra></extra>'),
+        row=1, col=1
+    )
+
+    # 4. Fiber - smoothed filled area chart descending (Teal) #2BAF90
+    fig.add_trace(
+        go.Scatter(x=daily_summary['date'], y=daily_summary['fiber'],
+                   name="Fiber", mode='lines', fill='tozeroy', line_shape='spline',
+                   fillcolor='rgba(43, 175, 144, 0.4)', line=dict(color='#2BAF90', width=2),
+                   customdata=daily_summary['fiber'],
+                   hovertemplate='Fiber: %{customdata:.1f}g<extra></extra>'),
+        row=2, col=1
+    )
+
+    # Configure layout (Shrunk height, Legend at bottom)
+    fig.update_layout(
+        height=400,
+        hovermode='x unified',
+        legend=dict(orientation="h", yanchor="top", y=-0.15, xanchor="center", x=0.5),
+        margin=dict(t=20, b=50) # Tighter top margin, room for legend at bottom
+    )
+
+    # Add vertical dashed lines for Mondays, as one batch of shapes rather than an add_vline per Monday
+    fig.update_layout(shapes=monday_shapes(mondays))
+
+    # Apply zoom to the shared x-axes
+    fig.update_xaxes(range=zoom_range(daily_summary, view_days))
+
+    # X-axes line styling
+    fig.update_xaxes(showline=True, linewidth=1, linecolor='gray', showticklabels=False, row=1, col=1)
+    fig.update_xaxes(showline=False, showticklabels=True, row=2, col=1)
+
+    # Y-axes setup
+    fig.update_yaxes(title_text="KCal", rangemode="tozero", row=1, col=1)
+    # Reverse the fiber axis so it hangs down from the shared X line
+    fig.update_yaxes(title_text="Fiber (g)", autorange="reversed", row=2, col=1)
+
+    return fig
+
+def _from_spec(spec: dict) -> go.Figure:
+    # The spec came from to_plotly_json() on a Figure that was validated as it was built
+    return go.Figure(spec, _validate=False)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _dashboard_spec(version: str, view_days: int, _daily_summary: pd.DataFrame) -> dict:
+    return build_dashboard_figure(_daily_summary, view_days).to_plotly_json()
+
+def dashboard_figure(version: str, view_days: int, daily_summary: pd.DataFrame) -> go.Figure:
+    """
+    The Dashboard figure for a daily summary whose data_version() is `version`, zoomed to
+    the last view_days. The summary itself isn't hashed; version stands in for it.
+    Each call gets a Figure of its own, so callers may modify it.
+    """
+    return _from_spec(_dashboard_spec(version, view_days, daily_summary))
+
+TREND_GRANULARITIES = ('Daily', 'Weekly', 'Monthly')
+
+def build_trend_figure(history, granularity: str, view_days: int) -> go.Figure:
+    """
+    Long-range view of a HistoryAnalytics: daily calories with their 7- and 28-day rolling
+    means (exact for the last view_days, averaged further back), or the average macro
+    calories per logged day of each week or month.
+    """
+    fig = go.Figure()
+    if granularity == 'Daily':
+        daily = downsample_series(history.daily, view_days)
+        fig.add_trace(go.Scatter(x=daily['date'], y=daily['calories'], name="Calories", mode='lines',
+                                 line=dict(color='rgba(221, 65, 17, 0.3)', width=1),
+                                 hovertemplate='%{y:.0f} kcal<extra></extra>'))
+        for window, color in ((7, '#F1A512'), (28, '#8C0027')):
+            fig.add_trace(go.Scatter(x=daily['date'], y=daily[f'calories_{window}d'], name=f"{window}-day mean",
+                                     mode='lines', line=dict(color=color, width=2),
+                                     hovertemplate=f'{window}-day mean: %{{y:.0f}} kcal<extra></extra>'))
+    else:
+        periods = history.weekly if granularity == 'Weekly' else history.monthly
+        split = kcal_split(periods)
+        for macro, name, color in (('protein', "Protein", '#F1A512'), ('carbs', "Carbs", '#DD4111'),
+                                   ('fat', "Fat", '#8C0027')):
+            fig.add_trace(go.Bar(x=periods['start'], y=split[f'{macro}_kcal'], name=name, marker_color=color,
+                                 customdata=periods[[macro, f'{macro}_pct', 'days_logged']],
+                                 hovertemplate=f'{name}: %{{customdata[0]:.1f}}g/day (%{{customdata[1]:.0f}}%, '
+                                               '%{customdata[2]} days logged)<extra></extra>'))
+        fig.update_layout(barmode='stack', bargap=0.1)
+
+    fig.update_layout(
+        height=350,
+        hovermode='x unified',
+        legend=dict(orientation="h", yanchor="top", y=-0.15, xanchor="center", x=0.5),
+        margin=dict(t=20, b=50),
+    )
+    fig.update_yaxes(title_text="KCal / day", rangemode="tozero")
+    return fig
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _trend_spec(version: str, granularity: str, view_days: int, _history) -> dict:
+    return build_trend_figure(_history, granularity, view_days).to_plotly_json()
+
+def trend_figure(version: str, granularity: str, view_days: int, history) -> go.Figure:
+    # Like dashboard_figure: one cached spec per data version, granularity and zoom
+    return _from_spec(_trend_spec(version, granularity, view_days, history))
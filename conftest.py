@@ -0,0 +1,168 @@
+import json
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pandas as pd
+import pytest
+
+import database as db
+from storage import SQLiteBackend
+
+@pytest.fixture
+def make_items():
+    def make_items(*names, calories=100.0):
+        # Log rows without a date, one per name, with the same macros each
+        return pd.DataFrame({
+            'food_name': list(names),
+            'calories': [calories] * len(names),
+            'protein': [10.0] * len(names),
+            'fat': [5.0] * len(names),
+            'carbs': [2.5] * len(names),
+            'fiber': [1.0] * len(names),
+        })
+    return make_items
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    # database.py running against a fresh SQLite file, with an empty read cache
+    backend = SQLiteBackend(str(tmp_path / "macros.db"))
+    monkeypatch.setattr(db, 'get_backend', lambda: backend)
+    db.clear_cache()
+    db.init_db()
+    yield backend
+    db.clear_cache()
+
+NOW = "strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')"
+
+# The Supabase side for PostgRESTStandIn: logs and recipes with sql/replica_sync.sql's stamps and tombstone trigger
+REMOTE_SCHEMA = f"""
+CREATE TABLE logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL DEFAULT 'default', date TEXT NOT NULL, food_name TEXT,
+    calories REAL, protein REAL, fat REAL, carbs REAL, fiber REAL,
+    updated_at TEXT NOT NULL DEFAULT ({NOW})
+);
+CREATE TABLE recipes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL DEFAULT 'default', name TEXT NOT NULL,
+    ingredients_json TEXT, calories REAL, protein REAL, fat REAL, carbs REAL, fiber REAL,
+    updated_at TEXT NOT NULL DEFAULT ({NOW}), UNIQUE (user_id, name)
+);
+CREATE TABLE log_tombstones (id INTEGER PRIMARY KEY, date TEXT NOT NULL, deleted_at TEXT NOT NULL DEFAULT ({NOW}));
+CREATE TRIGGER logs_record_tombstone AFTER DELETE ON logs
+BEGIN
+    INSERT OR IGNORE INTO log_tombstones (id, date) VALUES (old.id, old.date);
+END;
+CREATE TRIGGER recipes_touch_updated_at AFTER UPDATE OF ingredients_json, calories ON recipes
+BEGIN
+    UPDATE recipes SET updated_at = {NOW} WHERE id = new.id;
+END;
+"""
+
+OPERATORS = {'eq': '=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+class PostgRESTStandIn(ThreadingHTTPServer):
+    """
+    Just enough of PostgREST over SQLite for SupabaseBackend and the replica: filtered,
+    ordered and limited selects, inserts, upserts on (user_id, name), deletes returning
+    their rows, and no-op RPCs. Set delay to make every request slow, or fail_with to
+    answer every request with that error status instead.
+    """
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), self.Handler)
+        self.db = sqlite3.connect(':memory:', check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(REMOTE_SCHEMA)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.delay, self.fail_with = 0, None
+
+    def query(self, method: str, table: str, params: list, body):
+        where, args, order, limit, returning = [], [], '', '', '*'
+        for key, value in params:
+            if key == 'select':
+                returning = value
+            elif key == 'order':
+                column, _, direction = value.partition('.')
+                order = f" ORDER BY {column} {'DESC' if direction == 'desc' else 'ASC'}"
+            elif key == 'limit':
+                limit = f" LIMIT {int(value)}"
+            elif key not in ('on_conflict', 'columns'):
+                op, _, operand = value.partition('.')
+                if op == 'in':
+                    values = operand.strip('()').split(',')
+                    where.append(f"{key} IN ({', '.join('?' * len(values))})")
+                    args.extend(values)
+                else:
+                    where.append(f"{key} {OPERATORS[op]} ?")
+                    args.append(operand)
+        condition = f" WHERE {' AND '.join(where)}" if where else ''
+
+        with self.lock, self.db:
+            if method == 'GET':
+                return self.db.execute(f"SELECT {returning} FROM {table}{condition}{order}{limit}", args).fetchall()
+            if method == 'DELETE':
+                rows = self.db.execute(f"SELECT * FROM {table}{condition}", args).fetchall()
+                self.db.execute(f"DELETE FROM {table}{condition}", args)
+                return rows
+            rows = []
+            for record in body if isinstance(body, list) else [body]:
+                columns = list(record)
+                sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                if table == 'recipes':
+                    sql += f" ON CONFLICT (user_id, name) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in columns)}"
+                self.db.execute(sql, [record[c] for c in columns])
+                if table == 'recipes':
+                    key, values = 'user_id = ? AND name = ?', (record['user_id'], record['name'])
+                else:
+                    key, values = 'rowid = ?', self.db.execute("SELECT last_insert_rowid()").fetchone()
+                rows.extend(self.db.execute(f"SELECT * FROM {table} WHERE {key}", values).fetchall())
+            return rows
+
+    def run(self, sql: str, args=()):
+        with self.lock, self.db:
+            return self.db.execute(sql, args).fetchall()
+
+    def add_log(self, day: str, name: str, calories: float = 100.0):
+        # A row written straight into the remote, e.g. by another device
+        self.run("INSERT INTO logs (date, food_name, calories, protein, fat, carbs, fiber) VALUES (?, ?, ?, 5, 3, 10, 1)",
+                 (day, name, calories))
+
+    class Handler(BaseHTTPRequestHandler):
+        def _handle(self):
+            server = self.server
+            url = urlsplit(self.path)
+            table = url.path.rsplit('/', 1)[-1]
+            server.requests.append((self.command, table, url.query))
+            time.sleep(server.delay)
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length)) if length else None
+            if server.fail_with:
+                status, rows = server.fail_with, {'message': 'boom', 'code': 'XX000'}
+            elif '/rpc/' in url.path:
+                status, rows = 200, None
+            else:
+                rows = [dict(row) for row in server.query(self.command, table, parse_qsl(url.query), body)]
+                status = 201 if self.command == 'POST' else 200
+            payload = json.dumps(rows).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST = do_DELETE = do_PATCH = _handle
+
+        def log_message(self, *args):
+            pass
+
+@pytest.fixture
+def stand_in():
+    server = PostgRESTStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -1,64 +1,461 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+import pyarrow.parquet as pq
 from datetime import date, timedelta
 import streamlit as st
-from supabase import create_client, Client
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from supabase import ClientOptions, create_client, Client
+
+import perf
+import replica
+from parser import iter_gemini_batches
+import resilience
+from resilience import BackendUnavailable
+from storage import DEFAULT_USER, SQLiteBackend, StorageBackend, SupabaseBackend
+from transforms import (LOG_COLUMNS, LOG_DTYPES, MACRO_COLUMNS, RECIPE_COLUMNS, RECIPE_DTYPES, TOTALS_COLUMNS,
+                        TOTALS_DTYPES, apply_schema)
+
+def get_setting(section: str, key: str, default=None):
+    # Optional tuning knobs live in secrets.toml; fall back to defaults when it is absent.
+    try:
+        return st.secrets.get(section, {}).get(key, default)
+    except FileNotFoundError:
+        return default
 
 @st.cache_resource
 def get_supabase() -> Client:
     url = st.secrets["connections"]["supabase"]["SUPABASE_URL"]
     key = st.secrets["connections"]["supabase"]["SUPABASE_KEY"]
-    return create_client(url, key)
+    # One pooled HTTP client with firm timeouts, tuned under [supabase] in secrets.toml
+    http_client = resilience.make_http_client(
+        float(get_setting("supabase", "timeout_seconds", resilience.DEFAULT_TIMEOUT_SECONDS)),
+        int(get_setting("supabase", "max_connections", resilience.DEFAULT_MAX_CONNECTIONS)),
+    )
+    return create_client(url, key, options=ClientOptions(httpx_client=http_client))
+
+@st.cache_resource
+def get_backend() -> StorageBackend:
+    """
+    [storage] backend = "supabase" (default), "sqlite" with [storage] sqlite_path, or
+    "replica": Supabase behind a local replica (replica.py) at [storage] replica_path,
+    synced every [storage] sync_seconds. The replica needs sql/replica_sync.sql.
+    """
+    kind = get_setting("storage", "backend", "supabase")
+    if kind == "sqlite":
+        return SQLiteBackend(get_setting("storage", "sqlite_path", "macros.db"))
+    breaker = resilience.CircuitBreaker(
+        int(get_setting("supabase", "breaker_failures", resilience.DEFAULT_FAILURE_THRESHOLD)),
+        float(get_setting("supabase", "breaker_reset_seconds", resilience.DEFAULT_RESET_SECONDS)),
+    )
+    remote = SupabaseBackend(get_supabase(), breaker,
+                             max_retries=int(get_setting("supabase", "max_retries", resilience.DEFAULT_MAX_RETRIES)))
+    if kind == "replica":
+        return replica.ReplicaBackend(
+            remote, replica.ReplicaStore(get_setting("storage", "replica_path", "replica.db")),
+            float(get_setting("storage", "sync_seconds", replica.DEFAULT_SYNC_SECONDS)), on_change=_replica_changed,
+        )
+    return remote
+
+def current_user() -> str:
+    """
+    Whose rows this session reads and writes: the signed-in account's email when Streamlit
+    authentication is configured ([auth] in secrets.toml) and the user has logged in,
+    otherwise [storage] user_id. Every public read and write below takes user_id to act
+    for someone else, e.g. from a thread with no session.
+    """
+    # st.user has no is_logged_in without [auth], and nobody is signed in outside a script run
+    if get_script_run_ctx(suppress_warning=True) is not None and getattr(st.user, 'is_logged_in', False):
+        return st.user.email
+    return get_setting("storage", "user_id", DEFAULT_USER)
+
+# --- Read cache ---
+# Every Streamlit rerun asks for the same handful of queries. Results are kept in memory
+# for [cache] ttl_seconds and writes evict only the keys they affect, so widget reruns
+# make no network calls while saved/deleted rows still show up immediately.
+# Keys start with the kind of read and the user it was for, so users never see each
+# other's entries and one user's writes leave everyone else's cached:
+#       ('logs_by_date', user, 'YYYY-MM-DD', columns), ('recent_logs', user, cutoff, columns),
+#       ('logs_between', user, start, end, columns), ('daily_totals', user, cutoff),
+#       ('all_daily_totals', user), ('all_logs', user), ('recipes', user, columns), ('recipe', user, name, columns)
+# Cached reads are stored in the compact schema from transforms (LOG_DTYPES etc).
+# Keys multiply with users, dates and week ranges, so the cache is bounded: expired entries
+# are purged on every insert and past [cache] max_entries the least recently used go.
+DEFAULT_CACHE_TTL_SECONDS = 300
+DEFAULT_CACHE_MAX_ENTRIES = 512
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_generation = 0
+
+def _cache_ttl() -> float:
+    return float(get_setting("cache", "ttl_seconds", DEFAULT_CACHE_TTL_SECONDS))
+
+def _cache_max_entries() -> int:
+    return int(get_setting("cache", "max_entries", DEFAULT_CACHE_MAX_ENTRIES))
+
+def _cached(key: tuple, loader) -> pd.DataFrame:
+    now = time.monotonic()
+    ttl, max_entries = _cache_ttl(), _cache_max_entries()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and now - entry[0] < ttl:
+            _cache.move_to_end(key)
+            return entry[1].copy()
+        generation = _cache_generation
+
+    # Misses are timed on their own, separating backend round trips from cache hits
+    try:
+        with perf.timed(f"fetch.{key[0]}") as sample:
+            value = sample.measure(loader())
+    except BackendUnavailable:
+        # Past its TTL is better than nothing while the backend is down
+        if entry is None:
+            raise
+        return entry[1].copy()
+
+    with _cache_lock:
+        # Don't store a result that raced with a write; the next read will refetch it.
+        if generation == _cache_generation:
+            for expired in [k for k, (stored, _) in _cache.items() if now - stored >= ttl]:
+                del _cache[expired]
+            _cache[key] = (now, value)
+            _cache.move_to_end(key)
+            while len(_cache) > max_entries:
+                _cache.popitem(last=False)
+    return value.copy()
+
+def _evict(predicate):
+    global _cache_generation
+    with _cache_lock:
+        _cache_generation += 1
+        for key in [k for k in _cache if predicate(k)]:
+            del _cache[key]
+
+def _evict_log_dates(user_id, date_strs: set):
+    # A date affects its own day, any recent window reaching back to it and the full export.
+    # user_id None evicts those dates for every user.
+    def affected(key):
+        kind = key[0]
+        if user_id is not None and key[1] != user_id:
+            return False
+        if kind == 'logs_by_date':
+            return key[2] in date_strs
+        if kind in ('recent_logs', 'daily_totals'):
+            return any(key[2] <= d for d in date_strs)
+        if kind == 'logs_between':
+            return any(key[2] <= d <= key[3] for d in date_strs)
+        return kind in ('all_logs', 'all_daily_totals')
+    _evict(affected)
+
+def _evict_recipes(user_id, names: set):
+    # user_id None evicts these recipes for every user
+    def affected(key):
+        if key[0] not in ('recipes', 'recipe') or user_id not in (None, key[1]):
+            return False
+        return key[0] == 'recipes' or key[2] in names
+    _evict(affected)
+
+def _replica_changed(date_strs: set, recipe_names: set):
+    # A replica sync pulled in rows written elsewhere (another session or device). Syncs
+    # don't say whose rows they were, so the dates go for everyone.
+    if date_strs:
+        _evict_log_dates(None, date_strs)
+    if recipe_names:
+        _evict_recipes(None, recipe_names)
 
+def backend_available() -> bool:
+    # False while the backend's circuit breaker is open: reads come from the cache (or the
+    # replica) and writes will fail
+    return get_backend().available()
+
+def clear_cache():
+    _evict(lambda key: True)
+
+@perf.instrumented()
 def init_db():
-    # Tables are manually created in Supabase. The app user does not have CREATE permissions.
-    pass
+    # Tables are manually created in Supabase (the app user does not have CREATE permissions);
+    # the SQLite backend creates its schema here.
+    get_backend().init()
 
-def save_logs(df: pd.DataFrame, log_date: date):
+# --- Daily totals rollup ---
+# daily_totals holds one row of macro sums per day (see sql/daily_totals.sql). The backend
+# updates it in the same transaction as every log insert and delete, so a crash or failed
+# request can't leave it out of step; rollup.py rebuilds and verifies it.
+
+@perf.instrumented()
+def save_logs(df: pd.DataFrame, log_date: date, user_id: str = None):
     if df.empty:
         return
-        
+
     df = df.copy()
     df['date'] = log_date.strftime('%Y-%m-%d')
-    records = df.to_dict(orient='records')
-    
-    supabase = get_supabase()
-    supabase.table('logs').insert(records).execute()
+    save_log_rows(df, user_id)
+
+@perf.instrumented()
+def save_log_rows(rows: pd.DataFrame, user_id: str = None):
+    # Inserts rows that carry their own 'YYYY-MM-DD' date, which may span several days
+    if rows.empty:
+        return
+    user_id = user_id or current_user()
+    records = rows.to_dict(orient='records')
+
+    get_backend().insert_logs(user_id, records)
+    _evict_log_dates(user_id, set(rows['date']))
+    for listener in list(_save_listeners):
+        listener(user_id, rows)
+
+# Called with the user and rows of every successful save or delete, e.g. to keep the food
+# index current. Register once per process (at import), not per cached object.
+_save_listeners = []
+_delete_listeners = []
 
-def get_logs_by_date(log_date: date) -> pd.DataFrame:
-    supabase = get_supabase()
+def add_save_listener(listener):
+    _save_listeners.append(listener)
+
+def add_delete_listener(listener):
+    _delete_listeners.append(listener)
+
+# --- Concurrent reads ---
+# Independent reads for one rerun go out side by side, so it waits for the slowest round
+# trip rather than the sum of them. Results land in the read cache like any other read.
+FETCH_WORKERS = 8
+_fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="db-fetch")
+
+def _run_with_ctx(ctx, call):
+    # Pool threads borrow the caller's script context so st.secrets/st.cache_resource behave
+    thread = threading.current_thread()
+    add_script_run_ctx(thread, ctx)
+    try:
+        return call()
+    finally:
+        add_script_run_ctx(thread, None)
+
+def fetch_concurrently(*calls) -> list:
+    """
+    Runs zero-argument reads (e.g. functools.partial(get_recent_logs, 90)) on a thread
+    pool and returns their results in the same order. The first error is re-raised.
+    """
+    if len(calls) <= 1:
+        return [call() for call in calls]
+    ctx = get_script_run_ctx(suppress_warning=True)
+    futures = [_fetch_pool.submit(_run_with_ctx, ctx, call) for call in calls]
+    return [future.result() for future in futures]
+
+@perf.instrumented()
+def get_logs_by_date(log_date: date, columns: list = LOG_COLUMNS, user_id: str = None) -> pd.DataFrame:
+    user_id = user_id or current_user()
     date_str = log_date.strftime('%Y-%m-%d')
-    response = supabase.table('logs').select("*").eq("date", date_str).execute()
-    return pd.DataFrame(response.data)
-
-def get_recent_logs(days: int = 30) -> pd.DataFrame:
-    supabase = get_supabase()
-    cutoff_date = (date.today() - timedelta(days=days)).strftime('%Y-%m-%d')
-    response = supabase.table('logs').select("*").gte("date", cutoff_date).execute()
-    return pd.DataFrame(response.data)
-
-def load_all_logs() -> pd.DataFrame:
-    supabase = get_supabase()
-    # Note: Supabase REST limits to 1000 rows by default. For a massive scale app, 
-    # pagination would be needed, but this is fine for personal use.
-    response = supabase.table('logs').select("*").limit(10000).execute()
-    return pd.DataFrame(response.data)
-
-def delete_logs(log_ids: list):
+
+    def load():
+        return apply_schema(get_backend().logs_by_date(user_id, date_str, columns), columns, LOG_DTYPES)
+    return _cached(('logs_by_date', user_id, date_str, tuple(columns)), load)
+
+def recent_cutoff(days: int) -> str:
+    # Oldest date (inclusive) covered by get_recent_logs(days)
+    return (date.today() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+@perf.instrumented()
+def get_recent_logs(days: int = 30, columns: list = LOG_COLUMNS, user_id: str = None) -> pd.DataFrame:
+    user_id = user_id or current_user()
+    cutoff_date = recent_cutoff(days)
+
+    def load():
+        return apply_schema(get_backend().logs_since(user_id, cutoff_date, columns), columns, LOG_DTYPES)
+    return _cached(('recent_logs', user_id, cutoff_date, tuple(columns)), load)
+
+@perf.instrumented()
+def get_daily_totals(days: int = 30, user_id: str = None) -> pd.DataFrame:
+    """
+    One row per day since the recent cutoff with the five macro sums, ordered by date.
+    Read from the precomputed daily_totals rollup, so the payload grows with the number of
+    days rather than the number of logged items. On Supabase this falls back to the
+    daily_log_totals view (see sql/daily_log_totals.sql) and then to a local groupby if
+    those aren't installed.
+    """
+    user_id = user_id or current_user()
+    cutoff_date = recent_cutoff(days)
+    def load():
+        return apply_schema(get_backend().daily_totals_since(user_id, cutoff_date), TOTALS_COLUMNS, TOTALS_DTYPES)
+    return _cached(('daily_totals', user_id, cutoff_date), load)
+
+# Supabase REST caps responses at 1000 rows by default, so keep pages at or below that
+EXPORT_PAGE_SIZE = 1000
+
+def iter_table_pages(table: str, key: str, page_size: int = EXPORT_PAGE_SIZE, user_id: str = None):
+    """
+    Yields every row of a user's part of a table as a sequence of DataFrames ordered by a
+    unique key column, without the user_id column. Uses keyset pagination (key > last seen
+    key) so each page is an indexed range scan and rows inserted mid-read are never
+    skipped or repeated.
+    """
+    user_id = user_id or current_user()
+    backend = get_backend()
+    last_key = None
+    while True:
+        with perf.timed(f"fetch.page.{table}") as sample:
+            page = sample.measure(backend.page(user_id, table, key, last_key, page_size))
+        # A short page doesn't mean we're done if the server caps below page_size
+        if page.empty:
+            return
+        yield page.drop(columns='user_id', errors='ignore')
+        # As a plain Python value; sqlite3 would bind a numpy integer as a blob
+        last_key = page[key].iloc[-1:].tolist()[0]
+
+def iter_log_pages(page_size: int = EXPORT_PAGE_SIZE, user_id: str = None):
+    return iter_table_pages('logs', 'id', page_size, user_id)
+
+@perf.instrumented()
+def load_all_logs(user_id: str = None) -> pd.DataFrame:
+    user_id = user_id or current_user()
+
+    def load():
+        pages = list(iter_log_pages(user_id=user_id))
+        return pd.concat(pages, ignore_index=True) if pages else pd.DataFrame()
+    return _cached(('all_logs', user_id), load)
+
+@perf.instrumented()
+def get_all_daily_totals(user_id: str = None) -> pd.DataFrame:
+    # Every logged day's totals, ordered by date, for the Dashboard's long-range trends.
+    # Paged past the REST row cap, with the same fallbacks as get_daily_totals.
+    user_id = user_id or current_user()
+
+    def load():
+        return apply_schema(get_backend().all_daily_totals(user_id), TOTALS_COLUMNS, TOTALS_DTYPES)
+    return _cached(('all_daily_totals', user_id), load)
+
+@perf.instrumented()
+def get_food_stats(user_id: str = None) -> pd.DataFrame:
+    # Every distinct food with its latest macros, last date and use count (see sql/food_stats.sql)
+    return get_backend().food_stats(user_id or current_user())
+
+@perf.instrumented()
+def get_logs_between(start: date, end: date, columns: list = LOG_COLUMNS, page_size: int = EXPORT_PAGE_SIZE,
+                     user_id: str = None) -> pd.DataFrame:
+    """
+    Logs dated start..end (inclusive), ordered by id. Fetched with keyset pages on id inside
+    the date range, so a range of any size never hits the server's row cap.
+    """
+    user_id = user_id or current_user()
+    start_str, end_str = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+    # The keyset needs the id even if the caller doesn't
+    fetch = columns if 'id' in columns else ['id'] + columns
+
+    def load():
+        backend = get_backend()
+        pages, last_id = [], None
+        while True:
+            page = backend.logs_between(user_id, start_str, end_str, last_id, page_size, fetch)
+            if page.empty:
+                break
+            pages.append(page)
+            last_id = page['id'].iloc[-1:].tolist()[0]
+        rows = pd.concat(pages, ignore_index=True) if pages else pd.DataFrame(columns=fetch)
+        return apply_schema(rows, columns, LOG_DTYPES)
+    return _cached(('logs_between', user_id, start_str, end_str, tuple(columns)), load)
+
+@perf.instrumented()
+def delete_logs(log_ids: list, user_id: str = None):
     if not log_ids:
         return
-    supabase = get_supabase()
-    # Supabase REST 'in_' filter takes a list
-    supabase.table('logs').delete().in_("id", log_ids).execute()
+    user_id = user_id or current_user()
+    # The deleted rows come back, which tells us exactly which days to evict. Ids that
+    # aren't this user's are left alone.
+    deleted = get_backend().delete_logs(user_id, log_ids)
 
-def save_recipe(name: str, df: pd.DataFrame):
-    if df.empty:
-        return
-        
-    totals = df[['calories', 'protein', 'fat', 'carbs', 'fiber']].sum()
+    _evict_log_dates(user_id, set(deleted['date'].astype(str)) if not deleted.empty else set())
+    if not deleted.empty:
+        for listener in list(_delete_listeners):
+            listener(user_id, deleted)
+
+# --- Bulk import ---
+# Rows read, validated and saved at a time. Matches the REST insert cap, so each batch is
+# normally one request and memory stays flat however long the file is.
+IMPORT_BATCH_ROWS = 1000
+IMPORT_COLUMNS = ['date', 'food_name'] + MACRO_COLUMNS
+IMPORT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'json', '.parquet': 'parquet'}
+
+def _import_chunks(source, fmt: str, batch_rows: int):
+    if fmt == 'csv':
+        yield from pd.read_csv(source, chunksize=batch_rows, dtype={'date': str, 'food_name': str})
+    elif fmt == 'jsonl':
+        yield from pd.read_json(source, lines=True, chunksize=batch_rows, dtype=False, convert_dates=False)
+    elif fmt == 'json':
+        # A JSON array can't be read a chunk at a time, but it's still saved batch by batch
+        rows = pd.read_json(source, orient='records', dtype=False, convert_dates=False)
+        for start in range(0, len(rows), batch_rows):
+            yield rows.iloc[start:start + batch_rows]
+    elif fmt == 'parquet':
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=batch_rows):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unknown import format: {fmt}")
+
+def _valid_import_rows(chunk: pd.DataFrame) -> pd.DataFrame:
+    # Typed rows ready for save_log_rows, without any that have no name, an unreadable
+    # date or a missing/negative macro. Ids in the file (e.g. from an export) are ignored.
+    missing = [col for col in IMPORT_COLUMNS if col not in chunk.columns]
+    if missing:
+        raise ValueError(f"Import file is missing columns: {', '.join(missing)}")
+    rows = pd.DataFrame({
+        'date': pd.to_datetime(chunk['date'], errors='coerce', format='ISO8601').dt.strftime('%Y-%m-%d'),
+        'food_name': chunk['food_name'].fillna('').astype(str).str.strip(),
+        **{col: pd.to_numeric(chunk[col], errors='coerce') for col in MACRO_COLUMNS},
+    })
+    macros = rows[MACRO_COLUMNS]
+    valid = rows['date'].notna() & (rows['food_name'] != '') & macros.notna().all(axis=1) & (macros >= 0).all(axis=1)
+    return rows[valid].reset_index(drop=True)
+
+@perf.instrumented()
+def import_logs(source, fmt: str = None, batch_rows: int = IMPORT_BATCH_ROWS, on_batch=None, user_id: str = None) -> dict:
+    """
+    Streams log rows from a CSV, JSON Lines, JSON array or Parquet file (a path or binary file object,
+    e.g. an export or an upload) into the logs table, batch by batch, through save_log_rows.
+    fmt defaults to the file extension. on_batch(imported, rejected) is called after each
+    batch. Returns {'imported': n, 'rejected': n}; invalid rows are counted and skipped.
+    Raises ValueError for a file that can't be read or lacks IMPORT_COLUMNS.
+    """
+    if fmt is None:
+        name = source if isinstance(source, str) else getattr(source, 'name', '')
+        fmt = IMPORT_FORMATS.get(os.path.splitext(name)[1].lower(), 'csv')
+    user_id = user_id or current_user()
+    imported = rejected = 0
+    for chunk in _import_chunks(source, fmt, batch_rows):
+        rows = _valid_import_rows(chunk)
+        save_log_rows(rows, user_id)
+        imported += len(rows)
+        rejected += len(chunk) - len(rows)
+        if on_batch is not None:
+            on_batch(imported, rejected)
+    return {'imported': imported, 'rejected': rejected}
+
+@perf.instrumented()
+def import_gemini_table(source, log_date: date, batch_rows: int = IMPORT_BATCH_ROWS, on_batch=None,
+                        user_id: str = None) -> dict:
+    """
+    Streams a food table in the paste box's format (a Gemini answer or another tracker's
+    export) from a text or binary file object, e.g. an upload, or any iterable of lines into
+    log_date's log: one save_logs insert per batch_rows parsed rows, so memory stays flat
+    however long the table is. on_batch(imported) is called after each batch. Returns
+    {'imported': n}; headers, totals and lines that aren't food rows are skipped.
+    """
+    user_id = user_id or current_user()
+    imported = 0
+    for batch in iter_gemini_batches(source, batch_rows):
+        save_logs(batch, log_date, user_id)
+        imported += len(batch)
+        if on_batch is not None:
+            on_batch(imported)
+    return {'imported': imported}
+
+def recipe_record(name: str, df: pd.DataFrame) -> dict:
+    totals = df[MACRO_COLUMNS].sum()
     ingredients_json = df.to_json(orient='records')
-    
-    supabase = get_supabase()
-    record = {
+
+    return {
         'name': name,
         'ingredients_json': ingredients_json,
         'calories': totals['calories'],
@@ -67,11 +464,33 @@ def save_recipe(name: str, df: pd.DataFrame):
         'carbs': totals['carbs'],
         'fiber': totals['fiber']
     }
-    
-    # Supabase 'upsert' works on unique constraints (name is UNIQUE)
-    supabase.table('recipes').upsert(record).execute()
-
-def get_all_recipes() -> pd.DataFrame:
-    supabase = get_supabase()
-    response = supabase.table('recipes').select("*").execute()
-    return pd.DataFrame(response.data)
+
+@perf.instrumented()
+def save_recipe(name: str, df: pd.DataFrame, user_id: str = None):
+    if df.empty:
+        return
+    save_recipe_record(recipe_record(name, df), user_id)
+
+@perf.instrumented()
+def save_recipe_record(record: dict, user_id: str = None):
+    # Recipe names are unique per user, so this replaces only this user's recipe of that name
+    user_id = user_id or current_user()
+    get_backend().upsert_recipe(user_id, record)
+    _evict_recipes(user_id, {record['name']})
+
+@perf.instrumented()
+def get_all_recipes(columns: list = RECIPE_COLUMNS, user_id: str = None) -> pd.DataFrame:
+    user_id = user_id or current_user()
+
+    def load():
+        return apply_schema(get_backend().recipes(user_id, columns), columns, RECIPE_DTYPES)
+    return _cached(('recipes', user_id, tuple(columns)), load)
+
+@perf.instrumented()
+def get_recipe(name: str, columns: list = RECIPE_COLUMNS, user_id: str = None) -> pd.DataFrame:
+    # A single recipe (or an empty frame), e.g. to fetch its ingredients_json only when it's opened
+    user_id = user_id or current_user()
+
+    def load():
+        return apply_schema(get_backend().recipes(user_id, columns, name=name), columns, RECIPE_DTYPES)
+    return _cached(('recipe', user_id, name, tuple(columns)), load)
@@ -0,0 +1,60 @@
+import tempfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import database as db
+from transforms import LOG_COLUMNS, MACRO_COLUMNS
+
+# Exports are spooled to memory until they reach this size, then spill to a temp file
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+LOG_PARQUET_SCHEMA = pa.schema(
+    [('id', pa.int64()), ('date', pa.string()), ('food_name', pa.string())]
+    + [(col, pa.float64()) for col in MACRO_COLUMNS]
+)
+
+EXPORT_FORMATS = {
+    'CSV': ('macro_logs.csv', 'text/csv'),
+    'Parquet': ('macro_logs.parquet', 'application/vnd.apache.parquet'),
+}
+
+def write_logs_csv(pages, out):
+    """Writes an iterable of log DataFrames to a binary file object as one CSV."""
+    header = True
+    for page in pages:
+        # Only LOG_COLUMNS, so the header doesn't depend on what else the backend's table has
+        # (e.g. updated_at from sql/replica_sync.sql)
+        out.write(page[LOG_COLUMNS].to_csv(index=False, header=header).encode('utf-8'))
+        header = False
+    return out
+
+def write_logs_parquet(pages, out, compression: str = 'zstd'):
+    """Writes an iterable of log DataFrames to a binary file object as one compressed Parquet file."""
+    writer = None
+    try:
+        for page in pages:
+            # A fixed schema rather than one inferred per page: JSON sends 138.0 as 138, so a
+            # page of whole numbers (or of nulls) would otherwise disagree with the next one
+            table = pa.Table.from_pandas(page[LOG_COLUMNS], schema=LOG_PARQUET_SCHEMA, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out, LOG_PARQUET_SCHEMA, compression=compression)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return out
+
+def export_logs(fmt: str = 'CSV', page_size: int = db.EXPORT_PAGE_SIZE, user_id: str = None):
+    """
+    Streams a user's full log page by page into a file object, ready for st.download_button.
+    Only one page is held in memory at a time.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    pages = db.iter_log_pages(page_size, user_id)
+    if fmt == 'Parquet':
+        write_logs_parquet(pages, out)
+    else:
+        write_logs_csv(pages, out)
+    out.seek(0)
+    return out
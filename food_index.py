@@ -0,0 +1,144 @@
+import heapq
+import math
+import re
+import threading
+import weakref
+from collections import Counter
+from itertools import islice
+
+import pandas as pd
+import streamlit as st
+
+import database as db
+from transforms import MACRO_COLUMNS
+
+# Quick-add search over every food ever logged. Names are broken into per-word trigrams
+# ("  eg", " egg", "egg ", ...) in an inverted index, so a query only touches the postings
+# of its own trigrams: prefixes match from the first character and typos still share
+# most trigrams with the intended name.
+#
+# Common trigrams ("the", "chi") can be in most names, so a search never walks whole
+# postings: it scores at most CANDIDATE_BUDGET names, taken from the query's rarest
+# trigrams first. Postings keep the order names were indexed in, most used first when
+# built from stats, so a short query that runs out of budget still sees the likeliest foods.
+
+# Fraction of the query's trigrams a name must share to count as a match
+MIN_SCORE = 0.5
+# Most names scored per search, keeping a keystroke's work bounded however large the index
+CANDIDATE_BUDGET = 500
+
+_NO_POSTINGS = {}
+
+_WORD_RE = re.compile(r'\w+')
+
+def _normalize(name: str) -> str:
+    return ' '.join(_WORD_RE.findall(str(name).lower()))
+
+def _trigrams(text: str, complete: bool = True) -> set:
+    # Words are padded so the first letters form trigrams of their own. A query's last word
+    # may still be being typed, so it isn't closed off with a trailing space.
+    words = text.split()
+    grams = set()
+    for i, word in enumerate(words):
+        padded = f"  {word} " if complete or i < len(words) - 1 else f"  {word}"
+        grams.update(padded[j:j + 3] for j in range(len(padded) - 2))
+    return grams
+
+class FoodIndex:
+    """
+    Distinct food names with their most recently logged macros and how often they've been
+    logged. Built once from the food_stats view and kept current by add(), which the
+    save listener below calls after every save.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}        # normalized name -> entry id
+        self._entries = []    # entry id -> dict(food_name, macros..., last_date, uses)
+        self._postings = {}   # trigram -> {entry id: None}, in insertion order
+
+    @classmethod
+    def from_stats(cls, stats: pd.DataFrame) -> "FoodIndex":
+        index = cls()
+        stats = stats.sort_values(['uses', 'last_date'], ascending=False)
+        for entry in stats.to_dict('records'):
+            index._upsert(entry['food_name'], entry, str(entry['last_date']), int(entry['uses']))
+        return index
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, rows: pd.DataFrame):
+        # Newly saved log rows: 'date' as 'YYYY-MM-DD' plus food_name and macros
+        for entry in rows.to_dict('records'):
+            self._upsert(entry['food_name'], entry, str(entry['date']), 1)
+
+    def _upsert(self, food_name, values: dict, last_date: str, uses: int):
+        key = _normalize(food_name)
+        if not key:
+            return
+        macros = {col: float(values[col]) for col in MACRO_COLUMNS}
+        with self._lock:
+            entry_id = self._ids.get(key)
+            if entry_id is None:
+                entry_id = self._ids[key] = len(self._entries)
+                self._entries.append({'food_name': str(food_name), **macros, 'last_date': last_date, 'uses': uses})
+                for gram in _trigrams(key):
+                    self._postings.setdefault(gram, {})[entry_id] = None
+                return
+            entry = self._entries[entry_id]
+            entry['uses'] += uses
+            if last_date >= entry['last_date']:
+                entry.update(macros, food_name=str(food_name), last_date=last_date)
+
+    def search(self, query: str, limit: int = 8) -> list:
+        """
+        The best matches for `query` as entry dicts, best first: most trigrams in common,
+        then most often logged, then most recently logged.
+        """
+        grams = _trigrams(_normalize(query), complete=False)
+        if not grams:
+            return []
+        needed = math.ceil(MIN_SCORE * len(grams))
+        with self._lock:
+            postings = sorted((self._postings.get(gram, _NO_POSTINGS) for gram in grams), key=len)
+            # A name with `needed` of the query's trigrams has one of the rarest
+            # len(grams) - needed + 1, so their postings hold every match
+            candidates = {}
+            for posting in postings[:len(grams) - needed + 1]:
+                candidates.update(dict.fromkeys(islice(posting, CANDIDATE_BUDGET - len(candidates))))
+                if len(candidates) >= CANDIDATE_BUDGET:
+                    break
+            counts = Counter()
+            for posting in postings:
+                counts.update(filter(posting.__contains__, candidates))
+            entries = self._entries
+            best = heapq.nlargest(
+                limit,
+                (entry_id for entry_id, count in counts.items() if count >= needed),
+                key=lambda entry_id: (counts[entry_id], entries[entry_id]['uses'], entries[entry_id]['last_date']),
+            )
+            return [dict(entries[entry_id]) for entry_id in best]
+
+# Each user's index while st.cache_resource holds it. Weak, so an index the cache drops is
+# neither kept alive nor updated by the listeners.
+_live = weakref.WeakValueDictionary()
+
+@st.cache_resource(show_spinner="Indexing logged foods...")
+def get_food_index(user_id: str) -> FoodIndex:
+    # One index per user per server process, updated in place by that user's saves
+    index = _live[user_id] = FoodIndex.from_stats(db.get_food_stats(user_id))
+    return index
+
+def _on_save(user_id: str, rows: pd.DataFrame):
+    index = _live.get(user_id)
+    if index is not None:
+        index.add(rows)
+
+def _on_delete(user_id: str, rows: pd.DataFrame):
+    # A deleted row may have been a food's only or latest log, so rebuild on next use
+    if _live.pop(user_id, None) is not None:
+        get_food_index.clear(user_id)
+
+db.add_save_listener(_on_save)
+db.add_delete_listener(_on_delete)
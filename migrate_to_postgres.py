@@ -1,64 +1,187 @@
+"""
+Copies the local SQLite database (macros.db) into Postgres, a chunk at a time.
+
+    python migrate_to_postgres.py                       # URL from .streamlit/secrets.toml
+    python migrate_to_postgres.py --url postgresql://... --chunk-size 20000
+
+Each chunk is read by rowid and written in the same transaction as a checkpoint row in
+the target's migration_progress table, so an interrupted run can simply be rerun: it
+carries on after the last committed chunk instead of inserting rows twice. Postgres
+targets are loaded with COPY; anything else (e.g. a SQLite file, for testing) gets
+batched executemany INSERTs. Needs sqlalchemy, plus psycopg2 or psycopg for Postgres.
+
+The daily_totals rollup isn't copied: once the last chunk is in, it is rebuilt on the
+target from the copied logs (the same result as `python rollup.py rebuild`), so the
+Dashboard and History read correct totals straight away.
+"""
+import argparse
+import csv
+import io
+import os
 import sqlite3
+import sys
+import time
+
 import pandas as pd
-from sqlalchemy import create_engine
-import os
+from sqlalchemy import (BigInteger, Column, Date, Float, Integer, MetaData, String, Table, column, create_engine, delete,
+                        func, insert, select, table, update)
+
+from transforms import MACRO_COLUMNS
+
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+SQLITE_PATH = "macros.db"
+TABLES = ['logs', 'recipes']
+CHUNK_SIZE = 10_000
+
+_metadata = MetaData()
+progress_table = Table(
+    'migration_progress', _metadata,
+    Column('source_table', String(64), primary_key=True),
+    Column('last_rowid', BigInteger, nullable=False),
+    Column('rows_copied', BigInteger, nullable=False),
+)
+# Matches sql/daily_totals.sql; only created here when the target doesn't have it yet
+totals_table = Table(
+    'daily_totals', _metadata,
+    Column('user_id', String, primary_key=True),
+    Column('date', Date, primary_key=True),
+    *[Column(col, Float, nullable=False, default=0) for col in MACRO_COLUMNS],
+    Column('items', Integer, nullable=False, default=0),
+)
+_logs = table('logs', column('user_id'), column('date'), *[column(col) for col in MACRO_COLUMNS])
+
+def read_pg_url(secrets_path: str = SECRETS_PATH) -> str:
+    # Basic parsing for url = "..." so the script doesn't need Streamlit
+    with open(secrets_path, "r") as f:
+        for line in f:
+            if line.strip().startswith('url'):
+                return line.split('=', 1)[1].strip().strip('"').strip("'")
+    return ""
 
-# Read url directly
-secrets_path = os.path.join(".streamlit", "secrets.toml")
-if not os.path.exists(secrets_path):
-    print(f"Cannot find secrets file at {secrets_path}")
-    exit(1)
-
-pg_url = ""
-with open(secrets_path, "r") as f:
-    for line in f:
-        if line.strip().startswith('url'):
-            # Basic parsing for url = "..."
-            pg_url = line.split('=')[1].strip().strip('"').strip("'")
+def _copy_rows(table, conn, keys, data_iter):
+    # pandas to_sql method streaming each chunk through COPY ... FROM STDIN
+    buf = io.StringIO()
+    csv.writer(buf).writerows(data_iter)
+    columns = ', '.join(f'"{key}"' for key in keys)
+    name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+    sql = f'COPY {name} ({columns}) FROM STDIN WITH (FORMAT csv)'
+    with conn.connection.cursor() as cur:
+        if hasattr(cur, 'copy_expert'):  # psycopg2
+            buf.seek(0)
+            cur.copy_expert(sql, buf)
+        else:  # psycopg 3
+            with cur.copy(sql) as copy:
+                copy.write(buf.getvalue())
+
+def _prepare(table: str, chunk: pd.DataFrame) -> pd.DataFrame:
+    # Postgres assigns its own ids, so its sequences stay in step
+    chunk = chunk.drop(columns=['_rowid', 'id'], errors='ignore')
+    if table == 'logs':
+        chunk['date'] = pd.to_datetime(chunk['date']).dt.date
+    return chunk
+
+def _checkpoint(conn, table: str):
+    row = conn.execute(select(progress_table.c.last_rowid, progress_table.c.rows_copied)
+                       .where(progress_table.c.source_table == table)).first()
+    if row is None:
+        conn.execute(insert(progress_table).values(source_table=table, last_rowid=0, rows_copied=0))
+        return 0, 0
+    return row.last_rowid, row.rows_copied
+
+def migrate_table(sqlite_conn, engine, table: str, chunk_size: int = CHUNK_SIZE, report=print) -> int:
+    """
+    Copies the rows of `table` after its checkpoint. Returns how many rows this run copied.
+    """
+    with engine.begin() as conn:
+        last_rowid, copied = _checkpoint(conn, table)
+    remaining = sqlite_conn.execute(f"SELECT COUNT(*) FROM {table} WHERE rowid > ?", (last_rowid,)).fetchone()[0]
+    if last_rowid:
+        report(f"{table}: resuming after {copied:,} rows already copied")
+    if not remaining:
+        report(f"{table}: nothing to copy")
+        return 0
+
+    method = _copy_rows if engine.dialect.name == 'postgresql' else None
+    start = time.perf_counter()
+    done = 0
+    while True:
+        chunk = pd.read_sql_query(f"SELECT rowid AS _rowid, * FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                                  sqlite_conn, params=(last_rowid, chunk_size))
+        if chunk.empty:
             break
+        last_rowid = int(chunk['_rowid'].iloc[-1])
+        with engine.begin() as conn:
+            _prepare(table, chunk).to_sql(table, conn, if_exists='append', index=False, method=method)
+            conn.execute(update(progress_table).where(progress_table.c.source_table == table)
+                         .values(last_rowid=last_rowid, rows_copied=progress_table.c.rows_copied + len(chunk)))
+        done += len(chunk)
+        elapsed = time.perf_counter() - start
+        report(f"{table}: {done:,} / {remaining:,} rows ({done / elapsed:,.0f} rows/s)")
+    return done
+
+def rebuild_daily_totals(engine, report=print) -> int:
+    """
+    Resets the target's daily_totals from its logs. Returns how many days it now holds.
+    """
+    totals_table.create(engine, checkfirst=True)
+    days = (select(_logs.c.user_id, _logs.c.date, *[func.sum(_logs.c[col]) for col in MACRO_COLUMNS], func.count())
+            .group_by(_logs.c.user_id, _logs.c.date))
+    with engine.begin() as conn:
+        conn.execute(delete(totals_table))
+        conn.execute(insert(totals_table).from_select(['user_id', 'date'] + MACRO_COLUMNS + ['items'], days))
+        rebuilt = conn.execute(select(func.count()).select_from(totals_table)).scalar()
+    report(f"daily_totals: rebuilt {rebuilt:,} days from logs")
+    return rebuilt
+
+def migrate(sqlite_conn, engine, tables: list = TABLES, chunk_size: int = CHUNK_SIZE, report=print) -> dict:
+    progress_table.create(engine, checkfirst=True)
+    present = {row[0] for row in sqlite_conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    copied = {}
+    for table in tables:
+        if table not in present:
+            report(f"{table}: not in the SQLite database, skipping")
+            continue
+        copied[table] = migrate_table(sqlite_conn, engine, table, chunk_size, report)
+    # Even when this run copied nothing new: an earlier one may have stopped before this step
+    if 'logs' in copied:
+        rebuild_daily_totals(engine, report)
+    return copied
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copy the local SQLite database into Postgres, resumably.")
+    parser.add_argument('--sqlite', default=SQLITE_PATH, help="SQLite file to copy from")
+    parser.add_argument('--url', help=f"Target database URL (default: 'url' in {SECRETS_PATH})")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.sqlite):
+        print("No local SQLite database found to migrate.")
+        return 0
+    url = args.url
+    if not url:
+        if not os.path.exists(SECRETS_PATH):
+            print(f"Cannot find secrets file at {SECRETS_PATH}")
+            return 1
+        url = read_pg_url()
+        if not url:
+            print("Could not find the 'url' property in the secrets file!")
+            return 1
+        print("Connecting to Postgres using URL found in secrets...")
+
+    engine = create_engine(url)
+    sqlite_conn = sqlite3.connect(args.sqlite)
+    try:
+        start = time.perf_counter()
+        copied = migrate(sqlite_conn, engine, chunk_size=args.chunk_size)
+    except Exception as e:
+        print(f"Migration stopped: {e}\nRerun to carry on from the last completed chunk.")
+        return 1
+    finally:
+        sqlite_conn.close()
+    total = sum(copied.values())
+    elapsed = time.perf_counter() - start
+    print(f"Migration complete! Copied {total:,} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s).")
+    return 0
 
-if not pg_url:
-    print("Could not find the 'url' property in the secrets file!")
-    exit(1)
-
-print(f"Connecting to Postgres using URL found in secrets...")
-pg_engine = create_engine(pg_url)
-
-# SQLite
-sqlite_path = "macros.db"
-if not os.path.exists(sqlite_path):
-    print("No local SQLite database found to migrate.")
-    exit(0)
-
-sqlite_conn = sqlite3.connect(sqlite_path)
-
-print("Migrating logs...")
-try:
-    logs_df = pd.read_sql_query("SELECT * FROM logs", sqlite_conn)
-    if not logs_df.empty:
-        # We drop the ID so that Postgres can assign its own auto-incrementing primary key
-        # since postgres sequences could get out of sync otherwise.
-        if 'id' in logs_df.columns:
-            logs_df = logs_df.drop(columns=['id'])
-        logs_df['date'] = pd.to_datetime(logs_df['date']).dt.date
-        logs_df.to_sql('logs', pg_engine, if_exists='append', index=False)
-        print(f"Successfully migrated {len(logs_df)} logs.")
-    else:
-        print("No logs found to migrate.")
-except Exception as e:
-    print(f"Error migrating logs: {e}")
-
-print("Migrating recipes...")
-try:
-    recipes_df = pd.read_sql_query("SELECT * FROM recipes", sqlite_conn)
-    if not recipes_df.empty:
-        if 'id' in recipes_df.columns:
-            recipes_df = recipes_df.drop(columns=['id'])
-        recipes_df.to_sql('recipes', pg_engine, if_exists='append', index=False)
-        print(f"Successfully migrated {len(recipes_df)} recipes.")
-    else:
-        print("No recipes found to migrate.")
-except Exception as e:
-    print(f"Error migrating recipes: {e}")
-
-print("Migration complete!")
+if __name__ == "__main__":
+    sys.exit(main())
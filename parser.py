@@ -1,53 +1,173 @@
+import codecs
+import io
+import itertools
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import re
 
+COLUMNS = ['food_name', 'calories', 'protein', 'fat', 'carbs', 'fiber']
+NUMERIC_COLUMNS = COLUMNS[1:]
+
+# Parsed rows per batch from iter_gemini_batches, and lines parsed per Arrow pass. Bigger
+# passes amortise the per-call overhead of the compute kernels.
+STREAM_BATCH_ROWS = 1000
+STREAM_CHUNK_LINES = 20_000
+
+# Header-like lines or 'total' lines
+_SKIP_RE = re.compile('food item|calories|total')
+
+# Whitespace that str.split() honours but the batch path leaves to the per-line parser.
+# Lines using only spaces and tabs (plus a trailing \r from CRLF pastes) take the fast path.
+_EXOTIC_WS_RE = (r'[\x{0b}\x{0c}\x{1c}-\x{1f}\x{85}\x{a0}\x{1680}\x{2000}-\x{200a}'
+                 r'\x{2028}\x{2029}\x{202f}\x{205f}\x{3000}]|\r.')
+
+# A plain decimal token, optionally with thousands commas (stripped before conversion).
+# Anything else float() accepts ('nan', '1_000', non-ASCII digits) goes to the per-line parser.
+_NUMBER_RE = r'^[+-]?(?:\d[\d,]*(?:\.[\d,]*)?|\.[\d,]*\d[\d,]*)(?:[eE][+-]?\d+)?$'
+
+def _parse_line(line):
+    """
+    Parses a single stripped line into a row dict, or returns None if it isn't a food row.
+    This is the reference behaviour that parse_gemini_table vectorizes.
+    """
+    # Skip header-like lines or 'total' lines
+    if _SKIP_RE.search(line.lower()):
+        return None
+
+    # Split by whitespace
+    tokens = line.split()
+
+    # We expect at least a food name and 5 numeric values
+    if len(tokens) < 6:
+        return None
+
+    # Try to extract the last 5 tokens as numbers, ignoring commas
+    try:
+        fiber = float(tokens[-1].replace(',', ''))
+        carbs = float(tokens[-2].replace(',', ''))
+        fat = float(tokens[-3].replace(',', ''))
+        protein = float(tokens[-4].replace(',', ''))
+        calories = float(tokens[-5].replace(',', ''))
+    except ValueError:
+        # If the last 5 tokens aren't numbers, this line doesn't match our strict format
+        return None
+
+    # The rest of the tokens make up the food name
+    return {
+        'food_name': ' '.join(tokens[:-5]).strip(),
+        'calories': calories,
+        'protein': protein,
+        'fat': fat,
+        'carbs': carbs,
+        'fiber': fiber
+    }
+
+def _skipped_lines(lower_text, n_lines):
+    # Mask of lines containing a skip word, found with one scan of the whole lower-cased paste
+    skipped = np.zeros(n_lines, dtype=bool)
+    line_no, pos = 0, 0
+    for match in _SKIP_RE.finditer(lower_text):
+        line_no += lower_text.count('\n', pos, match.start())
+        pos = match.start()
+        skipped[line_no] = True
+    return skipped
+
 def parse_gemini_table(text):
     """
     Parses a multi-line text block (e.g. from a Gemini chat) into a Pandas DataFrame.
     It uses a right-to-left heuristic to separate the food name from the 5 trailing numeric values.
     Also ignores headers and rows containing 'total'.
+
+    The whole paste is split and converted column-wise with Arrow compute kernels, producing
+    typed columns without a Python loop per row. Lines the batch path can't reproduce exactly
+    fall back to the per-line parser, so the result is identical to parsing line by line.
     """
-    lines = text.strip().split('\n')
-    parsed_data = []
-    
+    parsed = _parse_lines(text.strip().split('\n'))
+    return parsed if not parsed.empty else pd.DataFrame()
+
+def _parse_lines(lines):
+    # parse_gemini_table over a list of lines; always returns the typed COLUMNS, even if empty
+    # Lower-casing the whole block once finds the same skip words as lower-casing each line
+    candidate = ~_skipped_lines('\n'.join(lines).lower(), len(lines))
+
+    arr = pc.utf8_trim(pa.array(lines, type=pa.string()), characters=' \t\r')
+    exotic = pc.match_substring_regex(arr, _EXOTIC_WS_RE).to_numpy(zero_copy_only=False)
+    fast = candidate & ~exotic
+
+    # The last 5 whitespace-separated tokens plus the rest of the line as the name
+    parts = pc.ascii_split_whitespace(arr, max_splits=5, reverse=True)
+    fast &= pc.equal(pc.list_value_length(parts), 6).to_numpy(zero_copy_only=False)
+    parts = parts.filter(pa.array(fast))
+    fast_idx = np.flatnonzero(fast)
+
+    tokens = [pc.list_element(parts, i) for i in range(6)]
+    numeric = np.ones(len(fast_idx), dtype=bool)
+    for token in tokens[1:]:
+        numeric &= pc.match_substring_regex(token, _NUMBER_RE).to_numpy(zero_copy_only=False)
+    keep = pa.array(numeric)
+
+    # Collapse internal whitespace the way ' '.join(tokens) does, if there is any to collapse
+    names = tokens[0].filter(keep)
+    if pc.any(pc.or_(pc.match_substring(names, '  '), pc.match_substring(names, '\t'))).as_py():
+        names = pc.replace_substring_regex(names, r'[ \t]+', ' ')
+    columns = {'food_name': names.to_numpy(zero_copy_only=False)}
+    for col, token in zip(NUMERIC_COLUMNS, tokens[1:]):
+        columns[col] = pc.cast(pc.replace_substring(token.filter(keep), ',', ''), pa.float64()).to_numpy()
+    parsed = pd.DataFrame(columns, index=fast_idx[numeric])
+
+    # Exotic whitespace, or numbers that aren't plain decimals but may still be valid to float()
+    slow_idx = np.union1d(np.flatnonzero(candidate & exotic), fast_idx[~numeric])
+    fallback_rows = {}
+    for i in slow_idx:
+        row = _parse_line(lines[i].strip())
+        if row:
+            fallback_rows[i] = row
+    if fallback_rows:
+        fallback = pd.DataFrame(list(fallback_rows.values()), index=list(fallback_rows))
+        parsed = pd.concat([parsed, fallback]).sort_index()
+
+    return pd.DataFrame({col: parsed[col].to_numpy(dtype=object if col == 'food_name' else 'float64') for col in COLUMNS})
+
+def _text_lines(source):
+    # Lines without their '\n' from a string, a text or binary file object (e.g. an upload)
+    # or any iterable of str/bytes lines. Bytes are read as UTF-8, with or without a BOM.
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    lines = iter(source)
+    first = next(lines, None)
+    if first is None:
+        return
+    lines = itertools.chain([first], lines)
+    if isinstance(first, bytes):
+        lines = codecs.iterdecode(lines, 'utf-8-sig', errors='replace')
     for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Skip header-like lines or 'total' lines
-        lower_line = line.lower()
-        if 'food item' in lower_line or 'calories' in lower_line or 'total' in lower_line:
-            continue
-            
-        # Split by whitespace
-        tokens = line.split()
-        
-        # We expect at least a food name and 5 numeric values
-        if len(tokens) < 6:
-            continue
-            
-        # Try to extract the last 5 tokens as numbers, ignoring commas
-        try:
-            fiber = float(tokens[-1].replace(',', ''))
-            carbs = float(tokens[-2].replace(',', ''))
-            fat = float(tokens[-3].replace(',', ''))
-            protein = float(tokens[-4].replace(',', ''))
-            calories = float(tokens[-5].replace(',', ''))
-            
-            # The rest of the tokens make up the food name
-            food_name = ' '.join(tokens[:-5]).strip()
-            
-            parsed_data.append({
-                'food_name': food_name,
-                'calories': calories,
-                'protein': protein,
-                'fat': fat,
-                'carbs': carbs,
-                'fiber': fiber
-            })
-        except ValueError:
-            # If the last 5 tokens aren't numbers, this line doesn't match our strict format
+        yield line.rstrip('\n')
+
+def iter_gemini_batches(source, batch_rows: int = STREAM_BATCH_ROWS):
+    """
+    The streaming form of parse_gemini_table, for tables too long to hold as one string:
+    reads `source` (see _text_lines) STREAM_CHUNK_LINES lines at a time and yields
+    DataFrames of exactly batch_rows parsed rows (the last may be shorter), with the same
+    columns, dtypes and rows as parse_gemini_table. Memory is bounded by one chunk of lines
+    plus one batch, however long the input is.
+    """
+    lines = _text_lines(source)
+    chunk_lines = max(batch_rows, STREAM_CHUNK_LINES)
+    carry = None
+    while True:
+        chunk = list(itertools.islice(lines, chunk_lines))
+        if not chunk:
+            break
+        parsed = _parse_lines(chunk)
+        if parsed.empty:
             continue
-            
-    return pd.DataFrame(parsed_data)
+        rows = parsed if carry is None or carry.empty else pd.concat([carry, parsed], ignore_index=True)
+        # Whole batches go out now; the remainder waits for the next chunk's rows
+        full = len(rows) - len(rows) % batch_rows
+        for start in range(0, full, batch_rows):
+            yield rows.iloc[start:start + batch_rows].reset_index(drop=True)
+        carry = rows.iloc[full:]
+    if carry is not None and not carry.empty:
+        yield carry.reset_index(drop=True)
@@ -0,0 +1,123 @@
+import functools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+# Timings for the hot paths: every database.py call, each cache miss's backend fetch and
+# each tab's render. Samples are kept per operation in a process-wide ring buffer, so
+# the numbers cover every session and memory stays flat.
+
+# Most recent samples kept per operation
+WINDOW = 1000
+
+SUMMARY_COLUMNS = ['operation', 'calls', 'p50_ms', 'p95_ms', 'max_ms', 'avg_rows', 'avg_bytes']
+
+_samples = {}  # operation -> deque of (seconds, rows, bytes)
+_lock = threading.Lock()
+
+def _size(value):
+    # (rows, bytes) for a result or payload that has them, otherwise (None, None)
+    if isinstance(value, pd.DataFrame):
+        return len(value), int(value.memory_usage(index=False).sum())
+    if isinstance(value, list):
+        return len(value), None
+    return None, None
+
+def record(operation: str, seconds: float, rows: int = None, nbytes: int = None):
+    with _lock:
+        samples = _samples.get(operation)
+        if samples is None:
+            samples = _samples[operation] = deque(maxlen=WINDOW)
+        samples.append((seconds, rows, nbytes))
+
+class Sample:
+    def __init__(self):
+        self.rows = None
+        self.nbytes = None
+
+    def measure(self, value):
+        # Records the rows/bytes of what the block produced or sent, and passes it through
+        self.rows, self.nbytes = _size(value)
+        return value
+
+@contextmanager
+def timed(operation: str):
+    """
+    Times the block as `operation`. Call .measure(value) on the yielded sample to record
+    the rows and bytes it handled.
+    """
+    sample = Sample()
+    start = time.perf_counter()
+    try:
+        yield sample
+    finally:
+        record(operation, time.perf_counter() - start, sample.rows, sample.nbytes)
+
+def instrumented(operation: str = None):
+    """
+    Decorator timing every call. Rows and bytes come from the returned DataFrame, or for
+    writes from the first DataFrame or list argument.
+    """
+    def decorate(fn):
+        name = operation or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = None
+            try:
+                result = fn(*args, **kwargs)
+                return result
+            finally:
+                # Also when fn raises, e.g. st.rerun() ending a tab's render early
+                seconds = time.perf_counter() - start
+                rows, nbytes = _size(result)
+                if rows is None:
+                    payload = next((a for a in args if isinstance(a, (pd.DataFrame, list))), None)
+                    rows, nbytes = _size(payload)
+                record(name, seconds, rows, nbytes)
+        return wrapper
+    return decorate
+
+def summary() -> pd.DataFrame:
+    """One row per operation: call count, p50/p95/max latency and average rows/bytes."""
+    with _lock:
+        snapshot = {name: list(samples) for name, samples in _samples.items()}
+    rows = []
+    for name, samples in sorted(snapshot.items()):
+        seconds = np.array([s[0] for s in samples]) * 1000
+        counts = [s[1] for s in samples if s[1] is not None]
+        sizes = [s[2] for s in samples if s[2] is not None]
+        rows.append({
+            'operation': name,
+            'calls': len(samples),
+            'p50_ms': float(np.percentile(seconds, 50)),
+            'p95_ms': float(np.percentile(seconds, 95)),
+            'max_ms': float(seconds.max()),
+            'avg_rows': float(np.mean(counts)) if counts else None,
+            'avg_bytes': float(np.mean(sizes)) if sizes else None,
+        })
+    return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+def _records() -> list:
+    # to_json writes missing averages as null rather than NaN
+    return json.loads(summary().to_json(orient='records'))
+
+def dump_json() -> str:
+    return json.dumps({'window': WINDOW, 'operations': _records()}, indent=2)
+
+def log_summary():
+    # One log line with the whole summary, for scraping into capacity-planning notes
+    log.info("perf %s", json.dumps(_records()))
+
+def reset():
+    with _lock:
+        _samples.clear()
@@ -0,0 +1,322 @@
+import logging
+import threading
+import time
+
+import pandas as pd
+
+from storage import _SQLITE_MAX_PARAMS, _UPSERT_RECIPE, SQLiteBackend, StorageBackend
+from transforms import LOG_COLUMNS, MACRO_COLUMNS, RECIPE_COLUMNS
+
+log = logging.getLogger(__name__)
+
+# Offline-first reads: a local SQLite copy of logs and recipes answers every query, and is
+# kept up to date by pulling only what changed in Supabase since the last sync (rows
+# stamped after a high-water mark, plus tombstones for deleted logs; see
+# sql/replica_sync.sql). Writes still go to Supabase first, so a down backend leaves the
+# app readable but read-only. The replica holds every user's rows and answers each user's
+# queries through the same (user_id, ...) indexes as SQLiteBackend.
+
+DEFAULT_SYNC_SECONDS = 30.0
+# Records pulled per request, matching the REST row cap
+SYNC_PAGE_ROWS = 1000
+# Each pass re-reads this far behind the high-water mark. Stamps are taken when a
+# transaction starts, so a row can commit after rows stamped later than it; re-reading
+# the overlap is harmless because merges skip rows the replica already has.
+SYNC_OVERLAP_SECONDS = 60.0
+
+# Remote source -> the column its changes are stamped in, in the order they're pulled.
+# Logs come before their tombstones, so a row deleted mid-sync is still dropped.
+SYNC_SOURCES = {'logs': 'updated_at', 'log_tombstones': 'deleted_at', 'recipes': 'updated_at'}
+
+REPLICA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_state (
+    source TEXT PRIMARY KEY,
+    high_water TEXT,
+    pass_since TEXT,
+    pass_after INTEGER,
+    pass_high TEXT,
+    synced_at TEXT
+);
+"""
+
+# Log and recipe rows as the replica stores them, owner included
+_LOG_ROW_COLUMNS = LOG_COLUMNS[:1] + ['user_id'] + LOG_COLUMNS[1:]
+_RECIPE_ROW_COLUMNS = ['user_id'] + RECIPE_COLUMNS
+
+_UPSERT_LOG = (
+    f"INSERT INTO logs ({', '.join(_LOG_ROW_COLUMNS)}) VALUES ({', '.join(':' + c for c in _LOG_ROW_COLUMNS)}) "
+    f"ON CONFLICT (id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in _LOG_ROW_COLUMNS[1:])}"
+)
+_SAVE_POSITION = (
+    "INSERT INTO sync_state (source, high_water, pass_since, pass_after, pass_high) "
+    "VALUES (:source, :high_water, :pass_since, :pass_after, :pass_high) "
+    "ON CONFLICT (source) DO UPDATE SET high_water = excluded.high_water, pass_since = excluded.pass_since, "
+    "pass_after = excluded.pass_after, pass_high = excluded.pass_high"
+)
+_POSITION_FIELDS = ['high_water', 'pass_since', 'pass_after', 'pass_high']
+
+def _chunks(values: list):
+    for start in range(0, len(values), _SQLITE_MAX_PARAMS):
+        chunk = values[start:start + _SQLITE_MAX_PARAMS]
+        yield chunk, ', '.join('?' * len(chunk))
+
+def _latest_stamp(current, records: list, stamp_column: str) -> str:
+    # Postgres trims trailing zeros from fractional seconds, so compare stamps as times
+    stamps = pd.to_datetime([r[stamp_column] for r in records] + ([current] if current else []),
+                            utc=True, format='ISO8601')
+    return stamps.max().isoformat()
+
+class ReplicaStore(SQLiteBackend):
+    """
+    The local copy: SQLiteBackend's schema plus each source's sync position. A merged
+    page is committed together with its position, so an interrupted sync carries on
+    from the last page instead of starting over. Merges report only what actually changed.
+    """
+
+    def init(self):
+        super().init()
+        with self._lock, self._conn:
+            self._conn.executescript(REPLICA_SCHEMA)
+
+    def sync_position(self, source: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_POSITION_FIELDS)} FROM sync_state WHERE source = ?",
+                                     (source,)).fetchone()
+        return dict(zip(_POSITION_FIELDS, row or [None] * len(_POSITION_FIELDS)))
+
+    def has_synced(self) -> bool:
+        # Whether any pass has ever completed, even one that found nothing
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sync_state WHERE synced_at IS NOT NULL LIMIT 1").fetchone() is not None
+
+    def apply_changes(self, source: str, records: list, position: dict) -> set:
+        # Merges one page of a source's changes and saves the position after it, atomically
+        with self._lock, self._conn:
+            if source == 'logs':
+                changed = self._merge_logs(records)
+            elif source == 'log_tombstones':
+                changed = self._remove_logs([r['id'] for r in records])
+            else:
+                changed = self._merge_recipes(records)
+            self._conn.execute(_SAVE_POSITION, {'source': source, **position})
+        return changed
+
+    def finish_pass(self, source: str, high_water):
+        # The pass is complete: its newest stamp becomes the high-water mark
+        position = {'high_water': high_water, 'pass_since': None, 'pass_after': None, 'pass_high': None}
+        with self._lock, self._conn:
+            self._conn.execute(_SAVE_POSITION, {'source': source, **position})
+            self._conn.execute("UPDATE sync_state SET synced_at = datetime('now') WHERE source = ?", (source,))
+
+    def merge_logs(self, records: list) -> set:
+        with self._lock, self._conn:
+            return self._merge_logs(records)
+
+    def remove_logs(self, log_ids: list) -> set:
+        with self._lock, self._conn:
+            return self._remove_logs(log_ids)
+
+    def merge_recipes(self, records: list) -> set:
+        with self._lock, self._conn:
+            return self._merge_recipes(records)
+
+    def _merge_logs(self, records: list) -> set:
+        # Upserts log records by id. Returns the dates whose rows changed, old and new.
+        rows = [{col: record.get(col) for col in _LOG_ROW_COLUMNS} for record in records]
+        existing = {}
+        for chunk, placeholders in _chunks([int(row['id']) for row in rows]):
+            cursor = self._conn.execute(f"SELECT {', '.join(_LOG_ROW_COLUMNS)} FROM logs WHERE id IN ({placeholders})", chunk)
+            existing.update({values[0]: values for values in cursor.fetchall()})
+        changed = [row for row in rows if existing.get(row['id']) != tuple(row.values())]
+        if not changed:
+            return set()
+        # (user_id, date) pairs, as the rollup is keyed
+        days = {(row['user_id'], row['date']) for row in changed}
+        days |= {existing[row['id']][1:3] for row in changed if row['id'] in existing}
+        self._conn.executemany(_UPSERT_LOG, changed)
+        self._refresh_totals(days)
+        return {day for _, day in days}
+
+    def _remove_logs(self, log_ids: list) -> set:
+        days = set()
+        for chunk, placeholders in _chunks([int(i) for i in log_ids]):
+            cursor = self._conn.execute(f"SELECT DISTINCT user_id, date FROM logs WHERE id IN ({placeholders})", chunk)
+            days.update(cursor.fetchall())
+            self._conn.execute(f"DELETE FROM logs WHERE id IN ({placeholders})", chunk)
+        self._refresh_totals(days)
+        return {day for _, day in days}
+
+    def _merge_recipes(self, records: list) -> set:
+        # Upserts recipes by user and name. Returns the names that changed.
+        rows = [{col: record.get(col) for col in _RECIPE_ROW_COLUMNS} for record in records]
+        existing = {}
+        for chunk, placeholders in _chunks(sorted({row['name'] for row in rows})):
+            cursor = self._conn.execute(f"SELECT {', '.join(_RECIPE_ROW_COLUMNS)} FROM recipes WHERE name IN ({placeholders})",
+                                        chunk)
+            existing.update({values[:2]: values for values in cursor.fetchall()})
+        changed = [row for row in rows if existing.get((row['user_id'], row['name'])) != tuple(row.values())]
+        self._conn.executemany(_UPSERT_RECIPE, changed)
+        return {row['name'] for row in changed}
+
+    def _refresh_totals(self, days: set):
+        # Recomputes the rollup rows for these (user_id, date) pairs from the replica's own logs
+        columns = ', '.join(MACRO_COLUMNS + ['items'])
+        sums = ', '.join(f'SUM({col})' for col in MACRO_COLUMNS)
+        by_user = {}
+        for user_id, day in days:
+            by_user.setdefault(user_id, []).append(day)
+        for user_id, dates in by_user.items():
+            for chunk, placeholders in _chunks(sorted(dates)):
+                condition = f"user_id = ? AND date IN ({placeholders})"
+                self._conn.execute(f"DELETE FROM daily_totals WHERE {condition}", [user_id] + chunk)
+                self._conn.execute(f"INSERT INTO daily_totals (user_id, date, {columns}) "
+                                   f"SELECT user_id, date, {sums}, COUNT(*) FROM logs WHERE {condition} "
+                                   f"GROUP BY user_id, date", [user_id] + chunk)
+
+class ReplicaBackend(StorageBackend):
+    """
+    Serves every read from a ReplicaStore. Once the replica has synced at least once, reads
+    never wait on the network: a replica older than sync_seconds is caught up by a
+    background sync, and on_change(log_dates, recipe_names) is called with whatever that
+    sync changed so cached reads can be evicted. Writes go to the remote backend and are
+    then merged into the replica, so they fail (and are retried by the write queue) while
+    the remote is down.
+    """
+
+    def __init__(self, remote: StorageBackend, local: ReplicaStore, sync_seconds: float = DEFAULT_SYNC_SECONDS,
+                 on_change=None):
+        self.remote = remote
+        self.local = local
+        self.sync_seconds = sync_seconds
+        self.on_change = on_change
+        self._sync_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._last_attempt = None
+        self._syncing = False
+
+    def init(self):
+        self.local.init()
+
+    def available(self) -> bool:
+        # Whether writes can get through; reads work either way
+        return self.remote.available()
+
+    # --- Sync ---
+    def sync(self) -> tuple:
+        """
+        Pulls each source's changes since its high-water mark into the replica. Returns the
+        log dates and recipe names that changed, after passing them to on_change.
+        """
+        with self._sync_lock:
+            with self._state_lock:
+                self._last_attempt = time.monotonic()
+            dates, names = set(), set()
+            for source, stamp_column in SYNC_SOURCES.items():
+                changed = self._pull(source, stamp_column)
+                (names if source == 'recipes' else dates).update(changed)
+        if (dates or names) and self.on_change is not None:
+            self.on_change(dates, names)
+        return dates, names
+
+    def _pull(self, source: str, stamp_column: str) -> set:
+        position = self.local.sync_position(source)
+        if position['pass_after'] is None:
+            # A new pass over everything stamped since the high-water mark, less the overlap
+            since = position['high_water']
+            if since is not None:
+                since = (pd.Timestamp(since) - pd.Timedelta(seconds=SYNC_OVERLAP_SECONDS)).isoformat()
+            position.update(pass_since=since, pass_high=position['high_water'])
+
+        changed = set()
+        while True:
+            records = self.remote.changes(source, stamp_column, position['pass_since'], position['pass_after'],
+                                          SYNC_PAGE_ROWS)
+            if not records:
+                break
+            position['pass_after'] = records[-1]['id']
+            position['pass_high'] = _latest_stamp(position['pass_high'], records, stamp_column)
+            changed |= self.local.apply_changes(source, records, position)
+
+        self.local.finish_pass(source, position['pass_high'])
+        return changed
+
+    def _background_sync(self):
+        try:
+            self.sync()
+        except Exception as e:
+            # The replica keeps serving what it has; the next stale read tries again
+            log.warning("Replica sync failed: %s", e)
+        finally:
+            with self._state_lock:
+                self._syncing = False
+
+    def _ensure_fresh(self):
+        with self._state_lock:
+            stale = self._last_attempt is None or time.monotonic() - self._last_attempt >= self.sync_seconds
+            if not stale or self._syncing:
+                return
+            first = self._last_attempt is None and not self.local.has_synced()
+            self._syncing = not first
+        if first:
+            # An empty replica has nothing to show yet, so the first sync is waited for
+            try:
+                self.sync()
+            except Exception:
+                with self._state_lock:
+                    self._last_attempt = None
+                raise
+        else:
+            threading.Thread(target=self._background_sync, name="replica-sync", daemon=True).start()
+
+    # --- Reads: always from the replica ---
+    def logs_by_date(self, user_id: str, date_str: str, columns: list = LOG_COLUMNS) -> pd.DataFrame:
+        self._ensure_fresh()
+        return self.local.logs_by_date(user_id, date_str, columns)
+
+    def logs_since(self, user_id: str, cutoff: str, columns: list = LOG_COLUMNS) -> pd.DataFrame:
+        self._ensure_fresh()
+        return self.local.logs_since(user_id, cutoff, columns)
+
+    def logs_between(self, user_id: str, start: str, end: str, after_id, limit: int, columns: list = LOG_COLUMNS) -> pd.DataFrame:
+        self._ensure_fresh()
+        return self.local.logs_between(user_id, start, end, after_id, limit, columns)
+
+    def daily_totals_since(self, user_id: str, cutoff: str) -> pd.DataFrame:
+        self._ensure_fresh()
+        return self.local.daily_totals_since(user_id, cutoff)
+
+    def all_daily_totals(self, user_id: str) -> pd.DataFrame:
+        self._ensure_fresh()
+        return self.local.all_daily_totals(user_id)
+
+    def page(self, user_id: str, table: str, key: str, after, limit: int) -> pd.DataFrame:
+        self._ensure_fresh()
+        return self.local.page(user_id, table, key, after, limit)
+
+    def recipes(self, user_id: str, columns: list = RECIPE_COLUMNS, name: str = None) -> pd.DataFrame:
+        self._ensure_fresh()
+        return self.local.recipes(user_id, columns, name)
+
+    def food_stats(self, user_id: str) -> pd.DataFrame:
+        self._ensure_fresh()
+        return self.local.food_stats(user_id)
+
+    # --- Writes: remote first, then straight into the replica ---
+    def insert_logs(self, user_id: str, records: list) -> list:
+        inserted = self.remote.insert_logs(user_id, records)
+        self.local.merge_logs(inserted)
+        return inserted
+
+    def delete_logs(self, user_id: str, log_ids: list) -> pd.DataFrame:
+        deleted = self.remote.delete_logs(user_id, log_ids)
+        if not deleted.empty:
+            self.local.remove_logs(deleted['id'].tolist())
+        return deleted
+
+    def upsert_recipe(self, user_id: str, record: dict):
+        self.remote.upsert_recipe(user_id, record)
+        self.local.merge_recipes([{**record, 'user_id': user_id}])
+
+    def rebuild_daily_totals(self):
+        self.remote.rebuild_daily_totals()
+        self.local.rebuild_daily_totals()
@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+
+import httpx
+
+log = logging.getLogger(__name__)
+
+# Keeps a slow or failing Supabase from stalling every session. Requests use one pooled
+# HTTP client with firm timeouts, transient failures are retried a bounded number of
+# times, and a circuit breaker stops calling the backend at all after repeated failures
+# so reads fall back to the cache straight away instead of each waiting out a timeout.
+
+DEFAULT_TIMEOUT_SECONDS = 10.0
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 3.0
+DEFAULT_MAX_CONNECTIONS = 20
+KEEPALIVE_SECONDS = 60.0
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_BACKOFF_SECONDS = 0.2
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_RESET_SECONDS = 30.0
+
+class BackendUnavailable(ConnectionError):
+    """The backend didn't respond, or its circuit breaker is open."""
+
+# Failures where no response came back. Errors PostgREST answered with (APIError) mean
+# the server is up, so they go straight to the caller.
+TRANSIENT_ERRORS = (httpx.TransportError,)
+# The subset where the request can't have reached the server, so even a non-idempotent
+# write (an insert, a delta RPC) is safe to send again
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+def make_http_client(timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+                     max_connections: int = DEFAULT_MAX_CONNECTIONS) -> httpx.Client:
+    # Shared by every session: keep-alive connections are reused across reruns and threads
+    return httpx.Client(
+        timeout=httpx.Timeout(timeout_seconds, connect=min(timeout_seconds, DEFAULT_CONNECT_TIMEOUT_SECONDS)),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                            keepalive_expiry=KEEPALIVE_SECONDS),
+        follow_redirects=True,
+    )
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After failure_threshold failures in a row it opens and calls
+    fail immediately with BackendUnavailable. After reset_seconds one trial call is let
+    through (half-open); its success closes the breaker and its failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_seconds: float = DEFAULT_RESET_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._clock() - self._opened_at >= self.reset_seconds:
+                return 'half-open'
+            return 'open'
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._clock() - self._opened_at < self.reset_seconds or self._trial_running:
+                raise BackendUnavailable("Backend is unavailable (circuit open)")
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                log.info("Backend is responding again; closing the circuit")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    log.warning("Backend failed %d time(s) in a row; opening the circuit for %.0fs",
+                                self._failures, self.reset_seconds)
+                self._opened_at = self._clock()
+                self._trial_running = False
+
+def call_with_retries(fn, breaker: CircuitBreaker, max_retries: int = DEFAULT_MAX_RETRIES,
+                      backoff_seconds: float = DEFAULT_BACKOFF_SECONDS, idempotent: bool = True, sleep=time.sleep):
+    """
+    Calls fn() through the breaker, retrying transient failures with exponential backoff.
+    Non-idempotent calls are only retried when the request can't have been sent.
+    Raises BackendUnavailable once retries run out or the breaker opens. This is the only
+    retry layer: callers (e.g. the write queue) don't retry on top of it.
+    """
+    retryable = TRANSIENT_ERRORS if idempotent else UNSENT_ERRORS
+    # The breaker counts requests, not attempts: one that fails every retry is one failure
+    breaker.before_call()
+    for attempt in range(max_retries + 1):
+        try:
+            result = fn()
+        except TRANSIENT_ERRORS as e:
+            if attempt == max_retries or not isinstance(e, retryable):
+                breaker.record_failure()
+                raise BackendUnavailable(f"Backend request failed: {e!r}") from e
+            sleep(backoff_seconds * 2 ** attempt)
+        except Exception:
+            # The server answered, so it is up
+            breaker.record_success()
+            raise
+        else:
+            breaker.record_success()
+            return result
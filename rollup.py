@@ -0,0 +1,56 @@
+import argparse
+import sys
+
+import pandas as pd
+
+import database as db
+from transforms import totals_frame
+
+# Incremental float sums drift by rounding error; anything larger is real drift
+TOLERANCE = 1e-6
+
+def _load_totals(table: str, user_id: str) -> pd.DataFrame:
+    pages = list(db.iter_table_pages(table, 'date', user_id=user_id))
+    if not pages:
+        return totals_frame([])
+    return totals_frame(pd.concat(pages, ignore_index=True))
+
+def find_drift(user_id: str = None) -> pd.DataFrame:
+    """
+    Compares a user's daily_totals rollup against daily_log_totals, recomputed from logs.
+    Returns one row per drifting day with expected/actual values side by side.
+    """
+    user_id = user_id or db.current_user()
+    expected = _load_totals('daily_log_totals', user_id).set_index('date')
+    actual = _load_totals('daily_totals', user_id).set_index('date')
+    merged = expected.join(actual, how='outer', lsuffix='_expected', rsuffix='_actual').fillna(0)
+
+    drifted = pd.Series(False, index=merged.index)
+    for col in db.MACRO_COLUMNS + ['items']:
+        drifted |= (merged[f'{col}_expected'] - merged[f'{col}_actual']).abs() > TOLERANCE
+    return merged[drifted].reset_index()
+
+def rebuild():
+    db.get_backend().rebuild_daily_totals()
+    db.clear_cache()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify or rebuild the daily_totals rollup.")
+    parser.add_argument('command', choices=['verify', 'rebuild'])
+    parser.add_argument('--user', help="whose rollup to verify (default: [storage] user_id); rebuild covers everyone")
+    args = parser.parse_args(argv)
+
+    if args.command == 'rebuild':
+        rebuild()
+        print("Rebuilt daily_totals from logs.")
+
+    drift = find_drift(args.user)
+    if drift.empty:
+        print("daily_totals matches logs.")
+        return 0
+    print(f"daily_totals has drifted on {len(drift)} day(s):")
+    print(drift.to_string(index=False))
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import pandas as pd
+from datetime import date
+from functools import partial
+
+import database as db
+from writes import WriteQueue
+
+# How far back the shared snapshot reaches. The Dashboard scrolls and History lists within it.
+SNAPSHOT_DAYS = 90
+
+class LogSnapshot:
+    """
+    The recent log window, loaded with a single query and shared by every tab in a rerun.
+    Rows are indexed by date so per-day lookups inside the window are slices, not queries.
+    Per-day totals come from the precomputed daily_totals rollup for the same window.
+    Dates in both frames are datetime64, so lookups are keyed by pd.Timestamp.
+    Given a write queue, writes it hasn't committed yet are already included.
+    """
+
+    def __init__(self, logs: pd.DataFrame, daily_totals: pd.DataFrame, cutoff: str, pending: WriteQueue = None):
+        self.cutoff = cutoff
+        self._pending = pending
+        self._logs = logs
+        self._rows_by_date = logs.groupby('date').indices if not logs.empty else {}
+        self._daily_totals = daily_totals
+        self._totals_by_date = daily_totals.set_index('date')[db.MACRO_COLUMNS]
+
+    @classmethod
+    def load(cls, days: int = SNAPSHOT_DAYS, pending: WriteQueue = None) -> "LogSnapshot":
+        cutoff = db.recent_cutoff(days)
+        logs, daily_totals = db.fetch_concurrently(partial(db.get_recent_logs, days), partial(db.get_daily_totals, days))
+        if pending is not None:
+            start = date.fromisoformat(cutoff)
+            logs = pending.overlay_logs(logs, start)
+            daily_totals = pending.overlay_daily_totals(daily_totals, start)
+        return cls(logs, daily_totals, cutoff, pending)
+
+    def covers(self, log_date: date) -> bool:
+        return log_date.strftime('%Y-%m-%d') >= self.cutoff
+
+    def daily_totals(self) -> pd.DataFrame:
+        return self._daily_totals.copy()
+
+    def logs_by_date(self, log_date: date) -> pd.DataFrame:
+        # Dates older than the window still need their own query
+        if not self.covers(log_date):
+            return self._outside_window(log_date)
+
+        rows = self._rows_by_date.get(pd.Timestamp(log_date))
+        if rows is None:
+            return self._logs.iloc[0:0].copy()
+        return self._logs.iloc[rows].reset_index(drop=True)
+
+    def totals_for(self, log_date: date) -> dict:
+        if not self.covers(log_date):
+            day = self._outside_window(log_date)
+            if day.empty:
+                return dict.fromkeys(db.MACRO_COLUMNS, 0)
+            return day[db.MACRO_COLUMNS].sum().to_dict()
+        day = pd.Timestamp(log_date)
+        if day not in self._totals_by_date.index:
+            return dict.fromkeys(db.MACRO_COLUMNS, 0)
+        return self._totals_by_date.loc[day].to_dict()
+
+    def _outside_window(self, log_date: date) -> pd.DataFrame:
+        day = db.get_logs_by_date(log_date)
+        if self._pending is not None:
+            day = self._pending.overlay_logs(day, log_date, log_date)
+        return day
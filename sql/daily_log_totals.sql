@@ -0,0 +1,18 @@
+-- One row per user and logged day with the five macro sums.
+-- PostgREST exposes views like tables, so database.get_daily_totals can read it with
+-- .table('daily_log_totals'). Run once in the Supabase SQL editor.
+create or replace view daily_log_totals as
+select
+    user_id,
+    date,
+    sum(calories) as calories,
+    sum(protein)  as protein,
+    sum(fat)      as fat,
+    sum(carbs)    as carbs,
+    sum(fiber)    as fiber,
+    count(*)      as items
+from logs
+group by user_id, date;
+
+-- Reads filter on user_id and date, so make sure that pair is indexed
+create index if not exists logs_user_date_idx on logs (user_id, date);
@@ -0,0 +1,82 @@
+-- Incrementally maintained rollup of daily_log_totals.
+-- Triggers on logs apply each insert and delete to it, and `python rollup.py rebuild`
+-- resets it from logs. Run once in the Supabase SQL editor.
+create table if not exists daily_totals (
+    user_id  text not null,
+    date     date not null,
+    calories double precision not null default 0,
+    protein  double precision not null default 0,
+    fat      double precision not null default 0,
+    carbs    double precision not null default 0,
+    fiber    double precision not null default 0,
+    items    integer not null default 0,
+    primary key (user_id, date)
+);
+
+-- Triggers keep the rollup in step with logs inside the statement that inserts or deletes
+-- the rows, so a crash or failed request can't commit one without the other. They are
+-- statement-level: a batch insert or chunked delete updates each day once.
+drop function if exists apply_daily_totals_deltas(jsonb);
+
+create or replace function apply_log_rows_to_daily_totals()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'INSERT' then
+        insert into daily_totals as t (user_id, date, calories, protein, fat, carbs, fiber, items)
+        select user_id, date,
+               coalesce(sum(calories), 0), coalesce(sum(protein), 0), coalesce(sum(fat), 0),
+               coalesce(sum(carbs), 0), coalesce(sum(fiber), 0), count(*)
+        from new_rows
+        group by user_id, date
+        on conflict (user_id, date) do update set
+            calories = t.calories + excluded.calories,
+            protein  = t.protein  + excluded.protein,
+            fat      = t.fat      + excluded.fat,
+            carbs    = t.carbs    + excluded.carbs,
+            fiber    = t.fiber    + excluded.fiber,
+            items    = t.items    + excluded.items;
+    else
+        update daily_totals as t set
+            calories = t.calories - d.calories,
+            protein  = t.protein  - d.protein,
+            fat      = t.fat      - d.fat,
+            carbs    = t.carbs    - d.carbs,
+            fiber    = t.fiber    - d.fiber,
+            items    = t.items    - d.items
+        from (
+            select user_id, date,
+                   coalesce(sum(calories), 0) as calories, coalesce(sum(protein), 0) as protein,
+                   coalesce(sum(fat), 0) as fat, coalesce(sum(carbs), 0) as carbs,
+                   coalesce(sum(fiber), 0) as fiber, count(*) as items
+            from old_rows
+            group by user_id, date
+        ) as d
+        where t.user_id = d.user_id and t.date = d.date;
+
+        -- Days whose last item was deleted disappear, matching daily_log_totals
+        delete from daily_totals where items <= 0;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists logs_daily_totals_insert on logs;
+create trigger logs_daily_totals_insert after insert on logs
+    referencing new table as new_rows
+    for each statement execute function apply_log_rows_to_daily_totals();
+drop trigger if exists logs_daily_totals_delete on logs;
+create trigger logs_daily_totals_delete after delete on logs
+    referencing old table as old_rows
+    for each statement execute function apply_log_rows_to_daily_totals();
+
+create or replace function rebuild_daily_totals()
+returns void
+language sql
+as $$
+    delete from daily_totals where true;
+    insert into daily_totals (user_id, date, calories, protein, fat, carbs, fiber, items)
+    select user_id, date, calories, protein, fat, carbs, fiber, items
+    from daily_log_totals;
+$$;
@@ -0,0 +1,14 @@
+-- One row per user and distinct food_name with its most recently logged macros and how often it's
+-- been logged. food_index.FoodIndex builds its quick-add search from this instead of
+-- downloading every log row. Run once in the Supabase SQL editor.
+create or replace view food_stats as
+select user_id, food_name, calories, protein, fat, carbs, fiber, last_date, uses
+from (
+    select
+        user_id, food_name, calories, protein, fat, carbs, fiber,
+        date as last_date,
+        count(*) over (partition by user_id, food_name) as uses,
+        row_number() over (partition by user_id, food_name order by date desc, id desc) as recency
+    from logs
+) ranked
+where recency = 1;
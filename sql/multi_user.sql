@@ -0,0 +1,21 @@
+-- Partitions logs, recipes and the daily_totals rollup by user (database.current_user()).
+-- Existing rows belong to 'default', the user a deployment without sign-in reads and
+-- writes as. Run once in the Supabase SQL editor, then re-run daily_log_totals.sql,
+-- food_stats.sql and daily_totals.sql for their per-user forms.
+alter table logs add column if not exists user_id text not null default 'default';
+alter table recipes add column if not exists user_id text not null default 'default';
+
+-- Every per-user read is a range scan of one of these, however many users share the table
+create index if not exists logs_user_date_idx on logs (user_id, date);
+create index if not exists logs_user_id_idx on logs (user_id, id);
+drop index if exists logs_date_idx;
+
+-- Recipe names only need to be unique per user; save_recipe upserts on (user_id, name)
+alter table recipes drop constraint if exists recipes_name_key;
+alter table recipes add constraint recipes_user_name_key unique (user_id, name);
+
+-- The rollup is keyed by (user_id, date); daily_totals.sql recreates it and its functions,
+-- then `python rollup.py rebuild` fills it
+drop table if exists daily_totals;
+drop view if exists daily_log_totals;
+drop view if exists food_stats;
@@ -0,0 +1,50 @@
+-- Change tracking for replica.py's delta sync: an updated_at stamp on logs and recipes, and
+-- a tombstone for every deleted log so replicas can drop it too. Replicas ask for rows
+-- stamped since their high-water mark. Run once in the Supabase SQL editor.
+alter table logs add column if not exists updated_at timestamptz not null default now();
+alter table recipes add column if not exists updated_at timestamptz not null default now();
+create index if not exists logs_updated_at_idx on logs (updated_at, id);
+create index if not exists recipes_updated_at_idx on recipes (updated_at, id);
+
+create or replace function touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists logs_touch_updated_at on logs;
+create trigger logs_touch_updated_at before update on logs
+    for each row execute function touch_updated_at();
+drop trigger if exists recipes_touch_updated_at on recipes;
+create trigger recipes_touch_updated_at before update on recipes
+    for each row execute function touch_updated_at();
+
+create table if not exists log_tombstones (
+    id         bigint primary key,
+    date       date not null,
+    deleted_at timestamptz not null default now()
+);
+create index if not exists log_tombstones_deleted_at_idx on log_tombstones (deleted_at, id);
+
+-- Every delete, including database.delete_logs' chunked ones, leaves a tombstone
+create or replace function record_log_tombstone()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into log_tombstones (id, date) values (old.id, old.date) on conflict (id) do nothing;
+    return old;
+end;
+$$;
+
+drop trigger if exists logs_record_tombstone on logs;
+create trigger logs_record_tombstone after delete on logs
+    for each row execute function record_log_tombstone();
+
+-- Tombstones only need to outlive the longest a replica goes without syncing. A replica
+-- offline for longer should be deleted and resynced from scratch. Prune them now and then:
+--   delete from log_tombstones where deleted_at < now() - interval '90 days';
@@ -0,0 +1,466 @@
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+import pandas as pd
+from postgrest.exceptions import APIError
+
+from resilience import DEFAULT_BACKOFF_SECONDS, DEFAULT_MAX_RETRIES, CircuitBreaker, call_with_retries
+from transforms import (FOOD_STATS_COLUMNS, LOG_COLUMNS, MACRO_COLUMNS, RECIPE_COLUMNS, TOTALS_COLUMNS, combine_food_stats,
+                        food_stats, sum_by_date, totals_frame)
+
+# Owner of rows written before storage was partitioned by user, and of every row in a
+# single-user deployment
+DEFAULT_USER = 'default'
+
+# Everything but the generated id, plus the owner
+_INSERT_COLUMNS = ['user_id'] + LOG_COLUMNS[1:]
+
+# Supabase REST caps responses at 1000 rows by default
+_PAGE_SIZE = 1000
+
+# Keep PostgREST requests inside the gateway's limits: insert bodies well under its body
+# size cap, and `id=in.(...)` delete filters well under the usual 8 KB URL limit
+_MAX_INSERT_ROWS = 1000
+_MAX_INSERT_BYTES = 512 * 1024
+_MAX_DELETE_IDS = 300
+
+def _payload_batches(records: list, max_rows: int, max_bytes: int):
+    # Splits records into lists of at most max_rows whose JSON array stays under max_bytes
+    batch, size = [], 2
+    for record in records:
+        # Each record plus its ', ' separator
+        record_size = len(json.dumps(record, default=str)) + 2
+        if batch and (len(batch) >= max_rows or size + record_size > max_bytes):
+            yield batch
+            batch, size = [], 2
+        batch.append(record)
+        size += record_size
+    if batch:
+        yield batch
+
+class StorageBackend(ABC):
+    """
+    Raw storage operations behind the database.py API. Dates are 'YYYY-MM-DD' strings and
+    results are DataFrames; caching, eviction and dtypes all happen in database.py.
+    insert_logs and delete_logs keep the daily_totals rollup in step in the same
+    transaction as the rows, so the two can't drift apart.
+    Reads take the list of columns to fetch so nothing a view doesn't use crosses the wire.
+    Every logs/recipes/rollup operation is scoped to one user_id, and only ever touches
+    that user's rows through a (user_id, ...) index.
+    """
+
+    def init(self):
+        pass
+
+    def available(self) -> bool:
+        # False while the backend is known to be down, so reads should come from the cache
+        return True
+
+    @abstractmethod
+    def insert_logs(self, user_id: str, records: list) -> list:
+        # Returns the inserted records, ids included
+        ...
+
+    @abstractmethod
+    def logs_by_date(self, user_id: str, date_str: str, columns: list = LOG_COLUMNS) -> pd.DataFrame:
+        ...
+
+    @abstractmethod
+    def logs_since(self, user_id: str, cutoff: str, columns: list = LOG_COLUMNS) -> pd.DataFrame:
+        ...
+
+    @abstractmethod
+    def logs_between(self, user_id: str, start: str, end: str, after_id, limit: int, columns: list = LOG_COLUMNS) -> pd.DataFrame:
+        # Up to `limit` logs dated start..end (inclusive) with id > after_id, ordered by id
+        ...
+
+    @abstractmethod
+    def daily_totals_since(self, user_id: str, cutoff: str) -> pd.DataFrame:
+        ...
+
+    @abstractmethod
+    def all_daily_totals(self, user_id: str) -> pd.DataFrame:
+        # TOTALS_COLUMNS for every logged day, ordered by date
+        ...
+
+    @abstractmethod
+    def page(self, user_id: str, table: str, key: str, after, limit: int) -> pd.DataFrame:
+        # Up to `limit` rows of a table/view with key > after (or from the start), ordered by key
+        ...
+
+    def changes(self, table: str, stamp_column: str, since, after_id, limit: int) -> list:
+        # Up to `limit` records stamped at or after `since` (all of them if None) with
+        # id > after_id (or from the start), ordered by id; for replica.py's delta sync.
+        # Not scoped to a user: a replica copies every user's rows. Only backends a
+        # replica pulls from implement it.
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_logs(self, user_id: str, log_ids: list) -> pd.DataFrame:
+        # Returns the deleted rows
+        ...
+
+    @abstractmethod
+    def upsert_recipe(self, user_id: str, record: dict):
+        ...
+
+    @abstractmethod
+    def recipes(self, user_id: str, columns: list = RECIPE_COLUMNS, name: str = None) -> pd.DataFrame:
+        # Every recipe, or just the one called `name`
+        ...
+
+    @abstractmethod
+    def food_stats(self, user_id: str) -> pd.DataFrame:
+        # FOOD_STATS_COLUMNS for every distinct food_name in logs
+        ...
+
+    @abstractmethod
+    def rebuild_daily_totals(self):
+        ...
+
+class SupabaseBackend(StorageBackend):
+    """
+    Supabase over PostgREST. Tables, views, RPCs and triggers are created by hand from sql/;
+    the triggers in sql/daily_totals.sql update the rollup inside each insert or delete.
+    """
+
+    def __init__(self, client, breaker: CircuitBreaker = None, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_seconds: float = DEFAULT_BACKOFF_SECONDS):
+        self.client = client
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+    def available(self) -> bool:
+        return self.breaker.state != 'open'
+
+    def _execute(self, query, idempotent: bool = True):
+        # Every request goes through the breaker, with bounded retries (see resilience.py)
+        return call_with_retries(query.execute, self.breaker, self.max_retries, self.backoff_seconds, idempotent)
+
+    def insert_logs(self, user_id: str, records: list) -> list:
+        # One request per size-capped batch; the app's own saves always fit in one.
+        # Returns the inserted records as PostgREST sends them back, ids included.
+        records = [{**record, 'user_id': user_id} for record in records]
+        inserted = []
+        for batch in _payload_batches(records, _MAX_INSERT_ROWS, _MAX_INSERT_BYTES):
+            inserted.extend(self._execute(self.client.table('logs').insert(batch), idempotent=False).data or [])
+        return inserted
+
+    def logs_by_date(self, user_id: str, date_str: str, columns: list = LOG_COLUMNS) -> pd.DataFrame:
+        response = self._execute(self.client.table('logs').select(",".join(columns))
+                                 .eq("user_id", user_id).eq("date", date_str))
+        return pd.DataFrame(response.data, columns=columns)
+
+    def logs_since(self, user_id: str, cutoff: str, columns: list = LOG_COLUMNS) -> pd.DataFrame:
+        response = self._execute(self.client.table('logs').select(",".join(columns))
+                                 .eq("user_id", user_id).gte("date", cutoff))
+        return pd.DataFrame(response.data, columns=columns)
+
+    def logs_between(self, user_id: str, start: str, end: str, after_id, limit: int, columns: list = LOG_COLUMNS) -> pd.DataFrame:
+        query = (self.client.table('logs').select(",".join(columns)).eq("user_id", user_id)
+                 .gte("date", start).lte("date", end).order("id").limit(limit))
+        if after_id is not None:
+            query = query.gt("id", after_id)
+        return pd.DataFrame(self._execute(query).data, columns=columns)
+
+    def daily_totals_since(self, user_id: str, cutoff: str) -> pd.DataFrame:
+        # Prefer the rollup, then the view, then aggregate raw rows if neither is installed
+        for source in ('daily_totals', 'daily_log_totals'):
+            try:
+                response = self._execute(self.client.table(source).select(",".join(TOTALS_COLUMNS))
+                                         .eq("user_id", user_id).gte("date", cutoff).order("date"))
+                return totals_frame(response.data)
+            except APIError:
+                continue
+        return sum_by_date(self.logs_since(user_id, cutoff)).sort_values('date', ignore_index=True)
+
+    def all_daily_totals(self, user_id: str) -> pd.DataFrame:
+        # Page through the rollup or the view, or fold every log page locally if neither is installed
+        for source in ('daily_totals', 'daily_log_totals'):
+            try:
+                pages = [totals_frame(page[TOTALS_COLUMNS]) for page in self._pages(user_id, source, 'date')]
+            except APIError:
+                continue
+            return pd.concat(pages, ignore_index=True) if pages else totals_frame([])
+        pages = [sum_by_date(page) for page in self._pages(user_id, 'logs', 'id')]
+        if not pages:
+            return totals_frame([])
+        # A day's logs can span pages, so add up the per-page totals
+        return pd.concat(pages, ignore_index=True).groupby('date', as_index=False).sum()
+
+    def page(self, user_id: str, table: str, key: str, after, limit: int) -> pd.DataFrame:
+        query = self.client.table(table).select("*").eq("user_id", user_id).order(key).limit(limit)
+        if after is not None:
+            query = query.gt(key, after)
+        return pd.DataFrame(self._execute(query).data)
+
+    def changes(self, table: str, stamp_column: str, since, after_id, limit: int) -> list:
+        query = self.client.table(table).select("*").order("id").limit(limit)
+        if since is not None:
+            query = query.gte(stamp_column, since)
+        if after_id is not None:
+            query = query.gt("id", after_id)
+        return self._execute(query).data
+
+    def delete_logs(self, user_id: str, log_ids: list) -> pd.DataFrame:
+        # Supabase REST 'in_' filter takes a list, which goes in the URL, so send it in chunks.
+        # The deleted rows come back in each response.
+        deleted = []
+        for start in range(0, len(log_ids), _MAX_DELETE_IDS):
+            response = self._execute(self.client.table('logs').delete().eq("user_id", user_id)
+                                     .in_("id", log_ids[start:start + _MAX_DELETE_IDS]))
+            deleted.extend(response.data)
+        return pd.DataFrame(deleted)
+
+    def upsert_recipe(self, user_id: str, record: dict):
+        # Supabase 'upsert' works on unique constraints (each user's recipe names are unique)
+        self._execute(self.client.table('recipes').upsert({**record, 'user_id': user_id}, on_conflict='user_id,name'))
+
+    def recipes(self, user_id: str, columns: list = RECIPE_COLUMNS, name: str = None) -> pd.DataFrame:
+        query = self.client.table('recipes').select(",".join(columns)).eq("user_id", user_id)
+        if name is not None:
+            query = query.eq("name", name)
+        response = self._execute(query)
+        return pd.DataFrame(response.data, columns=columns)
+
+    def food_stats(self, user_id: str) -> pd.DataFrame:
+        # Page through the food_stats view, or fold every log page locally if it isn't installed
+        try:
+            pages = [page[FOOD_STATS_COLUMNS] for page in self._pages(user_id, 'food_stats', 'food_name')]
+        except APIError:
+            pages = [food_stats(page) for page in self._pages(user_id, 'logs', 'id')]
+            return combine_food_stats(pages) if pages else pd.DataFrame(columns=FOOD_STATS_COLUMNS)
+        return pd.concat(pages, ignore_index=True) if pages else pd.DataFrame(columns=FOOD_STATS_COLUMNS)
+
+    def _pages(self, user_id: str, table: str, key: str):
+        after = None
+        while True:
+            page = self.page(user_id, table, key, after, _PAGE_SIZE)
+            if page.empty:
+                return
+            yield page
+            after = page[key].iloc[-1:].tolist()[0]
+
+    def rebuild_daily_totals(self):
+        self._execute(self.client.rpc('rebuild_daily_totals', {}))
+
+# --- SQLite ---
+# Same schema as the original macros.db, plus the owner column and the rollup table and
+# views from sql/. Every per-user query is a range scan of a (user_id, ...) index.
+SQLITE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER}',
+    date TEXT NOT NULL,
+    food_name TEXT,
+    calories REAL, protein REAL, fat REAL, carbs REAL, fiber REAL
+);
+CREATE INDEX IF NOT EXISTS logs_user_date_idx ON logs (user_id, date);
+CREATE INDEX IF NOT EXISTS logs_user_id_idx ON logs (user_id, id);
+
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER}',
+    name TEXT NOT NULL,
+    ingredients_json TEXT,
+    calories REAL, protein REAL, fat REAL, carbs REAL, fiber REAL,
+    UNIQUE (user_id, name)
+);
+
+CREATE TABLE IF NOT EXISTS daily_totals (
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    {', '.join(f'{col} REAL NOT NULL DEFAULT 0' for col in MACRO_COLUMNS)},
+    items INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, date)
+);
+
+CREATE VIEW IF NOT EXISTS daily_log_totals AS
+SELECT user_id, date, {', '.join(f'SUM({col}) AS {col}' for col in MACRO_COLUMNS)}, COUNT(*) AS items
+FROM logs GROUP BY user_id, date;
+
+CREATE VIEW IF NOT EXISTS food_stats AS
+SELECT user_id, {', '.join(FOOD_STATS_COLUMNS)} FROM (
+    SELECT user_id, food_name, {', '.join(MACRO_COLUMNS)}, date AS last_date,
+           COUNT(*) OVER (PARTITION BY user_id, food_name) AS uses,
+           ROW_NUMBER() OVER (PARTITION BY user_id, food_name ORDER BY date DESC, id DESC) AS recency
+    FROM logs
+) WHERE recency = 1;
+"""
+
+# Files from before storage was partitioned by user: existing rows go to DEFAULT_USER, and
+# recipes, the rollup and the views are re-keyed by user. SQLITE_SCHEMA recreates what
+# _START_MULTI_USER drops, then _FINISH_MULTI_USER copies the recipes back and refills the rollup.
+_START_MULTI_USER = f"""
+ALTER TABLE logs ADD COLUMN user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER}';
+DROP INDEX IF EXISTS logs_date_idx;
+ALTER TABLE recipes RENAME TO recipes_single_user;
+DROP TABLE IF EXISTS daily_totals;
+DROP VIEW IF EXISTS daily_log_totals;
+DROP VIEW IF EXISTS food_stats;
+"""
+_FINISH_MULTI_USER = f"""
+INSERT INTO recipes ({', '.join(RECIPE_COLUMNS)}) SELECT {', '.join(RECIPE_COLUMNS)} FROM recipes_single_user;
+DROP TABLE recipes_single_user;
+INSERT INTO daily_totals (user_id, date, {', '.join(MACRO_COLUMNS)}, items)
+SELECT user_id, date, {', '.join(MACRO_COLUMNS)}, items FROM daily_log_totals;
+"""
+
+# Statements are parameterised constants so sqlite3's statement cache reuses the prepared form
+# (one cached statement per projection).
+_INSERT_LOG = f"INSERT INTO logs ({', '.join(_INSERT_COLUMNS)}) VALUES ({', '.join(':' + c for c in _INSERT_COLUMNS)}) RETURNING *"
+_SELECT_LOGS_BY_DATE = "SELECT {columns} FROM logs WHERE user_id = ? AND date = ?"
+_SELECT_LOGS_SINCE = "SELECT {columns} FROM logs WHERE user_id = ? AND date >= ?"
+_SELECT_LOGS_BETWEEN = "SELECT {columns} FROM logs WHERE user_id = ? AND date BETWEEN ? AND ? AND id > ? ORDER BY id LIMIT ?"
+_SELECT_TOTALS_SINCE = f"SELECT {', '.join(TOTALS_COLUMNS)} FROM daily_totals WHERE user_id = ? AND date >= ? ORDER BY date"
+_SELECT_ALL_TOTALS = f"SELECT {', '.join(TOTALS_COLUMNS)} FROM daily_totals WHERE user_id = ? ORDER BY date"
+_RECIPE_ROW_COLUMNS = ['user_id'] + RECIPE_COLUMNS
+_UPSERT_RECIPE = (
+    f"INSERT INTO recipes ({', '.join(_RECIPE_ROW_COLUMNS)}) VALUES ({', '.join(':' + c for c in _RECIPE_ROW_COLUMNS)}) "
+    f"ON CONFLICT (user_id, name) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in RECIPE_COLUMNS[1:])}"
+)
+_SELECT_RECIPES = "SELECT {columns} FROM recipes WHERE user_id = ?"
+_SELECT_RECIPE = "SELECT {columns} FROM recipes WHERE user_id = ? AND name = ?"
+_SELECT_FOOD_STATS = f"SELECT {', '.join(FOOD_STATS_COLUMNS)} FROM food_stats WHERE user_id = ?"
+_APPLY_DELTA = (
+    f"INSERT INTO daily_totals (user_id, date, {', '.join(MACRO_COLUMNS)}, items) "
+    f"VALUES (:user_id, :date, {', '.join(':' + c for c in MACRO_COLUMNS)}, :items) "
+    f"ON CONFLICT (user_id, date) DO UPDATE SET "
+    + ', '.join(f'{c} = {c} + excluded.{c}' for c in MACRO_COLUMNS + ['items'])
+)
+_DROP_EMPTY_DAYS = "DELETE FROM daily_totals WHERE items <= 0"
+_PAGEABLE = {('logs', 'id'), ('daily_totals', 'date'), ('daily_log_totals', 'date'), ('food_stats', 'food_name')}
+_SELECTABLE = {'logs': set(LOG_COLUMNS), 'recipes': set(RECIPE_COLUMNS) | {'id'}}
+
+def _daily_deltas(user_id: str, records: list, sign: int = 1) -> list:
+    # The rollup change from inserting (sign 1) or deleting (sign -1) these log records
+    deltas = {}
+    for record in records:
+        delta = deltas.get(record['date'])
+        if delta is None:
+            delta = deltas[record['date']] = {'user_id': user_id, 'date': record['date'],
+                                              **dict.fromkeys(MACRO_COLUMNS, 0.0), 'items': 0}
+        for col in MACRO_COLUMNS:
+            delta[col] += sign * (record[col] or 0.0)
+        delta['items'] += sign
+    return list(deltas.values())
+
+def _select_list(table: str, columns: list) -> str:
+    # Column names are interpolated, so only allow ones the schema defines
+    unknown = set(columns) - _SELECTABLE[table]
+    if unknown:
+        raise ValueError(f"Unknown {table} columns: {sorted(unknown)}")
+    return ', '.join(columns)
+
+# Stay under SQLITE_MAX_VARIABLE_NUMBER on older builds (999)
+_SQLITE_MAX_PARAMS = 500
+
+class SQLiteBackend(StorageBackend):
+    """
+    A local SQLite file in WAL mode, for local and test deployments with no network.
+    One connection is shared across Streamlit's script threads behind a lock; queries
+    are sub-millisecond so serialising them costs nothing noticeable.
+    """
+
+    def __init__(self, path: str = "macros.db"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+
+    def _query(self, sql: str, params=()) -> pd.DataFrame:
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            rows = cursor.fetchall()
+        return pd.DataFrame.from_records(rows, columns=[d[0] for d in cursor.description])
+
+    def init(self):
+        with self._lock, self._conn:
+            log_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(logs)")}
+            if log_columns and 'user_id' not in log_columns:
+                # All or nothing, so an interrupted upgrade is simply redone next time
+                self._conn.executescript(f"BEGIN; {_START_MULTI_USER} {SQLITE_SCHEMA} {_FINISH_MULTI_USER} COMMIT;")
+            else:
+                self._conn.executescript(SQLITE_SCHEMA)
+
+    def insert_logs(self, user_id: str, records: list) -> list:
+        # executemany can't return rows, so each insert hands back its own via RETURNING
+        rows = [{'user_id': user_id, **{col: record.get(col) for col in LOG_COLUMNS[1:]}} for record in records]
+        inserted = []
+        with self._lock, self._conn:
+            for row in rows:
+                cursor = self._conn.execute(_INSERT_LOG, row)
+                inserted.append(dict(zip([d[0] for d in cursor.description], cursor.fetchone())))
+            self._apply_deltas(_daily_deltas(user_id, rows))
+        return inserted
+
+    def logs_by_date(self, user_id: str, date_str: str, columns: list = LOG_COLUMNS) -> pd.DataFrame:
+        return self._query(_SELECT_LOGS_BY_DATE.format(columns=_select_list('logs', columns)), (user_id, date_str))
+
+    def logs_since(self, user_id: str, cutoff: str, columns: list = LOG_COLUMNS) -> pd.DataFrame:
+        return self._query(_SELECT_LOGS_SINCE.format(columns=_select_list('logs', columns)), (user_id, cutoff))
+
+    def logs_between(self, user_id: str, start: str, end: str, after_id, limit: int, columns: list = LOG_COLUMNS) -> pd.DataFrame:
+        sql = _SELECT_LOGS_BETWEEN.format(columns=_select_list('logs', columns))
+        return self._query(sql, (user_id, start, end, after_id if after_id is not None else 0, limit))
+
+    def daily_totals_since(self, user_id: str, cutoff: str) -> pd.DataFrame:
+        return totals_frame(self._query(_SELECT_TOTALS_SINCE, (user_id, cutoff)))
+
+    def all_daily_totals(self, user_id: str) -> pd.DataFrame:
+        return totals_frame(self._query(_SELECT_ALL_TOTALS, (user_id,)))
+
+    def page(self, user_id: str, table: str, key: str, after, limit: int) -> pd.DataFrame:
+        # Table and key are interpolated, so only allow the known (indexed) combinations
+        if (table, key) not in _PAGEABLE:
+            raise ValueError(f"Can't page {table} by {key}")
+        if after is None:
+            return self._query(f"SELECT * FROM {table} WHERE user_id = ? ORDER BY {key} LIMIT ?", (user_id, limit))
+        return self._query(f"SELECT * FROM {table} WHERE user_id = ? AND {key} > ? ORDER BY {key} LIMIT ?",
+                           (user_id, after, limit))
+
+    def delete_logs(self, user_id: str, log_ids: list) -> pd.DataFrame:
+        deleted = []
+        with self._lock, self._conn:
+            for start in range(0, len(log_ids), _SQLITE_MAX_PARAMS):
+                chunk = log_ids[start:start + _SQLITE_MAX_PARAMS]
+                condition = f"user_id = ? AND id IN ({', '.join('?' * len(chunk))})"
+                cursor = self._conn.execute(f"SELECT * FROM logs WHERE {condition}", [user_id] + chunk)
+                columns = [d[0] for d in cursor.description]
+                deleted.extend(cursor.fetchall())
+                self._conn.execute(f"DELETE FROM logs WHERE {condition}", [user_id] + chunk)
+            if deleted:
+                self._apply_deltas(_daily_deltas(user_id, [dict(zip(columns, row)) for row in deleted], sign=-1))
+        if not deleted:
+            return pd.DataFrame()
+        return pd.DataFrame.from_records(deleted, columns=columns)
+
+    def upsert_recipe(self, user_id: str, record: dict):
+        with self._lock, self._conn:
+            self._conn.execute(_UPSERT_RECIPE, {'user_id': user_id, **{col: record.get(col) for col in RECIPE_COLUMNS}})
+
+    def recipes(self, user_id: str, columns: list = RECIPE_COLUMNS, name: str = None) -> pd.DataFrame:
+        if name is not None:
+            return self._query(_SELECT_RECIPE.format(columns=_select_list('recipes', columns)), (user_id, name))
+        return self._query(_SELECT_RECIPES.format(columns=_select_list('recipes', columns)), (user_id,))
+
+    def food_stats(self, user_id: str) -> pd.DataFrame:
+        return self._query(_SELECT_FOOD_STATS, (user_id,))
+
+    def _apply_deltas(self, deltas: list):
+        # Inside the caller's transaction
+        self._conn.executemany(_APPLY_DELTA, deltas)
+        self._conn.execute(_DROP_EMPTY_DAYS)
+
+    def rebuild_daily_totals(self):
+        # Every user's rollup at once
+        columns = ', '.join(['user_id', 'date'] + MACRO_COLUMNS + ['items'])
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM daily_totals")
+            self._conn.execute(f"INSERT INTO daily_totals ({columns}) SELECT {columns} FROM daily_log_totals")
@@ -0,0 +1,56 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from analytics import HistoryAnalytics, daily_view, streaks
+from transforms import MACRO_COLUMNS, TOTALS_COLUMNS
+
+def make_totals(days: int, seed: int = 0) -> pd.DataFrame:
+    # A daily totals frame with random gaps, like a real history
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2021-01-01', periods=days * 2, freq='D')
+    dates = dates[np.sort(rng.choice(len(dates), days, replace=False))]
+    frame = pd.DataFrame({col: rng.uniform(0, 200, days).round(1) for col in MACRO_COLUMNS})
+    frame['calories'] = rng.uniform(1200, 2800, days).round()
+    frame.insert(0, 'date', dates)
+    frame['items'] = rng.integers(1, 8, days)
+    return frame[TOTALS_COLUMNS]
+
+def test_rolling_means_match_pandas():
+    totals = make_totals(300)
+    view = daily_view(totals)
+    for window in (7, 28):
+        expected = totals.set_index('date')[MACRO_COLUMNS].rolling(f'{window}D').mean()
+        for col in MACRO_COLUMNS:
+            np.testing.assert_allclose(view[f'{col}_{window}d'], expected[col])
+
+def test_streaks():
+    totals = pd.DataFrame({
+        'date': pd.to_datetime(['2024-03-01', '2024-03-02', '2024-03-03', '2024-03-05', '2024-03-06']),
+        'calories': [2000.0, 2000.0, 3000.0, 2050.0, 1950.0],
+        'items': [1, 2, 1, 1, 3],
+    })
+    result = streaks(totals, today=date(2024, 3, 7))
+    assert result == {'current': 2, 'longest': 3,
+                      'longest_start': date(2024, 3, 1), 'longest_end': date(2024, 3, 3)}
+
+    # 3000 kcal is off a 2000 kcal goal, which splits the first run; nothing logged for two days ends the current one
+    result = streaks(totals, calorie_goal=2000, today=date(2024, 3, 8))
+    assert result['current'] == 0
+    assert result['longest'] == 2
+
+def test_update_matches_full_recompute():
+    totals = make_totals(400)
+    analytics = HistoryAnalytics(totals)
+
+    edited = totals.copy()
+    edited.loc[150, 'protein'] += 25
+    new_day = edited.iloc[[-1]].assign(date=edited['date'].iloc[-1] + pd.Timedelta(days=1))
+    for changed in (edited, pd.concat([edited, new_day], ignore_index=True), totals.drop(index=390)):
+        updated = analytics.update(changed)
+        full = HistoryAnalytics(changed)
+        for name in ('daily', 'weekly', 'monthly'):
+            pd.testing.assert_frame_equal(getattr(updated, name), getattr(full, name))
+
+    assert analytics.update(totals.copy()) is analytics
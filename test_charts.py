@@ -0,0 +1,38 @@
+import json
+import pandas as pd
+import plotly.io as pio
+from charts import build_dashboard_figure, dashboard_figure, data_version
+
+DAILY = pd.DataFrame({
+    'date': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-08']),
+    'calories': [224.0, 0.0, 200.0],
+    'protein': [15.6, 0.0, 10.0],
+    'fat': [10.5, 0.0, 5.0],
+    'carbs': [15.8, 0.0, 25.0],
+    'fiber': [1.5, 0.0, 3.0],
+    'items': [2, 1, 1],
+})
+
+def test_monday_markers_match_add_vline():
+    fig = build_dashboard_figure(DAILY, 7)
+
+    expected = build_dashboard_figure(DAILY, 7)
+    expected.layout.shapes = ()
+    for m in ['2024-01-01', '2024-01-08']:
+        expected.add_vline(x=m, line_dash="dash", line_color="#A1D4B1", opacity=0.8, layer="below")
+    assert fig.layout.shapes == expected.layout.shapes
+
+def test_data_version_follows_content():
+    changed = DAILY.copy()
+    changed.loc[2, 'calories'] = 201.0
+    assert data_version(DAILY) == data_version(DAILY.copy())
+    assert data_version(DAILY) != data_version(changed)
+
+def test_cached_dashboard_figure_matches_a_fresh_build_and_is_private():
+    version = data_version(DAILY)
+    fig = dashboard_figure(version, 7, DAILY)
+    assert json.loads(pio.to_json(fig)) == json.loads(pio.to_json(build_dashboard_figure(DAILY, 7)))
+
+    # Each call gets its own Figure, so changing one can't leak into the cache
+    fig.update_layout(height=999)
+    assert dashboard_figure(version, 7, DAILY).layout.height == 400
@@ -0,0 +1,307 @@
+import io
+import json
+import sqlite3
+import time
+import pandas as pd
+import pytest
+from datetime import date, timedelta
+from functools import partial
+
+import database as db
+import storage
+import pyarrow.parquet as pq
+from export import LOG_PARQUET_SCHEMA, export_logs, write_logs_csv, write_logs_parquet
+from transforms import LOG_DTYPES, MACRO_COLUMNS, RECIPE_INDEX_COLUMNS
+
+TODAY = date.today()
+YESTERDAY = TODAY - timedelta(days=1)
+
+def test_sqlite_backend_round_trip(backend, make_items):
+    db.save_logs(make_items('Eggs', 'Toast'), TODAY)
+    db.save_logs(make_items('Soup'), YESTERDAY)
+
+    today = db.get_logs_by_date(TODAY)
+    assert sorted(today['food_name']) == ['Eggs', 'Toast']
+    assert len(db.get_recent_logs()) == 3
+
+    # Writes keep the rollup in step with the rows, and evict the cached reads
+    totals = db.get_daily_totals().set_index('date')
+    assert totals.loc[pd.Timestamp(TODAY), 'calories'] == 200.0
+    assert totals.loc[pd.Timestamp(TODAY), 'items'] == 2
+    assert db.get_all_daily_totals()['items'].tolist() == [1, 2]
+
+    db.delete_logs(today['id'].tolist())
+    assert db.get_logs_by_date(TODAY).empty
+    assert db.get_daily_totals()['date'].tolist() == [pd.Timestamp(YESTERDAY)]
+    assert db.get_all_daily_totals()['date'].tolist() == [pd.Timestamp(YESTERDAY)]
+
+def test_sqlite_insert_returns_the_inserted_rows(backend, make_items):
+    records = make_items('Eggs', 'Toast').assign(date='2024-01-01').to_dict(orient='records')
+    inserted = backend.insert_logs(storage.DEFAULT_USER, records)
+    assert [row['food_name'] for row in inserted] == ['Eggs', 'Toast']
+    assert [row['id'] for row in inserted] == db.get_logs_by_date(date(2024, 1, 1))['id'].tolist()
+    assert inserted[0]['user_id'] == storage.DEFAULT_USER
+
+    # Backends have to provide every storage operation
+    with pytest.raises(TypeError):
+        storage.StorageBackend()
+
+def test_reads_use_compact_schema(backend, make_items):
+    db.save_logs(make_items('Eggs', 'Toast'), TODAY)
+
+    logs = db.get_recent_logs()
+    assert {col: str(dtype) for col, dtype in logs.dtypes.items()} == LOG_DTYPES
+    assert str(db.get_daily_totals()['calories'].dtype) == 'float32'
+
+    # Only the requested columns come back, typed, even when there are no rows
+    names = db.get_logs_by_date(TODAY, columns=['id', 'food_name'])
+    assert names.columns.tolist() == ['id', 'food_name']
+    assert isinstance(names['food_name'].dtype, pd.CategoricalDtype)
+    empty = db.get_logs_by_date(YESTERDAY)
+    assert empty.empty and str(empty['date'].dtype) == 'datetime64[s]'
+
+def test_sqlite_backend_pages_and_rebuild(backend, make_items):
+    db.save_logs(make_items(*[f'Item {i}' for i in range(7)]), TODAY)
+    pages = list(db.iter_log_pages(page_size=3))
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert pd.concat(pages)['id'].is_monotonic_increasing
+
+    backend.rebuild_daily_totals()
+    rebuilt = backend.daily_totals_since(storage.DEFAULT_USER, TODAY.isoformat())
+    assert rebuilt['items'].tolist() == [7]
+    assert rebuilt[MACRO_COLUMNS].iloc[0].tolist() == [700.0, 70.0, 35.0, 17.5, 7.0]
+
+def test_sqlite_backend_recipe_upsert(backend, make_items):
+    db.save_recipe('Breakfast', make_items('Eggs'))
+    db.save_recipe('Breakfast', make_items('Eggs', 'Toast'))
+    recipes = db.get_all_recipes()
+    assert recipes['name'].tolist() == ['Breakfast']
+    assert recipes['calories'].iloc[0] == 200.0
+
+    # The index leaves out the ingredients, which are fetched per recipe
+    index = db.get_all_recipes(RECIPE_INDEX_COLUMNS)
+    assert 'ingredients_json' not in index.columns
+    assert len(pd.read_json(io.StringIO(db.get_recipe('Breakfast')['ingredients_json'].iloc[0]))) == 2
+    assert db.get_recipe('Dinner').empty
+
+def test_get_logs_between_pages_within_range(backend, make_items):
+    db.save_logs(make_items('Old'), TODAY - timedelta(days=8))
+    db.save_logs(make_items(*[f'Item {i}' for i in range(5)]), YESTERDAY)
+    db.save_logs(make_items('Today'), TODAY)
+
+    week = db.get_logs_between(TODAY - timedelta(days=6), YESTERDAY, page_size=2)
+    assert sorted(week['food_name']) == [f'Item {i}' for i in range(5)]
+
+    # A write inside the range evicts the cached week
+    db.save_logs(make_items('Late entry'), YESTERDAY)
+    assert len(db.get_logs_between(TODAY - timedelta(days=6), YESTERDAY)) == 6
+
+def test_import_logs_streams_exports_and_skips_invalid_rows(backend, tmp_path, make_items):
+    db.save_logs(make_items(*[f'Item {i}' for i in range(5)]), YESTERDAY)
+    exported = export_logs('CSV').read().decode()
+    db.delete_logs(db.load_all_logs()['id'].tolist())
+
+    # An export re-imports as is; the extra rows have no name, a bad date and a negative macro
+    path = tmp_path / "history.csv"
+    path.write_text(exported + ",,0,0,0,0,0\n9,not a date,Soup,1,1,1,1,1\n10,2024-01-01,Soup,-5,1,1,1,1\n")
+    batches = []
+    assert db.import_logs(str(path), batch_rows=2, on_batch=lambda *counts: batches.append(counts)) == {'imported': 5, 'rejected': 3}
+    assert len(batches) == 4
+    assert sorted(db.get_logs_by_date(YESTERDAY)['food_name']) == [f'Item {i}' for i in range(5)]
+    assert db.get_daily_totals().set_index('date').loc[pd.Timestamp(YESTERDAY), 'items'] == 5
+
+    lines = io.BytesIO(b'{"date": "2024-01-02T00:00:00", "food_name": "Eggs", "calories": 70, "protein": 6, "fat": 5, "carbs": 0, "fiber": 0}\n')
+    assert db.import_logs(lines, fmt='jsonl') == {'imported': 1, 'rejected': 0}
+    assert db.get_logs_by_date(date(2024, 1, 2))['food_name'].tolist() == ['Eggs']
+
+    # A .json upload is an array of records, not JSON Lines
+    array = tmp_path / "history.json"
+    array.write_text('[{"date": "2024-01-03", "food_name": "Toast", "calories": 80, "protein": 3, "fat": 1, "carbs": 15, "fiber": 1},'
+                     ' {"date": "2024-01-03", "food_name": "Jam", "calories": 50, "protein": 0, "fat": 0, "carbs": 13, "fiber": 0}]')
+    assert db.import_logs(str(array), batch_rows=1) == {'imported': 2, 'rejected': 0}
+    assert sorted(db.get_logs_by_date(date(2024, 1, 3))['food_name']) == ['Jam', 'Toast']
+
+    with pytest.raises(ValueError, match="missing columns: fiber"):
+        db.import_logs(io.BytesIO(b'[{"date": "2024-01-04", "food_name": "Tea", "calories": 0, "protein": 0, "fat": 0, "carbs": 0}]'),
+                       fmt='json')
+
+def test_supabase_requests_stay_within_size_limits(monkeypatch, make_items):
+    class Recorder:
+        # Just enough of the supabase client to record each request's payload or id list
+        def __init__(self):
+            self.inserts, self.deletes = [], []
+        def table(self, name):
+            return self
+        def insert(self, records):
+            self.inserts.append(records)
+            return self
+        def delete(self):
+            return self
+        def eq(self, column, value):
+            return self
+        def in_(self, column, ids):
+            self.deletes.append(ids)
+            return self
+        def execute(self):
+            return type('Response', (), {'data': [{'id': i} for i in (self.deletes[-1] if self.deletes else [])]})()
+
+    client = Recorder()
+    backend = storage.SupabaseBackend(client)
+    monkeypatch.setattr(storage, '_MAX_INSERT_BYTES', 2000)
+    records = make_items(*[f'Item {i}' for i in range(2500)]).assign(date='2024-01-01').to_dict(orient='records')
+    backend.insert_logs(storage.DEFAULT_USER, records)
+    assert sum(len(batch) for batch in client.inserts) == 2500
+    assert all(len(json.dumps(batch)) < 2000 for batch in client.inserts)
+
+    assert len(backend.delete_logs(storage.DEFAULT_USER, list(range(700)))) == 700
+    assert [len(ids) for ids in client.deletes] == [300, 300, 100]
+
+def test_fetch_concurrently_overlaps_round_trips(backend, monkeypatch, make_items):
+    db.save_logs(make_items('Eggs'), TODAY)
+    db.save_recipe('Breakfast', make_items('Eggs'))
+    db.clear_cache()
+
+    # Every backend read takes 200 ms, like a slow network round trip
+    def slow(method):
+        def read(*args, **kwargs):
+            time.sleep(0.2)
+            return method(*args, **kwargs)
+        return read
+    for name in ['logs_since', 'daily_totals_since', 'recipes']:
+        monkeypatch.setattr(backend, name, slow(getattr(backend, name)))
+
+    start = time.perf_counter()
+    logs, totals, recipes = db.fetch_concurrently(
+        partial(db.get_recent_logs, 30), partial(db.get_daily_totals, 30), db.get_all_recipes)
+    assert time.perf_counter() - start < 0.5
+    assert logs['food_name'].tolist() == ['Eggs'] and totals['items'].tolist() == [1]
+    assert recipes['name'].tolist() == ['Breakfast']
+
+def test_users_only_see_and_change_their_own_rows(backend, make_items):
+    db.save_logs(make_items('Eggs'), TODAY, user_id='ann')
+    db.save_logs(make_items('Soup', 'Bread'), TODAY, user_id='bob')
+    db.save_recipe('Breakfast', make_items('Eggs'), user_id='ann')
+    db.save_recipe('Breakfast', make_items('Eggs', 'Toast'), user_id='bob')
+
+    assert db.get_logs_by_date(TODAY, user_id='ann')['food_name'].tolist() == ['Eggs']
+    assert db.get_all_daily_totals(user_id='bob')['items'].tolist() == [2]
+    assert db.get_all_recipes(user_id='ann')['calories'].tolist() == [100.0]
+    assert db.get_all_recipes(user_id='bob')['calories'].tolist() == [200.0]
+    assert db.get_logs_by_date(TODAY).empty
+
+    # Someone else's ids are left alone, and their cached reads stay cached
+    bob_ids = db.get_logs_by_date(TODAY, user_id='bob')['id'].tolist()
+    db.delete_logs(bob_ids, user_id='ann')
+    assert len(db.get_logs_by_date(TODAY, user_id='bob')) == 2
+    db.save_logs(make_items('Toast'), TODAY, user_id='ann')
+    assert ('logs_by_date', 'bob', TODAY.isoformat(), tuple(storage.LOG_COLUMNS)) in db._cache
+    assert db.get_all_daily_totals(user_id='ann')['items'].tolist() == [2]
+
+def test_logs_and_rollup_commit_together(backend, monkeypatch, make_items):
+    db.save_logs(make_items('Eggs'), TODAY)
+    apply_deltas = backend._apply_deltas
+    def fail(deltas):
+        raise sqlite3.OperationalError("disk I/O error")
+    monkeypatch.setattr(backend, '_apply_deltas', fail)
+
+    # A failed rollup update takes the insert or delete down with it
+    with pytest.raises(sqlite3.OperationalError):
+        db.save_logs(make_items('Toast'), TODAY)
+    with pytest.raises(sqlite3.OperationalError):
+        db.delete_logs(db.get_logs_by_date(TODAY)['id'].tolist())
+    monkeypatch.setattr(backend, '_apply_deltas', apply_deltas)
+    db.clear_cache()
+    assert db.get_logs_by_date(TODAY)['food_name'].tolist() == ['Eggs']
+    assert db.get_daily_totals()['items'].tolist() == [1]
+
+def test_read_cache_is_bounded_and_drops_expired_entries(monkeypatch):
+    db.clear_cache()
+    ttl = [60.0]
+    monkeypatch.setattr(db, '_cache_ttl', lambda: ttl[0])
+    monkeypatch.setattr(db, '_cache_max_entries', lambda: 2)
+    def read(key):
+        return db._cached((key, 'ann'), lambda: pd.DataFrame({'key': [key]}))
+
+    read('a'), read('b')
+    read('a')              # a hit makes 'a' the most recently used
+    read('c')
+    assert list(db._cache) == [('a', 'ann'), ('c', 'ann')]
+
+    # Entries past their TTL go as soon as anything new is stored
+    time.sleep(0.05)
+    ttl[0] = 0.01
+    read('d')
+    assert list(db._cache) == [('d', 'ann')]
+    db.clear_cache()
+
+def test_per_user_queries_are_index_range_scans(backend):
+    plans = {}
+    for name, sql in [('by_date', storage._SELECT_LOGS_BY_DATE), ('since', storage._SELECT_LOGS_SINCE)]:
+        rows = backend._conn.execute(f"EXPLAIN QUERY PLAN {sql.format(columns='*')}", ('ann', '2024-01-01')).fetchall()
+        plans[name] = ' '.join(row[3] for row in rows)
+    assert all('USING INDEX logs_user_date_idx (user_id=? AND date' in plan for plan in plans.values()), plans
+    rows = backend._conn.execute(f"EXPLAIN QUERY PLAN {storage._SELECT_ALL_TOTALS}", ('ann',)).fetchall()
+    assert 'SEARCH daily_totals' in ' '.join(row[3] for row in rows)
+
+def test_single_user_files_are_upgraded_in_place(tmp_path):
+    # A macros.db from before rows had owners
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE logs (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL, food_name TEXT,
+                           calories REAL, protein REAL, fat REAL, carbs REAL, fiber REAL);
+        CREATE TABLE recipes (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE, ingredients_json TEXT,
+                              calories REAL, protein REAL, fat REAL, carbs REAL, fiber REAL);
+        CREATE TABLE daily_totals (date TEXT PRIMARY KEY, calories REAL, protein REAL, fat REAL, carbs REAL,
+                                   fiber REAL, items INTEGER);
+        INSERT INTO logs (date, food_name, calories, protein, fat, carbs, fiber) VALUES ('2024-01-01', 'Eggs', 70, 6, 5, 0, 0);
+        INSERT INTO recipes (name, ingredients_json, calories) VALUES ('Breakfast', '[]', 300);
+    """)
+    conn.close()
+
+    backend = storage.SQLiteBackend(path)
+    backend.init()
+    backend.init()
+    user = storage.DEFAULT_USER
+    assert backend.logs_by_date(user, '2024-01-01')['food_name'].tolist() == ['Eggs']
+    assert backend.recipes(user, ['name'])['name'].tolist() == ['Breakfast']
+    assert backend.all_daily_totals(user)['items'].tolist() == [1]
+    backend.upsert_recipe('ann', {'name': 'Breakfast', 'ingredients_json': '[]', 'calories': 1.0})
+    assert backend.recipes(user, ['calories'])['calories'].tolist() == [300.0]
+
+def test_import_gemini_table_saves_in_batches(backend, monkeypatch):
+    inserts = []
+    insert_logs = backend.insert_logs
+    monkeypatch.setattr(backend, 'insert_logs', lambda user_id, records: inserts.append(len(records)) or insert_logs(user_id, records))
+    lines = ["Food Item Calories Protein (g) Fat (g) Carbs (g) Fiber (g)"]
+    lines += [f"Item {i} 100 10 5 2.5 1" for i in range(7)] + ["DAILY TOTAL 700 70 35 17.5 7"]
+    upload = io.BytesIO('\n'.join(lines).encode('utf-8'))
+
+    assert db.import_gemini_table(upload, YESTERDAY, batch_rows=3) == {'imported': 7}
+    assert inserts == [3, 3, 1]
+    assert sorted(db.get_logs_by_date(YESTERDAY)['food_name']) == [f'Item {i}' for i in range(7)]
+    assert db.get_daily_totals(7)['items'].tolist() == [7]
+
+def test_parquet_export_keeps_one_schema_across_pages():
+    # Supabase sends whole numbers as JSON ints, so the first page can look integer (or
+    # all null) while a later one has fractions
+    first = pd.DataFrame({'id': [1, 2], 'date': ['2024-01-01'] * 2, 'food_name': ['Eggs', 'Toast'],
+                          'calories': [138, 80], 'protein': [12, 3], 'fat': [None, None], 'carbs': [1, 15], 'fiber': [0, 2]})
+    second = first.assign(id=[3, 4], calories=[95.5, 21.25], fat=[9.0, None])
+    out = write_logs_parquet([first, second], io.BytesIO())
+    out.seek(0)
+    table = pq.read_table(out)
+    assert table.schema == LOG_PARQUET_SCHEMA
+    assert table.column('calories').to_pylist() == [138.0, 80.0, 95.5, 21.25]
+    assert table.column('fat').to_pylist() == [None, None, 9.0, None]
+
+def test_exports_keep_only_log_columns():
+    # Tables with change tracking (sql/replica_sync.sql) send an updated_at column too
+    page = pd.DataFrame({'id': [1], 'date': ['2024-01-01'], 'food_name': ['Eggs'], 'calories': [70.0], 'protein': [6.0],
+                         'fat': [5.0], 'carbs': [0.0], 'fiber': [0.0], 'updated_at': ['2024-01-01T08:00:00+00:00']})
+    csv = write_logs_csv([page, page.assign(id=2)], io.BytesIO()).getvalue().decode()
+    assert csv.splitlines()[0] == ','.join(storage.LOG_COLUMNS)
+    assert len(csv.splitlines()) == 3
+    out = write_logs_parquet([page], io.BytesIO())
+    out.seek(0)
+    assert pq.read_table(out).column_names == storage.LOG_COLUMNS
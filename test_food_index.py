@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+
+import database as db
+import food_index
+from food_index import FoodIndex, get_food_index
+from transforms import food_stats
+
+TODAY = date.today()
+YESTERDAY = TODAY - timedelta(days=1)
+
+def _names(results):
+    return [entry['food_name'] for entry in results]
+
+def test_search_matches_prefixes_and_typos(make_items):
+    index = FoodIndex()
+    index.add(make_items('Greek Yogurt (40g)', 'Green Beans', 'Kimchi (50g)', 'Peanut Butter (1 tbsp)').assign(date='2024-01-01'))
+
+    assert _names(index.search('kim')) == ['Kimchi (50g)']
+    assert _names(index.search('grek yogurt'))[0] == 'Greek Yogurt (40g)'
+    assert _names(index.search('peanut butter')) == ['Peanut Butter (1 tbsp)']
+    assert index.search('zzz') == [] and index.search('  ') == []
+
+def test_search_prefers_frequent_then_recent_foods(make_items):
+    index = FoodIndex()
+    index.add(make_items('Green Beans').assign(date='2024-01-01'))
+    index.add(make_items('Greek Yogurt', 'Greek Yogurt').assign(date='2024-01-01'))
+    assert _names(index.search('gre')) == ['Greek Yogurt', 'Green Beans']
+
+    # The latest log's macros win and casing differences count as the same food
+    index.add(make_items('greek yogurt', calories=50.0).assign(date='2024-02-01'))
+    index.add(make_items('Greek Yogurt', calories=80.0).assign(date='2024-01-15'))
+    best = index.search('greek yogurt')[0]
+    assert (best['food_name'], best['calories'], best['uses'], best['last_date']) == ('greek yogurt', 50.0, 4, '2024-02-01')
+    assert len(index) == 2
+
+def test_search_scores_a_bounded_number_of_names(monkeypatch, make_items):
+    # Every name shares the query's trigrams; only the budget's worth are scored, most used first
+    monkeypatch.setattr(food_index, 'CANDIDATE_BUDGET', 10)
+    stats = make_items(*[f'Chicken {i}' for i in range(1000)]).assign(last_date='2024-01-01', uses=1)
+    stats.loc[700, 'uses'] = 50
+    index = FoodIndex.from_stats(stats)
+
+    assert _names(index.search('chi', limit=1)) == ['Chicken 700']
+    assert len(index.search('chi', limit=100)) == 10
+
+def test_sqlite_food_stats_matches_local(backend, make_items):
+    db.save_logs(make_items('Eggs', 'Toast'), YESTERDAY)
+    db.save_logs(make_items('Eggs', calories=150.0), TODAY)
+
+    stats = db.get_food_stats().sort_values('food_name').reset_index(drop=True)
+    assert stats[['food_name', 'calories', 'last_date', 'uses']].values.tolist() == [
+        ['Eggs', 150.0, TODAY.isoformat(), 2],
+        ['Toast', 100.0, YESTERDAY.isoformat(), 1],
+    ]
+    local = food_stats(db.load_all_logs())
+    local = local.sort_values('food_name').reset_index(drop=True)
+    assert local[['food_name', 'calories', 'last_date', 'uses']].astype(object).values.tolist() == \
+        stats[['food_name', 'calories', 'last_date', 'uses']].astype(object).values.tolist()
+
+def test_index_follows_saves(backend, monkeypatch, make_items):
+    monkeypatch.setattr(db, '_save_listeners', [])
+    db.save_logs(make_items('Eggs'), YESTERDAY)
+    index = FoodIndex.from_stats(db.get_food_stats())
+    db.add_save_listener(lambda user_id, rows: index.add(rows))
+
+    db.save_logs(make_items('Eggs', 'Oat Milk'), TODAY)
+    assert _names(index.search('oat')) == ['Oat Milk']
+    assert index.search('eggs')[0]['uses'] == 2
+
+def test_cached_index_follows_saves_and_deletes(backend, make_items):
+    get_food_index.clear()
+    listeners = len(db._save_listeners)
+    db.save_logs(make_items('Eggs'), YESTERDAY)
+    index = get_food_index('default')
+
+    db.save_logs(make_items('Oat Milk'), TODAY)
+    assert _names(index.search('oat')) == ['Oat Milk']
+
+    # Deleting drops the index; the rebuilt one no longer suggests the food
+    oat_milk = db.get_logs_by_date(TODAY)['id'].tolist()
+    db.delete_logs(oat_milk)
+    rebuilt = get_food_index('default')
+    assert rebuilt is not index
+    assert rebuilt.search('oat') == []
+    assert _names(rebuilt.search('eggs')) == ['Eggs']
+    # Rebuilding doesn't register anything more
+    assert len(db._save_listeners) == listeners
+    get_food_index.clear()
@@ -0,0 +1,62 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("sqlalchemy")
+from sqlalchemy import create_engine
+
+import migrate_to_postgres as migration
+from storage import DEFAULT_USER, SQLiteBackend
+
+def _source(path, n_logs):
+    backend = SQLiteBackend(str(path))
+    backend.init()
+    backend.insert_logs(DEFAULT_USER, [{'date': f'2024-01-{i % 28 + 1:02d}', 'food_name': f'Food {i}', 'calories': float(i),
+                          'protein': 1.0, 'fat': 1.0, 'carbs': 1.0, 'fiber': 1.0} for i in range(n_logs)])
+    backend.upsert_recipe(DEFAULT_USER, {'name': 'Breakfast', 'ingredients_json': '[]', 'calories': 1.0, 'protein': 1.0,
+                           'fat': 1.0, 'carbs': 1.0, 'fiber': 1.0})
+    return sqlite3.connect(str(path))
+
+def test_migration_copies_in_chunks(tmp_path):
+    source = _source(tmp_path / "macros.db", 25)
+    engine = create_engine(f"sqlite:///{tmp_path / 'target.db'}")
+    reports = []
+
+    assert migration.migrate(source, engine, chunk_size=10, report=reports.append) == {'logs': 25, 'recipes': 1}
+    logs = pd.read_sql_query("SELECT * FROM logs", engine)
+    assert len(logs) == 25 and 'id' not in logs.columns
+    assert logs['food_name'].tolist() == [f'Food {i}' for i in range(25)]
+    assert any('rows/s' in line for line in reports)
+
+    # The rollup is rebuilt on the target and matches the source's logs
+    columns = "user_id, date, calories, protein, fat, carbs, fiber, items"
+    totals = pd.read_sql_query(f"SELECT {columns} FROM daily_totals ORDER BY user_id, date", engine)
+    expected = pd.read_sql_query(f"SELECT {columns} FROM daily_log_totals ORDER BY user_id, date", source)
+    assert len(totals) == 25
+    pd.testing.assert_frame_equal(totals, expected)
+
+    # Nothing new in the source, so a rerun copies nothing
+    assert migration.migrate(source, engine, chunk_size=10, report=reports.append) == {'logs': 0, 'recipes': 0}
+    assert len(pd.read_sql_query("SELECT * FROM logs", engine)) == 25
+
+def test_interrupted_migration_resumes_without_duplicates(tmp_path, monkeypatch):
+    source = _source(tmp_path / "macros.db", 25)
+    engine = create_engine(f"sqlite:///{tmp_path / 'target.db'}")
+
+    prepare = migration._prepare
+    calls = []
+    def fail_on_second_chunk(table, chunk):
+        calls.append(table)
+        if len(calls) == 2:
+            raise ConnectionError("connection lost")
+        return prepare(table, chunk)
+    monkeypatch.setattr(migration, '_prepare', fail_on_second_chunk)
+    with pytest.raises(ConnectionError):
+        migration.migrate(source, engine, chunk_size=10, report=lambda line: None)
+    assert len(pd.read_sql_query("SELECT * FROM logs", engine)) == 10
+
+    monkeypatch.setattr(migration, '_prepare', prepare)
+    assert migration.migrate(source, engine, chunk_size=10, report=lambda line: None) == {'logs': 15, 'recipes': 1}
+    logs = pd.read_sql_query("SELECT * FROM logs", engine)
+    assert logs['food_name'].tolist() == [f'Food {i}' for i in range(25)]
@@ -1,6 +1,8 @@
+import io
 import pytest
 import pandas as pd
-from parser import parse_gemini_table
+import parser
+from parser import iter_gemini_batches, parse_gemini_table, _parse_line
 
 # The exact text provided by the user
 USER_TEST_TEXT = """
@@ -58,3 +60,46 @@ def test_handles_commas_in_numbers():
     df = parse_gemini_table(text_with_comma)
     assert len(df) == 1
     assert df.iloc[0]['calories'] == 1500.0
+
+def _parse_line_by_line(text):
+    rows = [_parse_line(line.strip()) for line in text.strip().split('\n')]
+    return pd.DataFrame([row for row in rows if row])
+
+# Lines that exercise both the batch path and its per-line fallback
+TRICKY_TEXT = (
+    USER_TEST_TEXT
+    + "Windows Line\t 10 1 1 1 1\r\n"
+    + "  Tabbed\tname   here 20 2 2 2 2\n"
+    + "Odd Numbers 1_000 nan inf -1 +.5\n"
+    + "No\xa0Break Space 30 3 3 3 3\n"
+    + "Trailing Commas 1,000, 5,5 .5 5. 1e2\n"
+    + "Not A Row 1 2 3 4 five\n"
+    + "Too Short 1 2 3 4\n"
+)
+
+def test_batch_matches_line_by_line():
+    df = parse_gemini_table(TRICKY_TEXT)
+    pd.testing.assert_frame_equal(df, _parse_line_by_line(TRICKY_TEXT))
+    assert len(df) == 17
+
+def test_batch_produces_typed_columns():
+    df = parse_gemini_table(TRICKY_TEXT)
+    for col in ['calories', 'protein', 'fat', 'carbs', 'fiber']:
+        assert df[col].dtype == 'float64'
+    assert df.iloc[-1]['food_name'] == 'Trailing Commas'
+    assert df.iloc[-1]['calories'] == 1000.0
+
+def test_nothing_parsed_returns_empty_frame():
+    assert parse_gemini_table("Food Item Calories Protein (g) Fat (g) Carbs (g) Fiber (g)\nhello").empty
+
+def test_stream_yields_fixed_size_batches_matching_the_paste(monkeypatch):
+    # Small chunks, so rows carry over from one chunk's parse into the next batch
+    monkeypatch.setattr(parser, 'STREAM_CHUNK_LINES', 3)
+    # An uploaded file: bytes lines, a BOM and CRLF endings
+    upload = io.BytesIO(('﻿' + TRICKY_TEXT).encode('utf-8'))
+    batches = list(iter_gemini_batches(upload, batch_rows=5))
+    assert [len(batch) for batch in batches] == [5, 5, 5, 2]
+    pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True), parse_gemini_table(TRICKY_TEXT))
+
+    # Any iterable of lines, with nothing to parse yielding nothing
+    assert list(iter_gemini_batches(iter(["Food Item Calories", "hello"]))) == []
@@ -0,0 +1,54 @@
+import json
+
+import pandas as pd
+import pytest
+
+import perf
+
+@pytest.fixture(autouse=True)
+def clean():
+    perf.reset()
+    yield
+    perf.reset()
+
+def test_summary_reports_percentiles_rows_and_bytes():
+    for ms in range(1, 101):
+        perf.record('fetch.logs', ms / 1000, rows=10, nbytes=400)
+    perf.record('tab.daily_log', 0.002)
+
+    summary = perf.summary().set_index('operation')
+    assert summary.loc['fetch.logs', 'calls'] == 100
+    assert summary.loc['fetch.logs', 'p50_ms'] == pytest.approx(50.5)
+    assert summary.loc['fetch.logs', 'p95_ms'] == pytest.approx(95.05)
+    assert summary.loc['fetch.logs', 'avg_bytes'] == 400
+    assert pd.isna(summary.loc['tab.daily_log', 'avg_rows'])
+
+    dumped = json.loads(perf.dump_json())['operations']
+    assert [op['operation'] for op in dumped] == ['fetch.logs', 'tab.daily_log']
+    assert dumped[1]['avg_rows'] is None
+
+def test_instrumented_measures_results_payloads_and_failures():
+    @perf.instrumented('read')
+    def read():
+        return pd.DataFrame({'a': [1, 2, 3]})
+
+    @perf.instrumented('write')
+    def write(records):
+        raise ConnectionError("offline")
+
+    read()
+    with pytest.raises(ConnectionError):
+        write([{'a': 1}, {'a': 2}])
+    with perf.timed('block') as sample:
+        sample.measure([1])
+
+    summary = perf.summary().set_index('operation')
+    assert summary['avg_rows'].to_dict() == {'block': 1, 'read': 3, 'write': 2}
+    assert summary.loc['read', 'avg_bytes'] == 24
+
+def test_window_keeps_recent_samples(monkeypatch):
+    monkeypatch.setattr(perf, 'WINDOW', 5)
+    for i in range(10):
+        perf.record('op', i)
+    assert perf.summary()['calls'].tolist() == [5]
+    assert perf.summary()['max_ms'].tolist() == [9000]
@@ -0,0 +1,101 @@
+import time
+from datetime import date
+
+import pytest
+from supabase import ClientOptions, create_client
+
+import database as db
+import replica
+from replica import ReplicaBackend, ReplicaStore
+from resilience import BackendUnavailable, CircuitBreaker, make_http_client
+from storage import DEFAULT_USER, SupabaseBackend
+
+def make_replica(stand_in, path, port=None, **kwargs) -> ReplicaBackend:
+    # The real supabase client and SupabaseBackend against the stand-in, with a replica at path
+    client = create_client(f"http://127.0.0.1:{port or stand_in.server_port}", "anon-key",
+                           options=ClientOptions(httpx_client=make_http_client(timeout_seconds=0.5)))
+    remote = SupabaseBackend(client, CircuitBreaker(failure_threshold=1, reset_seconds=60), max_retries=0)
+    backend = ReplicaBackend(remote, ReplicaStore(str(path)), **kwargs)
+    backend.init()
+    return backend
+
+@pytest.fixture
+def replica_db(stand_in, tmp_path, monkeypatch):
+    # database.py on a replica of the stand-in, with an empty read cache
+    backend = make_replica(stand_in, tmp_path / "replica.db", on_change=db._replica_changed)
+    monkeypatch.setattr(db, 'get_backend', lambda: backend)
+    db.clear_cache()
+    yield backend
+    db.clear_cache()
+
+def test_reads_come_from_the_replica_after_one_sync(stand_in, replica_db):
+    stand_in.add_log('2024-01-01', 'Eggs')
+    stand_in.add_log('2024-01-01', 'Toast')
+    stand_in.run("INSERT INTO recipes (name, ingredients_json, calories) VALUES ('Breakfast', '[]', 300)")
+
+    # The first read waits for the initial sync; later ones make no requests at all
+    assert sorted(db.get_logs_by_date(date(2024, 1, 1))['food_name']) == ['Eggs', 'Toast']
+    synced = len(stand_in.requests)
+    db.clear_cache()
+    assert db.get_all_recipes()['name'].tolist() == ['Breakfast']
+    assert db.get_all_daily_totals()['items'].tolist() == [2]
+    assert len(stand_in.requests) == synced
+
+def test_sync_pulls_only_changes_and_tombstones(stand_in, tmp_path):
+    stand_in.add_log('2024-01-01', 'Eggs')
+    stand_in.add_log('2024-01-02', 'Soup')
+    mine = make_replica(stand_in, tmp_path / "mine.db")
+    other = make_replica(stand_in, tmp_path / "other.db")
+    assert mine.sync() == ({'2024-01-01', '2024-01-02'}, set())
+    other.sync()
+
+    # Another device adds a row and deletes one through delete_logs
+    other.insert_logs(DEFAULT_USER, [{'date': '2024-01-03', 'food_name': 'Rice', 'calories': 200.0, 'protein': 4.0,
+                        'fat': 0.5, 'carbs': 45.0, 'fiber': 0.6}])
+    soup = other.logs_by_date(DEFAULT_USER, '2024-01-02')['id'].tolist()
+    other.delete_logs(DEFAULT_USER, soup)
+
+    # This replica re-reads only the overlap window, and reports just the days that changed
+    start = len(stand_in.requests)
+    assert mine.sync() == ({'2024-01-02', '2024-01-03'}, set())
+    assert all('updated_at=gte.' in query for _, table, query in stand_in.requests[start:] if table == 'logs')
+    assert mine.logs_by_date(DEFAULT_USER, '2024-01-02').empty
+    assert mine.all_daily_totals(DEFAULT_USER)['date'].tolist() == ['2024-01-01', '2024-01-03']
+    assert mine.sync() == (set(), set())
+
+def test_interrupted_sync_resumes_from_its_last_page(stand_in, tmp_path, monkeypatch):
+    for i in range(5):
+        stand_in.add_log('2024-01-01', f'Item {i}')
+    monkeypatch.setattr(replica, 'SYNC_PAGE_ROWS', 2)
+    backend = make_replica(stand_in, tmp_path / "replica.db")
+
+    # Fail the third page: the first two stay committed along with the position after them
+    original = backend.remote.changes
+    def flaky(table, *args):
+        if len([r for r in stand_in.requests if r[1] == 'logs']) == 2:
+            raise BackendUnavailable("down")
+        return original(table, *args)
+    monkeypatch.setattr(backend.remote, 'changes', flaky)
+    with pytest.raises(BackendUnavailable):
+        backend.sync()
+    assert len(backend.local.logs_by_date(DEFAULT_USER, '2024-01-01')) == 4
+    assert backend.local.sync_position('logs')['pass_after'] == 4
+
+    monkeypatch.setattr(backend.remote, 'changes', original)
+    backend.sync()
+    assert len(backend.local.logs_by_date(DEFAULT_USER, '2024-01-01')) == 5
+    assert backend.local.has_synced()
+
+def test_replica_stays_readable_while_the_backend_is_down(stand_in, tmp_path):
+    stand_in.add_log('2024-01-01', 'Eggs')
+    make_replica(stand_in, tmp_path / "replica.db").sync()
+
+    # A fresh process on the same replica file, with nothing listening at the remote end
+    start = time.perf_counter()
+    offline = make_replica(stand_in, tmp_path / "replica.db", port=1)
+    assert offline.logs_by_date(DEFAULT_USER, '2024-01-01')['food_name'].tolist() == ['Eggs']
+    assert time.perf_counter() - start < 0.5
+    with pytest.raises(BackendUnavailable):
+        offline.insert_logs(DEFAULT_USER, [{'date': '2024-01-01', 'food_name': 'Toast', 'calories': 80.0, 'protein': 3.0,
+                              'fat': 1.0, 'carbs': 15.0, 'fiber': 1.5}])
+    assert offline.logs_by_date(DEFAULT_USER, '2024-01-01')['food_name'].tolist() == ['Eggs']
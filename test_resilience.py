@@ -0,0 +1,101 @@
+import time
+
+import httpx
+import pytest
+from supabase import ClientOptions, create_client
+
+import database as db
+from resilience import BackendUnavailable, CircuitBreaker, call_with_retries, make_http_client
+from storage import DEFAULT_USER, SupabaseBackend
+
+
+@pytest.fixture
+def supabase_backend(stand_in, monkeypatch):
+    # The real supabase client and SupabaseBackend, pointed at the stand-in with short timeouts
+    client = create_client(f"http://127.0.0.1:{stand_in.server_port}", "anon-key",
+                           options=ClientOptions(httpx_client=make_http_client(timeout_seconds=0.3)))
+    backend = SupabaseBackend(client, CircuitBreaker(failure_threshold=2, reset_seconds=60), max_retries=1,
+                              backoff_seconds=0)
+    monkeypatch.setattr(db, 'get_backend', lambda: backend)
+    db.clear_cache()
+    yield backend
+    db.clear_cache()
+
+def test_timeouts_retry_then_open_the_circuit(stand_in, supabase_backend):
+    stand_in.add_log('2024-01-01', 'Eggs')
+    assert supabase_backend.logs_by_date(DEFAULT_USER, '2024-01-01')['food_name'].tolist() == ['Eggs']
+
+    # Each read times out after 0.3 s and is retried once. That is one failed request,
+    # so the circuit stays closed until a second one fails too.
+    stand_in.delay = 1
+    start = time.perf_counter()
+    with pytest.raises(BackendUnavailable):
+        supabase_backend.logs_by_date(DEFAULT_USER, '2024-01-01')
+    assert time.perf_counter() - start < 1.5
+    assert len(stand_in.requests) == 3
+    assert supabase_backend.breaker.state == 'closed'
+    with pytest.raises(BackendUnavailable):
+        supabase_backend.logs_by_date(DEFAULT_USER, '2024-01-01')
+    assert len(stand_in.requests) == 5
+    assert supabase_backend.breaker.state == 'open' and not db.backend_available()
+
+    # While it's open nothing is sent and callers fail straight away
+    start = time.perf_counter()
+    with pytest.raises(BackendUnavailable):
+        supabase_backend.logs_by_date(DEFAULT_USER, '2024-01-01')
+    assert time.perf_counter() - start < 0.05 and len(stand_in.requests) == 5
+
+def test_errors_the_server_answers_with_dont_trip_the_circuit(stand_in, supabase_backend):
+    stand_in.fail_with = 500
+    for _ in range(3):
+        with pytest.raises(Exception) as raised:
+            supabase_backend.logs_by_date(DEFAULT_USER, '2024-01-01')
+        assert not isinstance(raised.value, BackendUnavailable)
+    assert supabase_backend.breaker.state == 'closed'
+
+def test_reads_fall_back_to_stale_cache_while_unavailable(stand_in, supabase_backend, monkeypatch):
+    stand_in.add_log('2024-01-01', 'Eggs')
+    assert db.get_recent_logs(days=100000)['food_name'].tolist() == ['Eggs']
+
+    # Expire the entry, then take the backend down
+    monkeypatch.setattr(db, '_cache_ttl', lambda: 0)
+    stand_in.delay = 1
+    assert db.get_recent_logs(days=100000)['food_name'].tolist() == ['Eggs']
+    with pytest.raises(BackendUnavailable):
+        db.get_all_recipes()
+
+def test_breaker_half_opens_for_one_trial_call():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10, clock=lambda: now[0])
+    def down():
+        raise httpx.ConnectError("refused")
+
+    with pytest.raises(BackendUnavailable):
+        call_with_retries(down, breaker, max_retries=0)
+    assert breaker.state == 'open'
+
+    now[0] = 11
+    assert breaker.state == 'half-open'
+    with pytest.raises(BackendUnavailable):
+        call_with_retries(down, breaker, max_retries=0)
+    assert breaker.state == 'open'
+
+    now[0] = 22
+    assert call_with_retries(lambda: 'ok', breaker, max_retries=0) == 'ok'
+    assert breaker.state == 'closed'
+
+def test_unsent_writes_are_retried_but_timed_out_ones_are_not():
+    attempts = []
+    def timed_out():
+        attempts.append(1)
+        raise httpx.ReadTimeout("slow")
+    with pytest.raises(BackendUnavailable):
+        call_with_retries(timed_out, CircuitBreaker(), max_retries=2, backoff_seconds=0, idempotent=False)
+    assert len(attempts) == 1
+
+    def refused():
+        attempts.append(1)
+        raise httpx.ConnectError("refused")
+    with pytest.raises(BackendUnavailable):
+        call_with_retries(refused, CircuitBreaker(), max_retries=2, backoff_seconds=0, idempotent=False)
+    assert len(attempts) == 4
@@ -0,0 +1,90 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+from transforms import (HISTORY_ROW_COLORS, HISTORY_SELECT_COLUMN, calculate_totals, downsample_series, history_days, kcal_split,
+                        lttb_indices, monday_dates, ingredients_frame, period_starts, sum_by_date, week_ranges)
+
+LOGS = pd.DataFrame({
+    'id': [1, 2, 3, 4],
+    'date': ['2024-01-01', '2024-01-01', '2024-01-02', '2024-01-08'],
+    'food_name': ['Eggs', 'Toast', 'Water', 'Soup'],
+    'calories': [144.0, 80.0, 0.0, 200.4],
+    'protein': [12.6, 3.0, 0.0, 10.04],
+    'fat': [9.5, 1.0, 0.0, 5.0],
+    'carbs': [0.8, 15.0, 0.0, 25.0],
+    'fiber': [0.0, 1.5, 0.0, 3.0],
+})
+
+def test_kcal_split_adds_up_to_logged_calories():
+    daily = sum_by_date(LOGS)
+    split = kcal_split(daily)
+    total = split['protein_kcal'] + split['fat_kcal'] + split['carbs_kcal']
+
+    # Days with macros split exactly into their calories; days without macros stay at zero
+    assert total[daily['date'] == '2024-01-01'].iloc[0] == 224.0
+    assert total[daily['date'] == '2024-01-02'].iloc[0] == 0.0
+
+def test_monday_dates():
+    assert monday_dates(sum_by_date(LOGS)) == ['2024-01-01', '2024-01-08']
+
+def test_period_starts():
+    dates = pd.to_datetime(['2024-01-01', '2024-01-07', '2024-01-08', '2024-02-29'])
+    assert list(period_starts(dates, 'weekly').astype(str)) == [
+        '2024-01-01T00:00:00', '2024-01-01T00:00:00', '2024-01-08T00:00:00', '2024-02-26T00:00:00']
+    assert list(period_starts(dates, 'monthly').astype(str)) == [
+        '2024-01-01T00:00:00', '2024-01-01T00:00:00', '2024-01-01T00:00:00', '2024-02-01T00:00:00']
+
+def test_downsample_series_is_bounded_and_exact_in_view():
+    dates = pd.date_range('2020-01-01', periods=1500, freq='D').astype('datetime64[s]')
+    daily = pd.DataFrame({'date': dates, 'calories': np.arange(1500.0)})
+
+    # Short series come back as they are; long ones become weekly averages before the last 28 days
+    recent = daily.tail(90)
+    assert downsample_series(recent, 28) is recent
+    plotted = downsample_series(daily, 28, max_points=300)
+    assert len(plotted) <= 300
+    pd.testing.assert_frame_equal(plotted.tail(28).reset_index(drop=True), daily.tail(28).reset_index(drop=True))
+    assert plotted['date'].iloc[0] == pd.Timestamp('2019-12-30')
+    assert plotted['calories'].iloc[0] == 2.0  # Jan 1-5 of the first week
+
+    # Even months don't fit in 30 points, so LTTB picks from them
+    assert len(downsample_series(daily, 28, max_points=30)) == 30
+
+def test_lttb_keeps_ends_and_peaks():
+    x = np.arange(1000.0)
+    y = np.sin(x / 50)
+    y[500] = 10
+    picks = lttb_indices(x, y, 50)
+    assert len(picks) == 50 and picks[0] == 0 and picks[-1] == 999
+    assert 500 in picks and np.all(np.diff(picks) > 0)
+
+def test_history_days_most_recent_first_with_cycling_colors():
+    days = list(history_days(LOGS))
+
+    assert [d for d, _, _ in days] == ['2024-01-08', '2024-01-02', '2024-01-01']
+    assert [c for _, _, c in days] == HISTORY_ROW_COLORS[:3]
+
+    _, soup, _ = days[0]
+    assert soup['calories'].iloc[0] == 200
+    assert soup['protein'].iloc[0] == 10.0
+    assert soup.columns[-1] == HISTORY_SELECT_COLUMN
+    assert calculate_totals(days[2][1])['calories'] == 224
+
+def test_week_ranges_step_back_seven_days():
+    weeks = week_ranges(date(2024, 1, 14), 2)
+    assert weeks == [(date(2024, 1, 8), date(2024, 1, 14)), (date(2024, 1, 1), date(2024, 1, 7))]
+
+    # A later page continues the color cycle where the previous one stopped
+    colors = [c for _, _, c in history_days(LOGS, first_color=3)]
+    assert colors == [HISTORY_ROW_COLORS[3], HISTORY_ROW_COLORS[0], HISTORY_ROW_COLORS[1]]
+
+def test_ingredients_frame_is_memoized_by_name_and_content():
+    first = ingredients_frame('Soup', LOGS.iloc[:2].to_json(orient='records'))
+    assert first['food_name'].tolist() == ['Eggs', 'Toast']
+
+    # Callers get their own copy of the memoized frame
+    first.loc[0, 'calories'] = 0
+    assert ingredients_frame('Soup', LOGS.iloc[:2].to_json(orient='records'))['calories'].iloc[0] == 144.0
+
+    # Same name with new contents decodes the new contents
+    assert ingredients_frame('Soup', LOGS.iloc[3:].to_json(orient='records'))['food_name'].tolist() == ['Soup']
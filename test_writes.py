@@ -0,0 +1,96 @@
+import threading
+import httpx
+from datetime import date, timedelta
+
+import database as db
+from resilience import BackendUnavailable
+from writes import WriteQueue
+
+TODAY = date.today()
+
+def _view(queue):
+    start = TODAY - timedelta(days=7)
+    logs = queue.overlay_logs(db.get_recent_logs(7), start)
+    totals = queue.overlay_daily_totals(db.get_daily_totals(7), start)
+    return logs, totals
+
+def test_writes_show_immediately_and_commit_in_one_batch(backend, monkeypatch, make_items):
+    inserts = []
+    insert_logs = backend.insert_logs
+    monkeypatch.setattr(backend, 'insert_logs', lambda user_id, records: inserts.append(len(records)) or insert_logs(user_id, records))
+    queue = WriteQueue(coalesce_seconds=0.2)
+
+    queue.save_logs(make_items('Eggs'), TODAY, 'a')
+    queue.save_logs(make_items('Toast', 'Jam'), TODAY, 'b')
+    logs, totals = _view(queue)
+    assert sorted(logs['food_name']) == ['Eggs', 'Jam', 'Toast']
+    assert (logs['id'] < 0).all()
+    assert totals['items'].tolist() == [3]
+
+    assert queue.flush(timeout=10)
+    assert inserts == [3]
+    logs, totals = _view(queue)
+    assert (logs['id'] > 0).all() and len(logs) == 3
+    assert totals['calories'].tolist() == [300.0]
+
+    # A delete disappears straight away, and from the rollup once committed
+    queue.delete_logs(logs[logs['food_name'] == 'Eggs'], 'a')
+    logs, totals = _view(queue)
+    assert sorted(logs['food_name']) == ['Jam', 'Toast']
+    assert totals['items'].tolist() == [2]
+    assert queue.flush(timeout=10)
+    assert db.get_daily_totals(7)['items'].tolist() == [2]
+
+def test_deleting_an_unsent_save_cancels_it(backend, make_items):
+    queue = WriteQueue(coalesce_seconds=0.5)
+    queue.save_logs(make_items('Oops'), TODAY, 'a')
+    logs, _ = _view(queue)
+    queue.delete_logs(logs, 'a')
+
+    assert _view(queue)[0].empty
+    assert queue.flush(timeout=10)
+    assert db.get_recent_logs(7).empty and queue.failures('a') == []
+
+def test_failed_writes_report_to_their_session(backend, monkeypatch, make_items):
+    attempts = []
+    checked = threading.Event()
+    def fail(user_id, record):
+        # Hold the attempt until the overlay has been checked
+        checked.wait(timeout=10)
+        attempts.append(record)
+        raise ConnectionError("offline")
+    monkeypatch.setattr(backend, 'upsert_recipe', fail)
+    queue = WriteQueue(coalesce_seconds=0)
+
+    queue.save_recipe('Breakfast', make_items('Eggs'), 'a')
+    assert queue.overlay_recipes(db.get_all_recipes())['name'].tolist() == ['Breakfast']
+    checked.set()
+    assert queue.flush(timeout=10)
+
+    # The backend does any retrying, so the queue sends each write once
+    assert len(attempts) == 1
+    assert queue.overlay_recipes(db.get_all_recipes()).empty
+    assert queue.failures('b') == []
+    assert queue.failures('a') == ["Couldn't save recipe 'Breakfast': offline"]
+    assert queue.failures('a') == []
+
+def test_save_that_may_have_committed_is_not_resent(backend, monkeypatch, make_items):
+    # The insert commits, then the response is lost
+    calls = []
+    insert = backend.insert_logs
+    def flaky(user_id, records):
+        calls.append(records)
+        insert(user_id, records)
+        try:
+            raise httpx.ReadTimeout("timed out")
+        except httpx.ReadTimeout as e:
+            raise BackendUnavailable(f"Backend request failed: {e!r}") from e
+    monkeypatch.setattr(backend, 'insert_logs', flaky)
+    queue = WriteQueue(coalesce_seconds=0)
+
+    queue.save_logs(make_items('Eggs'), TODAY, 'a')
+    assert queue.flush(timeout=10)
+
+    assert len(calls) == 1
+    assert db.get_logs_by_date(TODAY)['food_name'].tolist() == ['Eggs']
+    assert len(queue.failures('a')) == 1
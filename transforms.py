@@ -0,0 +1,262 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Pure data-prep used by the Dashboard and History tabs. Nothing here touches Streamlit or
+# the database, so it can be unit-tested and benchmarked on synthetic frames.
+
+MACRO_COLUMNS = ['calories', 'protein', 'fat', 'carbs', 'fiber']
+
+# Colors for daily backgrounds: #A1D4B1, #F1A512, #DD4111, #8C0027
+# Converted to rgba for Streamlit background styling (transparency 0.2)
+HISTORY_ROW_COLORS = [
+    'rgba(161, 212, 177, 0.2)',
+    'rgba(241, 165, 18, 0.2)',
+    'rgba(221, 65, 17, 0.2)',
+    'rgba(140, 0, 39, 0.2)'
+]
+
+HISTORY_SELECT_COLUMN = "✅ Select for Recipe"
+
+# Columns each read asks the database for, and the compact in-memory schema they come back
+# in: datetime dates, categorical food names and float32 macros instead of object/float64.
+LOG_COLUMNS = ['id', 'date', 'food_name'] + MACRO_COLUMNS
+TOTALS_COLUMNS = ['date'] + MACRO_COLUMNS + ['items']
+RECIPE_COLUMNS = ['name', 'ingredients_json'] + MACRO_COLUMNS
+# What the Recipes tab lists; each recipe's ingredients are fetched when it's opened
+RECIPE_INDEX_COLUMNS = ['name'] + MACRO_COLUMNS
+# One row per distinct food: its most recent macros, when it was last logged and how often
+FOOD_STATS_COLUMNS = ['food_name'] + MACRO_COLUMNS + ['last_date', 'uses']
+
+LOG_DTYPES = {'id': 'int64', 'date': 'datetime64[s]', 'food_name': 'category', **dict.fromkeys(MACRO_COLUMNS, 'float32')}
+TOTALS_DTYPES = {'date': 'datetime64[s]', **dict.fromkeys(MACRO_COLUMNS, 'float32'), 'items': 'int32'}
+RECIPE_DTYPES = dict.fromkeys(MACRO_COLUMNS, 'float32')
+
+def calculate_totals(df):
+    if df.empty:
+        return {'calories': 0, 'protein': 0, 'fat': 0, 'carbs': 0, 'fiber': 0}
+    return df[MACRO_COLUMNS].sum().to_dict()
+
+def sum_by_date(logs: pd.DataFrame) -> pd.DataFrame:
+    # One row per date with the macro sums and item count (local equivalent of daily_log_totals)
+    if logs.empty:
+        return pd.DataFrame(columns=['date'] + MACRO_COLUMNS + ['items'])
+    grouped = logs.groupby('date')
+    totals = grouped[MACRO_COLUMNS].sum()
+    totals['items'] = grouped.size()
+    return totals.reset_index()
+
+def apply_schema(rows, columns: list, dtypes: dict) -> pd.DataFrame:
+    """
+    Builds a frame with exactly `columns` (records or a DataFrame), cast to `dtypes`.
+    Dates arrive as 'YYYY-MM-DD' strings. Empty results keep their columns and types.
+    """
+    df = pd.DataFrame(rows, columns=columns)
+    for col in columns:
+        dtype = dtypes.get(col)
+        if dtype is None:
+            continue
+        if dtype.startswith('datetime64'):
+            df[col] = pd.to_datetime(df[col], format='%Y-%m-%d').astype(dtype)
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+def add_daily_deltas(totals: pd.DataFrame, deltas: pd.DataFrame) -> pd.DataFrame:
+    # Adds +/- per-day deltas (same columns) to daily totals, dropping days left with no items
+    if deltas.empty:
+        return totals
+    combined = pd.concat([totals, deltas], ignore_index=True)
+    summed = combined.groupby('date', as_index=False)[MACRO_COLUMNS + ['items']].sum()
+    return summed[summed['items'] > 0].astype(totals.dtypes.to_dict()).reset_index(drop=True)
+
+def food_stats(logs: pd.DataFrame) -> pd.DataFrame:
+    # Local equivalent of the food_stats view (sql/food_stats.sql) for a frame of log rows
+    if logs.empty:
+        return pd.DataFrame(columns=FOOD_STATS_COLUMNS)
+    stats = logs.rename(columns={'date': 'last_date'}).assign(uses=1)
+    return combine_food_stats([stats.sort_values(['last_date', 'id'], kind='stable')])
+
+def combine_food_stats(frames: list) -> pd.DataFrame:
+    """
+    Merges food stats frames, oldest first: uses add up, and the most recent row's
+    macros and date win (later frames win ties).
+    """
+    combined = pd.concat(frames, ignore_index=True).sort_values('last_date', kind='stable')
+    grouped = combined.groupby('food_name', sort=False, observed=True)
+    stats = grouped[MACRO_COLUMNS + ['last_date']].last()
+    stats['uses'] = grouped['uses'].sum()
+    return stats.reset_index()[FOOD_STATS_COLUMNS]
+
+def totals_frame(rows) -> pd.DataFrame:
+    # Normalise daily totals rows (records or a DataFrame) to typed columns
+    df = pd.DataFrame(rows, columns=['date'] + MACRO_COLUMNS + ['items'])
+    df[MACRO_COLUMNS] = df[MACRO_COLUMNS].astype(float)
+    df['items'] = df['items'].astype(int)
+    return df
+
+def kcal_split(daily_summary: pd.DataFrame) -> pd.DataFrame:
+    """
+    Splits each day's calories into protein/fat/carbs kcal in proportion to their 4/9/4
+    energy estimate, so the stacked areas add up to the logged calories.
+    Returns a frame with protein_kcal, fat_kcal and carbs_kcal columns.
+    """
+    # Calculate proportional heights of macros to match total calories
+    est_k = daily_summary['protein']*4 + daily_summary['fat']*9 + daily_summary['carbs']*4
+    # Avoid division by zero
+    est_k = est_k.replace(0, 1)
+
+    return pd.DataFrame({
+        # Ensure zero handling
+        'protein_kcal': (daily_summary['calories'] * (daily_summary['protein']*4 / est_k)).fillna(0),
+        'fat_kcal': (daily_summary['calories'] * (daily_summary['fat']*9 / est_k)).fillna(0),
+        'carbs_kcal': (daily_summary['calories'] * (daily_summary['carbs']*4 / est_k)).fillna(0),
+    })
+
+def monday_dates(daily_summary: pd.DataFrame) -> list:
+    # 'YYYY-MM-DD' strings for every Monday in the summary, for the weekly marker lines.
+    # Dates from the database are already datetime64, so to_datetime is a no-op there.
+    daily_dt = pd.to_datetime(daily_summary['date'])
+    return daily_dt[daily_dt.dt.dayofweek == 0].dt.strftime('%Y-%m-%d').tolist()
+
+def zoom_range(daily_summary: pd.DataFrame, view_days: int) -> list:
+    # The last view_days days of the summary as an x-axis range
+    latest_date = pd.to_datetime(daily_summary['date'].max())
+    start_date = latest_date - pd.Timedelta(days=view_days - 1)
+    return [start_date.strftime('%Y-%m-%d'), latest_date.strftime('%Y-%m-%d')]
+
+# Most points a Dashboard trace plots, however much history it covers
+MAX_SERIES_POINTS = 500
+
+def period_starts(dates, period: str) -> np.ndarray:
+    # The Monday (weeks run Monday to Sunday, like the Dashboard's markers) or first of the
+    # month on or before each date, as datetime64[s]; numpy is far cheaper than to_period
+    days = np.asarray(dates, dtype='datetime64[D]')
+    if period == 'weekly':
+        # 1970-01-01 was a Thursday, three days after a Monday
+        starts = days - (days.view('int64') + 3) % 7
+    else:
+        starts = days.astype('datetime64[M]')
+    return starts.astype('datetime64[s]')
+
+def bucket_means(series: pd.DataFrame, period: str) -> pd.DataFrame:
+    # Each week's or month's average per logged day of every column, dated at its start.
+    # Rows are ordered by date, so each bucket is one contiguous block.
+    starts = period_starts(series['date'], period)
+    columns = [col for col in series.columns if col != 'date']
+    if len(starts) == 0:
+        return pd.DataFrame(columns=['date'] + columns)
+    firsts = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    counts = np.diff(np.r_[firsts, len(starts)])
+    means = np.add.reduceat(series[columns].to_numpy('float64'), firsts, axis=0) / counts[:, None]
+    return pd.DataFrame({'date': starts[firsts], **dict(zip(columns, means.T))})
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Positions of the n_out (>= 2) points Largest-Triangle-Three-Buckets keeps from (x, y):
+    the first and last, plus from each bucket in between the point making the largest
+    triangle with the previous pick and the next bucket's average, so peaks survive.
+    """
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        # No room for buckets between the ends
+        return np.array([0, n - 1])
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    picks = np.empty(n_out, dtype=int)
+    picks[0], picks[-1] = 0, n - 1
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = (hi, edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        a = picks[i]
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        picks[i + 1] = lo + int(area.argmax())
+    return picks
+
+def downsample_series(series: pd.DataFrame, view_days: int, max_points: int = MAX_SERIES_POINTS) -> pd.DataFrame:
+    """
+    A date-ordered daily series cut down to about max_points rows for plotting. The last
+    view_days days stay exact; older days become weekly or else monthly averages, whichever
+    is the finest that fits, and LTTB on calories thins even the months if need be.
+    """
+    if len(series) <= max_points:
+        return series
+    # Dates from the database are already datetime64, so to_datetime is a no-op there
+    series = series.assign(date=pd.to_datetime(series['date']))
+    cutoff = series['date'].max() - pd.Timedelta(days=view_days - 1)
+    recent = series[series['date'] >= cutoff]
+    budget = max(max_points - len(recent), 2)
+    for period in ('weekly', 'monthly'):
+        older = bucket_means(series[series['date'] < cutoff], period)
+        if len(older) <= budget:
+            break
+    else:
+        keep = lttb_indices(older['date'].to_numpy().view('int64'), older['calories'].to_numpy(), budget)
+        older = older.iloc[keep]
+    return pd.concat([older, recent], ignore_index=True)
+
+def format_history_day(group_df: pd.DataFrame) -> pd.DataFrame:
+    # Prepare dataframe for display
+    display_df = group_df.copy()
+
+    # Format numbers before displaying
+    display_df['calories'] = display_df['calories'].round().astype(int)
+    display_df['protein'] = display_df['protein'].round(1)
+    display_df['fat'] = display_df['fat'].round(1)
+    display_df['carbs'] = display_df['carbs'].round(1)
+    display_df['fiber'] = display_df['fiber'].round(1)
+
+    # Move the Select to far right, don't include Delete
+    display_df.insert(len(display_df.columns), HISTORY_SELECT_COLUMN, False)
+    return display_df
+
+def history_days(history_logs: pd.DataFrame, first_color: int = 0):
+    """
+    Yields (log_date, display_df, row_color) for each day, most recent first.
+    Days cycle through HISTORY_ROW_COLORS so neighbouring days are easy to tell apart,
+    starting at first_color so consecutive pages carry on the cycle.
+    """
+    # Sort history to be most recent first
+    history_logs = history_logs.sort_values(by='date', ascending=False)
+
+    # Group by date to keep days together
+    grouped = history_logs.groupby('date', sort=False)
+    for color_idx, (log_date, group_df) in enumerate(grouped, start=first_color):
+        yield log_date, format_history_day(group_df), HISTORY_ROW_COLORS[color_idx % len(HISTORY_ROW_COLORS)]
+
+def week_ranges(end: date, weeks: int) -> list:
+    # (start, end) pairs for the last `weeks` 7-day windows ending on `end`, most recent first
+    return [(end - timedelta(days=7 * i + 6), end - timedelta(days=7 * i)) for i in range(weeks)]
+
+# Decoded ingredient tables by (recipe name, hash of its JSON), most recently used last
+INGREDIENTS_CACHE_SIZE = 256
+_ingredients = OrderedDict()
+_ingredients_lock = threading.Lock()
+
+def ingredients_frame(name: str, ingredients_json: str) -> pd.DataFrame:
+    """
+    A recipe's ingredients_json as a DataFrame. Decoding is memoized by name and content
+    hash, so reopening a recipe is free and re-saving it with new ingredients decodes again.
+    """
+    key = (name, hashlib.sha1(ingredients_json.encode()).hexdigest())
+    with _ingredients_lock:
+        if key in _ingredients:
+            _ingredients.move_to_end(key)
+            return _ingredients[key].copy()
+
+    df = pd.read_json(io.StringIO(ingredients_json), orient='records')
+
+    with _ingredients_lock:
+        _ingredients[key] = df
+        while len(_ingredients) > INGREDIENTS_CACHE_SIZE:
+            _ingredients.popitem(last=False)
+    return df.copy()
@@ -0,0 +1,241 @@
+import itertools
+import logging
+import threading
+import time
+from datetime import date
+
+import pandas as pd
+import streamlit as st
+
+import database as db
+from transforms import LOG_DTYPES, MACRO_COLUMNS, TOTALS_COLUMNS, TOTALS_DTYPES, add_daily_deltas, apply_schema, sum_by_date
+
+log = logging.getLogger(__name__)
+
+# Writes wait this long for company before the worker sends them, so a burst of saves or
+# deletes goes out as one request each
+COALESCE_SECONDS = 0.05
+
+class PendingWrite:
+    def __init__(self, kind: str, session_id, user_id: str, rows: pd.DataFrame = None, name: str = None,
+                 record: dict = None):
+        self.kind = kind              # 'save_logs', 'delete_logs' or 'save_recipe'
+        self.session_id = session_id  # who to tell if it fails
+        self.user_id = user_id        # whose rows these are; the worker thread has no session to ask
+        self.rows = rows              # log rows being saved or deleted
+        self.name = name
+        self.record = record
+
+class WriteQueue:
+    """
+    Commits log and recipe writes on a background thread so the UI never waits on the network.
+
+    Queued writes are visible straight away through the overlay_* methods, which reads pass
+    their cached frames through: pending saves appear (with temporary negative ids), pending
+    deletes disappear and daily totals include both. Writes that arrive together are sent as
+    one insert and one delete per user. The backend already retries what is safe to resend
+    (see resilience.call_with_retries), so the queue sends each request once; if it fails
+    the write is dropped from the overlay and the sessions that made it are told via
+    failures().
+    """
+
+    def __init__(self, coalesce_seconds: float = COALESCE_SECONDS):
+        self.coalesce_seconds = coalesce_seconds
+        self._cond = threading.Condition()
+        self._queued = []    # waiting for the worker
+        self._inflight = []  # being committed, still shown in the overlay
+        self._failures = {}  # session_id -> [message]
+        self._temp_ids = itertools.count(-1, -1)
+        self._worker = None
+
+    # --- Enqueueing ---
+    def save_logs(self, df: pd.DataFrame, log_date: date, session_id=None, user_id: str = None):
+        if df.empty:
+            return
+        rows = df.copy()
+        rows['date'] = log_date.strftime('%Y-%m-%d')
+        user_id = user_id or db.current_user()
+        with self._cond:
+            rows['id'] = [next(self._temp_ids) for _ in range(len(rows))]
+            self._submit(PendingWrite('save_logs', session_id, user_id, rows=rows))
+
+    def delete_logs(self, rows: pd.DataFrame, session_id=None, user_id: str = None):
+        """Deletes the given log rows (id, date and macros, as shown to the user)."""
+        if rows.empty:
+            return
+        user_id = user_id or db.current_user()
+        rows = rows.copy()
+        rows['date'] = pd.to_datetime(rows['date']).dt.strftime('%Y-%m-%d')
+        temp_ids = set(rows.loc[rows['id'] < 0, 'id'])
+        with self._cond:
+            # Rows that haven't been sent yet are simply dropped from their pending save
+            for write in self._queued:
+                if write.kind == 'save_logs' and write.user_id == user_id and temp_ids:
+                    cancelled = write.rows['id'].isin(temp_ids)
+                    temp_ids -= set(write.rows.loc[cancelled, 'id'])
+                    write.rows = write.rows[~cancelled]
+            self._queued = [w for w in self._queued if w.kind != 'save_logs' or not w.rows.empty]
+            if temp_ids:
+                self._fail([session_id], "Some items are still being saved; delete them again in a moment.")
+            rows = rows[rows['id'] >= 0]
+            if not rows.empty:
+                self._submit(PendingWrite('delete_logs', session_id, user_id, rows=rows))
+
+    def save_recipe(self, name: str, df: pd.DataFrame, session_id=None, user_id: str = None):
+        if df.empty:
+            return
+        user_id = user_id or db.current_user()
+        with self._cond:
+            self._submit(PendingWrite('save_recipe', session_id, user_id, name=name, record=db.recipe_record(name, df)))
+
+    def _submit(self, write: PendingWrite):
+        # Called with self._cond held
+        self._queued.append(write)
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="write-queue", daemon=True)
+            self._worker.start()
+        self._cond.notify_all()
+
+    # --- Status ---
+    def pending(self, session_id) -> bool:
+        with self._cond:
+            return any(w.session_id == session_id for w in self._queued + self._inflight)
+
+    def failures(self, session_id) -> list:
+        # Failure messages for this session, each returned once
+        with self._cond:
+            return self._failures.pop(session_id, [])
+
+    def flush(self, timeout: float = None) -> bool:
+        # Waits until everything queued so far has been committed (or given up on)
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queued and not self._inflight, timeout)
+
+    def _fail(self, session_ids, message: str):
+        # Called with self._cond held
+        for session_id in set(session_ids):
+            self._failures.setdefault(session_id, []).append(message)
+
+    # --- Overlay ---
+    # Each session only sees its own user's pending writes
+    def _pending_rows(self, kind: str, user_id: str) -> pd.DataFrame:
+        with self._cond:
+            frames = [w.rows for w in self._queued + self._inflight if w.kind == kind and w.user_id == user_id]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    @staticmethod
+    def _in_range(rows: pd.DataFrame, start: str = None, end: str = None) -> pd.DataFrame:
+        if rows.empty:
+            return rows
+        keep = pd.Series(True, index=rows.index)
+        if start is not None:
+            keep &= rows['date'] >= start
+        if end is not None:
+            keep &= rows['date'] <= end
+        return rows[keep]
+
+    def overlay_logs(self, logs: pd.DataFrame, start: date = None, end: date = None, user_id: str = None) -> pd.DataFrame:
+        """Logs (in the compact schema) as they'll be once pending writes dated start..end land."""
+        user_id = user_id or db.current_user()
+        start_str = start.strftime('%Y-%m-%d') if start else None
+        end_str = end.strftime('%Y-%m-%d') if end else None
+        saved = self._in_range(self._pending_rows('save_logs', user_id), start_str, end_str)
+        deleted = self._pending_rows('delete_logs', user_id)
+        if saved.empty and deleted.empty:
+            return logs
+
+        if not deleted.empty:
+            logs = logs[~logs['id'].isin(deleted['id'])]
+        if not saved.empty:
+            columns = list(logs.columns)
+            saved = apply_schema(saved, columns, LOG_DTYPES)
+            logs = pd.concat([logs, saved], ignore_index=True)
+            logs = logs.astype({col: LOG_DTYPES[col] for col in columns if col in LOG_DTYPES})
+        return logs.reset_index(drop=True)
+
+    def overlay_daily_totals(self, totals: pd.DataFrame, start: date = None, user_id: str = None) -> pd.DataFrame:
+        """Daily totals (in the compact schema) with pending saves added and pending deletes subtracted."""
+        user_id = user_id or db.current_user()
+        start_str = start.strftime('%Y-%m-%d') if start else None
+        saved = self._in_range(self._pending_rows('save_logs', user_id), start_str)
+        deleted = self._in_range(self._pending_rows('delete_logs', user_id), start_str)
+        if saved.empty and deleted.empty:
+            return totals
+
+        # Deleted rows count negatively, in their macros and in the item count
+        signed = pd.concat([saved.assign(_sign=1), deleted.assign(_sign=-1)], ignore_index=True)
+        signed[MACRO_COLUMNS] = signed[MACRO_COLUMNS].mul(signed['_sign'], axis=0)
+        deltas = sum_by_date(signed)
+        deltas['items'] = signed.groupby('date')['_sign'].sum().to_numpy()
+        return add_daily_deltas(totals, apply_schema(deltas, TOTALS_COLUMNS, TOTALS_DTYPES))
+
+    def overlay_recipes(self, recipes: pd.DataFrame, name: str = None, user_id: str = None) -> pd.DataFrame:
+        # Pending recipe saves replace or add to `recipes`; pass a name to apply just that one
+        user_id = user_id or db.current_user()
+        with self._cond:
+            records = {w.name: w.record for w in self._queued + self._inflight
+                       if w.kind == 'save_recipe' and w.user_id == user_id and name in (None, w.name)}
+        if not records:
+            return recipes
+        pending = pd.DataFrame(list(records.values()), columns=recipes.columns)
+        kept = recipes[~recipes['name'].isin(records)]
+        return pd.concat([kept, pending], ignore_index=True).astype(recipes.dtypes.to_dict())
+
+    # --- Worker ---
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queued)
+            # Let a burst of writes pile up before sending
+            time.sleep(self.coalesce_seconds)
+            with self._cond:
+                batch, self._queued = self._queued, []
+                self._inflight = batch
+            try:
+                self._commit(batch)
+            finally:
+                with self._cond:
+                    self._inflight = []
+                    self._cond.notify_all()
+
+    def _commit(self, batch: list):
+        by_user = {}
+        for write in batch:
+            by_user.setdefault(write.user_id, []).append(write)
+        for user_id, writes in by_user.items():
+            self._commit_user(user_id, writes)
+
+    def _commit_user(self, user_id: str, batch: list):
+        saves = [w for w in batch if w.kind == 'save_logs']
+        if saves:
+            rows = pd.concat([w.rows for w in saves], ignore_index=True).drop(columns='id')
+            self._send(saves, "save your log", db.save_log_rows, rows, user_id)
+
+        deletes = [w for w in batch if w.kind == 'delete_logs']
+        if deletes:
+            ids = [int(i) for w in deletes for i in w.rows['id']]
+            self._send(deletes, "delete those items", db.delete_logs, ids, user_id)
+
+        # Only the last save of each recipe matters
+        recipes = {}
+        for write in batch:
+            if write.kind == 'save_recipe':
+                recipes.setdefault(write.name, []).append(write)
+        for name, writes in recipes.items():
+            record = writes[-1].record
+            self._send(writes, f"save recipe '{name}'", db.save_recipe_record, record, user_id)
+
+    def _send(self, writes: list, description: str, fn, *args):
+        try:
+            fn(*args)
+            return True
+        except Exception as e:
+            log.warning("Couldn't %s: %s", description, e)
+            with self._cond:
+                self._fail([w.session_id for w in writes], f"Couldn't {description}: {e}")
+            return False
+
+@st.cache_resource
+def get_write_queue() -> WriteQueue:
+    # One queue per server process, shared by every session
+    return WriteQueue()